@@ -156,10 +156,16 @@ CELERY_RESULT_BACKEND_MAX_RETRIES = 10
 CELERY_TASK_RESULT_EXPIRES = 3600
 
 CELERY_BEAT_SCHEDULE = {
+    # 前日分の日次・時間別集計（受信時の逐次更新の結果を全メーター分再集計して確定）
     'aggregate-daily-readings': {
         'task': 'app.readings.tasks.aggregate_daily',
         'schedule': crontab(hour=1, minute=0),
     },
+    # 再集計待ち（is_dirty）の日次集計は5分ごとに処理
+    'aggregate-dirty-daily-readings': {
+        'task': 'app.readings.tasks.aggregate_dirty_daily',
+        'schedule': crontab(minute='*/5'),
+    },
     'aggregate-monthly-readings': {
         'task': 'app.readings.tasks.aggregate_monthly',
         'schedule': crontab(day_of_month=1, hour=2, minute=0),
@@ -173,10 +179,10 @@ CELERY_BEAT_SCHEDULE = {
         'task': 'app.billing.tasks.generate_billing_summary',
         'schedule': crontab(hour=6, minute=0),
     },
-    # processingタイムアウト処理（毎時0分に実行）
-    'reset-stale-processing': {
-        'task': 'app.billing.tasks.reset_stale_processing',
-        'schedule': crontab(minute=0),
+    # 月次パーティションのローテーション（毎月25日AM3:00に実行）
+    'rotate-reading-partitions': {
+        'task': 'app.readings.tasks.rotate_partitions',
+        'schedule': crontab(day_of_month=25, hour=3, minute=0),
     },
 }
 LOGGING = {
@@ -214,4 +220,72 @@ ANYMORE_API_KEY = config('ANYMORE_API_KEY', default='')
 # AWS IoT Core
 AWS_IOT_ENDPOINT = config('AWS_IOT_ENDPOINT', default='a3euups5uuz661-ats.iot.ap-northeast-1.amazonaws.com')
 AWS_IOT_REGION = config('AWS_IOT_REGION', default='ap-northeast-1')
-LAMBDA_API_KEY = config('LAMBDA_API_KEY', default='')
\ No newline at end of file
+LAMBDA_API_KEY = config('LAMBDA_API_KEY', default='')
+
+# メーターデータ一括受信（1リクエストあたりの最大件数）
+RECEIVE_BATCH_MAX_ITEMS = config('RECEIVE_BATCH_MAX_ITEMS', default=1000, cast=int)
+
+# 受信ハートビート（last_received_at更新）の書き込み間隔（秒）
+METER_HEARTBEAT_INTERVAL = config('METER_HEARTBEAT_INTERVAL', default=60, cast=int)
+
+# メーター暗号鍵キャッシュ
+# 共有キャッシュを使う場合は METER_KEY_CACHE_SHARED_ALIAS に CACHES のエイリアスを指定
+METER_KEY_CACHE_MAX_SIZE = config('METER_KEY_CACHE_MAX_SIZE', default=10000, cast=int)
+METER_KEY_CACHE_TTL = config('METER_KEY_CACHE_TTL', default=300, cast=int)
+METER_KEY_CACHE_SHARED_ALIAS = config('METER_KEY_CACHE_SHARED_ALIAS', default=None)
+
+# MQTT C2S直接受信（run_mqtt_ingest）
+MQTT_INGEST_HOST = config('MQTT_INGEST_HOST', default='')
+MQTT_INGEST_PORT = config('MQTT_INGEST_PORT', default=8883, cast=int)
+MQTT_INGEST_TOPIC = config('MQTT_INGEST_TOPIC', default='+')
+MQTT_INGEST_GROUP = config('MQTT_INGEST_GROUP', default='anymore-meter-ingest')
+MQTT_INGEST_BATCH_SIZE = config('MQTT_INGEST_BATCH_SIZE', default=500, cast=int)
+MQTT_INGEST_BATCH_WAIT_MS = config('MQTT_INGEST_BATCH_WAIT_MS', default=200, cast=int)
+MQTT_INGEST_USERNAME = config('MQTT_INGEST_USERNAME', default='')
+MQTT_INGEST_PASSWORD = config('MQTT_INGEST_PASSWORD', default='')
+MQTT_INGEST_CA_CERTS = config('MQTT_INGEST_CA_CERTS', default='')
+MQTT_INGEST_CERTFILE = config('MQTT_INGEST_CERTFILE', default='')
+MQTT_INGEST_KEYFILE = config('MQTT_INGEST_KEYFILE', default='')
+
+# 非同期受付モード（受信APIはキューに追加して202を返し、run_receive_worker が保存する）
+RECEIVE_ASYNC_MODE = config('RECEIVE_ASYNC_MODE', default=False, cast=bool)
+RECEIVE_QUEUE_URL = config('RECEIVE_QUEUE_URL', default='')  # 空の場合は CELERY_BROKER_URL
+RECEIVE_QUEUE_STREAM = config('RECEIVE_QUEUE_STREAM', default='meter:receive')
+RECEIVE_QUEUE_BATCH_SIZE = config('RECEIVE_QUEUE_BATCH_SIZE', default=500, cast=int)
+# 配信回数がこの回数を超えたメッセージは1件ずつ保存し、失敗分をデッドレターストリームに移す
+RECEIVE_QUEUE_MAX_DELIVERIES = config('RECEIVE_QUEUE_MAX_DELIVERIES', default=5, cast=int)
+RECEIVE_QUEUE_DEAD_LETTER_STREAM = config('RECEIVE_QUEUE_DEAD_LETTER_STREAM', default='meter:receive:dead')
+
+# 受信電文の保存形式（binary: raw_payload にバイナリ保存, hex: raw_data にHEX文字列で保存）
+RAW_DATA_STORAGE = config('RAW_DATA_STORAGE', default='binary')
+RAW_DATA_COMPRESSION = config('RAW_DATA_COMPRESSION', default='none')  # none / zlib / zstd
+
+# 重複パケット抑止（QoS1の再送分をDB保存前に除外）
+RECEIVE_DEDUP_ENABLED = config('RECEIVE_DEDUP_ENABLED', default=True, cast=bool)
+RECEIVE_DEDUP_TTL = config('RECEIVE_DEDUP_TTL', default=600, cast=int)
+RECEIVE_DEDUP_MAX_SIZE = config('RECEIVE_DEDUP_MAX_SIZE', default=100000, cast=int)
+RECEIVE_DEDUP_SHARED_ALIAS = config('RECEIVE_DEDUP_SHARED_ALIAS', default=None)
+
+# 受信処理のステージ別計測（/api/meters/receive/metrics/ で参照）
+RECEIVE_TIMING_ENABLED = config('RECEIVE_TIMING_ENABLED', default=False, cast=bool)
+RECEIVE_TIMING_HEADER = config('RECEIVE_TIMING_HEADER', default=False, cast=bool)  # Server-Timing ヘッダーを付与
+
+# meter_readings / meter_events の月次パーティション（MySQLのみ、manage_partitions --setup で有効化）
+READINGS_PARTITION_MONTHS_AHEAD = config('READINGS_PARTITION_MONTHS_AHEAD', default=3, cast=int)
+READINGS_RETENTION_MONTHS = config('READINGS_RETENTION_MONTHS', default=0, cast=int)  # 0: 無期限
+READINGS_RETENTION_MODE = config('READINGS_RETENTION_MODE', default='archive')  # archive / drop
+
+# 日次集計の再集計待ち（is_dirty）を1回に処理する (meter, date) の上限
+DAILY_SUMMARY_DIRTY_LIMIT = config('DAILY_SUMMARY_DIRTY_LIMIT', default=5000, cast=int)
+
+# 日次/月次集計を並列実行する際の1チャンクあたりのメーター数
+AGGREGATION_CHUNK_SIZE = config('AGGREGATION_CHUNK_SIZE', default=1000, cast=int)
+
+# 請求集計を並列実行する際の1チャンクあたりのメーター数
+BILLING_CHUNK_SIZE = config('BILLING_CHUNK_SIZE', default=1000, cast=int)
+
+# Anymore連携の取得期限（秒）。期限までに mark-processed されなかった行は再度取得対象になる
+BILLING_FETCH_LEASE_SECONDS = config('BILLING_FETCH_LEASE_SECONDS', default=3600, cast=int)
+
+# mark-processed で claim_token を省略した旧クライアントを受け付ける（移行期間のみ。processing の行だけ更新する）
+BILLING_ACK_WITHOUT_TOKEN = config('BILLING_ACK_WITHOUT_TOKEN', default=False, cast=bool)
@@ -31,7 +31,9 @@ class BillingSummaryAdmin(admin.ModelAdmin):
             fetch_status='pending',
             fetch_started_at=None,
             fetch_completed_at=None,
-            fetch_error_message=''
+            fetch_error_message='',
+            fetch_claim_token='',
+            fetch_lease_expires_at=None
         )
         self.message_user(request, f'{count}件をpendingに戻しました')
     
@@ -41,6 +43,8 @@ class BillingSummaryAdmin(admin.ModelAdmin):
             fetch_status='pending',
             fetch_started_at=None,
             fetch_completed_at=None,
-            fetch_error_message=''
+            fetch_error_message='',
+            fetch_claim_token='',
+            fetch_lease_expires_at=None
         )
         self.message_user(request, f'{count}件をpendingに戻しました')
\ No newline at end of file
@@ -0,0 +1,162 @@
+"""
+Anymore連携の取得キュー
+
+未処理（pending）の BillingSummary を取得トークン付きで processing にする（claim）。
+- SELECT ... FOR UPDATE SKIP LOCKED（対応DBのみ）で他の取得処理がロック中の行を飛ばす
+- 更新条件に取得可能であることを含めるため、SKIP LOCKED 非対応のDBでも同じ行が二重に取得されない
+ので、複数のクライアントが並行して取得しても重複しない。
+
+取得した行には期限（fetch_lease_expires_at = 取得時刻 + BILLING_FETCH_LEASE_SECONDS）を設定し、
+期限までに mark-processed されなかった行は次回の取得で再度取得対象になる。
+処理結果（acknowledge）は取得トークンが一致する行のみ反映する。
+"""
+from datetime import timedelta
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Case, Q, TextField, Value, When
+from django.utils import timezone
+import uuid
+
+from app.billing.models import BillingSummary
+
+# mark-processed で1回の UPDATE に含める件数
+ACK_CHUNK_SIZE = 1000
+
+
+def get_lease_duration() -> timedelta:
+    return timedelta(seconds=getattr(settings, 'BILLING_FETCH_LEASE_SECONDS', 3600))
+
+
+def expired_q(now) -> Q:
+    """取得期限切れの processing（期限未設定の行は取得開始日時で判定）"""
+    return Q(fetch_status='processing') & (
+        Q(fetch_lease_expires_at__lt=now)
+        | Q(fetch_lease_expires_at__isnull=True, fetch_started_at__lt=now - get_lease_duration())
+    )
+
+
+def claimable_q(now) -> Q:
+    """取得可能な行（pending または取得期限切れ）"""
+    return Q(fetch_status='pending') | expired_q(now)
+
+
+def claim_summaries(queryset, limit=None, force=False):
+    """
+    queryset（並び順を指定済み）のうち取得可能な行を最大 limit 件 processing にする
+
+    force=True の場合は状態によらず queryset の全行を取得し直す（再取得用）。
+
+    Returns:
+        (取得トークン, 取得期限, 取得したBillingSummaryのリスト)
+    """
+    now = timezone.now()
+    token = uuid.uuid4().hex
+    expires_at = now + get_lease_duration()
+
+    with transaction.atomic():
+        if force:
+            candidates = queryset
+            if connection.features.has_select_for_update:
+                candidates = candidates.select_for_update()
+        else:
+            candidates = queryset.filter(claimable_q(now))
+            if connection.features.has_select_for_update_skip_locked:
+                candidates = candidates.select_for_update(skip_locked=True)
+        ids = candidates.values_list('id', flat=True)
+        if limit is not None:
+            ids = ids[:limit]
+        ids = list(ids)
+
+        if ids:
+            claimed = BillingSummary.objects.filter(id__in=ids)
+            if not force:
+                claimed = claimed.filter(claimable_q(now))
+            claimed.update(
+                fetch_status='processing',
+                fetch_started_at=now,
+                fetch_claim_token=token,
+                fetch_lease_expires_at=expires_at,
+            )
+
+    summaries = list(
+        queryset.filter(id__in=ids, fetch_claim_token=token).select_related('meter')
+    ) if ids else []
+    return token, expires_at, summaries
+
+
+def release_expired() -> int:
+    """取得期限切れの processing を pending に戻す（取得時に期限切れも対象になるため、表示を揃える場合のみ）"""
+    return BillingSummary.objects.filter(expired_q(timezone.now())).update(
+        fetch_status='pending',
+        fetch_started_at=None,
+        fetch_claim_token='',
+        fetch_lease_expires_at=None,
+    )
+
+
+def acknowledge(token, completed_ids, errors, chunk_size=ACK_CHUNK_SIZE) -> dict:
+    """
+    取得した行の処理結果を反映
+
+    completed_ids: 完了したID
+    errors: {ID: エラーメッセージ}（completed_ids と重複する場合はエラーを優先）
+
+    取得トークンが一致する行のみ更新する（token が空の場合は processing の行、移行期間中の旧クライアント用）。
+    他のクライアントが取得し直した行や存在しない行は更新しない。
+    更新は chunk_size 件ごとに完了・エラーそれぞれ1回の UPDATE で行う。
+
+    Returns:
+        {ID: 'completed' / 'error' / 'not_claimed' / 'not_found'}
+    """
+    ids = list(dict.fromkeys(list(completed_ids) + list(errors)))
+    outcomes = {}
+    now = timezone.now()
+
+    with transaction.atomic():
+        for i in range(0, len(ids), chunk_size):
+            chunk = ids[i:i + chunk_size]
+            rows = BillingSummary.objects.filter(id__in=chunk)
+            if connection.features.has_select_for_update:
+                rows = rows.select_for_update()
+            current = {
+                row_id: (fetch_status, claim_token)
+                for row_id, fetch_status, claim_token in rows.values_list('id', 'fetch_status', 'fetch_claim_token')
+            }
+
+            accepted_completed = []
+            accepted_errors = []
+            for row_id in chunk:
+                if row_id not in current:
+                    outcomes[row_id] = 'not_found'
+                    continue
+                fetch_status, claim_token = current[row_id]
+                claimed = claim_token == token if token else fetch_status == 'processing'
+                if not claimed:
+                    outcomes[row_id] = 'not_claimed'
+                elif row_id in errors:
+                    accepted_errors.append(row_id)
+                    outcomes[row_id] = 'error'
+                else:
+                    accepted_completed.append(row_id)
+                    outcomes[row_id] = 'completed'
+
+            if accepted_completed:
+                BillingSummary.objects.filter(id__in=accepted_completed).update(
+                    fetch_status='completed',
+                    fetch_completed_at=now,
+                    fetch_error_message='',
+                    fetch_lease_expires_at=None,
+                )
+            if accepted_errors:
+                BillingSummary.objects.filter(id__in=accepted_errors).update(
+                    fetch_status='error',
+                    fetch_completed_at=now,
+                    fetch_error_message=Case(
+                        *[When(id=row_id, then=Value(errors[row_id])) for row_id in accepted_errors],
+                        default=Value(''),
+                        output_field=TextField(),
+                    ),
+                    fetch_lease_expires_at=None,
+                )
+
+    return outcomes
@@ -0,0 +1,120 @@
+from datetime import date, datetime
+from django.core.management.base import BaseCommand, CommandError
+import time
+
+from app.billing.models import BillingSummary
+from app.billing.recalculation import BillingRecalculation, apply_changes
+from app.billing.tasks import METER_CHUNK_SIZE
+
+# 差分として表示する項目
+DIFF_FIELDS = ['total_kwh', 'deemed_method', 'note']
+
+
+def parse_month(value) -> date:
+    return datetime.strptime(value, '%Y-%m').date()
+
+
+class Command(BaseCommand):
+    help = '作成済みの請求データを再計算して差分を表示する（--apply で更新）'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--month',
+            type=parse_month,
+            help='対象月（YYYY-MM、検針期間終了日がこの月の請求データ）',
+        )
+        parser.add_argument(
+            '--period-end',
+            type=date.fromisoformat,
+            help='検針期間終了日（YYYY-MM-DD）',
+        )
+        parser.add_argument(
+            '--zone',
+            type=int,
+            help='電力管轄',
+        )
+        parser.add_argument(
+            '--project',
+            type=int,
+            action='append',
+            default=[],
+            help='案件ID（複数指定可）',
+        )
+        parser.add_argument(
+            '--meter',
+            action='append',
+            default=[],
+            help='対象メーターID（複数指定可）',
+        )
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=METER_CHUNK_SIZE,
+            help=f'1回に再計算するメーター数（デフォルト: {METER_CHUNK_SIZE}）',
+        )
+        parser.add_argument(
+            '--apply',
+            action='store_true',
+            help='再計算結果で請求データを更新する（指定しない場合は差分の表示のみ）',
+        )
+        parser.add_argument(
+            '--reset-fetch-status',
+            action='store_true',
+            help='更新した請求データの取得ステータスを pending に戻す（--apply 指定時のみ）',
+        )
+
+    def handle(self, *args, **options):
+        if not options['month'] and not options['period_end']:
+            raise CommandError('--month または --period-end を指定してください')
+
+        queryset = self.get_queryset(options)
+        recalculation = BillingRecalculation(queryset, options['chunk_size'])
+
+        started = time.monotonic()
+        changed = []
+        for summary, changes in recalculation.run():
+            changed.append(summary)
+            if options['verbosity'] >= 1:
+                self.stdout.write(self.format_diff(summary, changes))
+
+        elapsed = time.monotonic() - started
+        self.stdout.write(
+            f'再計算: {recalculation.checked}件, 変更あり: {recalculation.changed}件, '
+            f'エラー: {recalculation.errors}件（{elapsed:.1f}秒）'
+        )
+
+        if not options['apply']:
+            if changed:
+                self.stdout.write(self.style.WARNING('更新していません（反映する場合は --apply）'))
+            return
+
+        count = apply_changes(changed, reset_fetch_status=options['reset_fetch_status'])
+        self.stdout.write(self.style.SUCCESS(f'更新: {count}件'))
+
+    def get_queryset(self, options):
+        queryset = BillingSummary.objects.all()
+        if options['month']:
+            month = options['month']
+            next_month = month.replace(year=month.year + 1, month=1) if month.month == 12 else month.replace(month=month.month + 1)
+            queryset = queryset.filter(period_end__gte=month, period_end__lt=next_month)
+        if options['period_end']:
+            queryset = queryset.filter(period_end=options['period_end'])
+        if options['zone'] is not None:
+            queryset = queryset.filter(zone=options['zone'])
+        if options['project']:
+            queryset = queryset.filter(project_id__in=options['project'])
+        if options['meter']:
+            queryset = queryset.filter(meter__meter_id__in=options['meter'])
+        return queryset
+
+    def format_diff(self, summary, changes) -> str:
+        """メーターID 期間 total_kwh 現在値→再計算値 ...（DIFF_FIELDS のうち変わる項目のみ）"""
+        parts = [f'{summary.meter.meter_id} {summary.period_start}〜{summary.period_end}']
+        for name in DIFF_FIELDS:
+            if name in changes:
+                old, new = changes[name]
+                parts.append(f'{name}: {old} → {new}')
+        others = [name for name in changes if name not in DIFF_FIELDS]
+        if others:
+            parts.append(f'(他: {", ".join(others)})')
+        return '  '.join(parts)
@@ -0,0 +1,67 @@
+# Generated by Django 4.2.14 on 2026-10-18 12:34
+
+from django.db import migrations, models
+from django.db.models import Count
+
+DELETE_CHUNK_SIZE = 5000
+
+# 重複行のうち残す行の優先順（Anymore が取得済みの行を残し、同じ期間が二重に請求されないようにする）
+KEEP_PRIORITY = {'completed': 0, 'processing': 1, 'error': 2, 'pending': 3}
+
+
+def delete_duplicate_summaries(apps, schema_editor):
+    """
+    (meter, period_start, period_end) が重複する行を1行残して削除
+
+    残す行は fetch_status が completed > processing > error > pending の順、同じ場合は id が大きい行。
+    削除した行は (meter_id, 期間, 削除したid → 残したid) を出力する。
+    """
+    BillingSummary = apps.get_model('billing', 'BillingSummary')
+
+    duplicates = (
+        BillingSummary.objects
+        .values('meter_id', 'period_start', 'period_end')
+        .annotate(row_count=Count('id'))
+        .filter(row_count__gt=1)
+    )
+
+    delete_ids = []
+    for group in duplicates:
+        rows = sorted(
+            BillingSummary.objects
+            .filter(
+                meter_id=group['meter_id'],
+                period_start=group['period_start'],
+                period_end=group['period_end'],
+            )
+            .values_list('id', 'fetch_status'),
+            key=lambda row: (KEEP_PRIORITY.get(row[1], len(KEEP_PRIORITY)), -row[0]),
+        )
+        (keep_id, keep_status), removed = rows[0], rows[1:]
+        delete_ids.extend(row_id for row_id, _ in removed)
+        print(
+            f"\n  billing_summary 重複削除: meter_id={group['meter_id']} "
+            f"{group['period_start']}〜{group['period_end']} "
+            f"削除={[f'{row_id}({fetch_status})' for row_id, fetch_status in removed]} "
+            f"残す={keep_id}({keep_status})"
+        )
+
+    for i in range(0, len(delete_ids), DELETE_CHUNK_SIZE):
+        BillingSummary.objects.filter(id__in=delete_ids[i:i + DELETE_CHUNK_SIZE]).delete()
+    if delete_ids:
+        print(f'\n  billing_summary 重複削除: {len(delete_ids)}件')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('billing', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.RunPython(delete_duplicate_summaries, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='billingsummary',
+            constraint=models.UniqueConstraint(fields=('meter', 'period_start', 'period_end'), name='uniq_billing_summary_meter_period'),
+        ),
+    ]
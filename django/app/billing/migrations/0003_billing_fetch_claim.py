@@ -0,0 +1,27 @@
+# Generated by Django 4.2.14 on 2026-10-18 12:37
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('billing', '0002_billing_summary_unique'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='billingsummary',
+            name='fetch_claim_token',
+            field=models.CharField(blank=True, default='', max_length=32, verbose_name='取得トークン'),
+        ),
+        migrations.AddField(
+            model_name='billingsummary',
+            name='fetch_lease_expires_at',
+            field=models.DateTimeField(blank=True, null=True, verbose_name='取得期限'),
+        ),
+        migrations.AddIndex(
+            model_name='billingsummary',
+            index=models.Index(fields=['fetch_status', 'period_end'], name='idx_billing_fetch_status'),
+        ),
+    ]
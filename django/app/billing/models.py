@@ -85,6 +85,8 @@ class BillingSummary(models.Model):
     fetch_started_at = models.DateTimeField(null=True, blank=True, verbose_name='取得開始日時')
     fetch_completed_at = models.DateTimeField(null=True, blank=True, verbose_name='取得完了日時')
     fetch_error_message = models.TextField(blank=True, default='', verbose_name='エラーメッセージ')
+    fetch_claim_token = models.CharField(max_length=32, blank=True, default='', verbose_name='取得トークン')
+    fetch_lease_expires_at = models.DateTimeField(null=True, blank=True, verbose_name='取得期限')
     
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
@@ -93,6 +95,12 @@ class BillingSummary(models.Model):
         verbose_name = '請求サマリ'
         verbose_name_plural = '請求サマリ'
         ordering = ['-period_end', 'meter_id']
+        constraints = [
+            models.UniqueConstraint(fields=['meter', 'period_start', 'period_end'], name='uniq_billing_summary_meter_period'),
+        ]
+        indexes = [
+            models.Index(fields=['fetch_status', 'period_end'], name='idx_billing_fetch_status'),
+        ]
     
     def __str__(self):
         return f"{self.meter_id} {self.period_start}〜{self.period_end}"
\ No newline at end of file
@@ -0,0 +1,154 @@
+"""
+作成済み請求データの再計算
+
+みなし値のルール変更や遅れて届いた検針データの反映用。
+BillingSummary を検針期間ごと・メーターID順のチャンクごとに
+generate_billing_summary と同じ処理（prefetch_billing_inputs / build_billing_summary）で再計算し、
+値が変わる行と変更内容を返す。保存は apply_changes でまとめて行う。
+
+    recalculation = BillingRecalculation(BillingSummary.objects.filter(period_end__month=9))
+    changed = [summary for summary, changes in recalculation.run()]
+    apply_changes(changed)
+
+同じメーターの連続する期間を一度に再計算する場合、後の期間は再計算後の前回請求データを引き継ぐ。
+"""
+from decimal import Decimal
+from django.db import models, transaction
+from django.utils import timezone
+import logging
+
+from app.billing.models import BillingSummary
+from app.billing.tasks import METER_CHUNK_SIZE, build_billing_summary, prefetch_billing_inputs
+from app.meters.chunks import id_ranges
+
+logger = logging.getLogger(__name__)
+
+# calculate_billing の結果として再計算する項目
+RECALCULATED_FIELDS = [
+    'prev_actual_value', 'curr_actual_value', 'mid_actual_value', 'mid_actual_date',
+    'prev_used_value', 'curr_used_value', 'actual_kwh', 'deemed_kwh', 'total_kwh',
+    'deemed_method', 'is_first_billing', 'note',
+]
+
+
+def normalize(name, value):
+    """保存時と同じ桁数に丸める（DecimalField のみ）"""
+    field = BillingSummary._meta.get_field(name)
+    if isinstance(field, models.DecimalField) and value is not None:
+        return Decimal(value).quantize(Decimal(1).scaleb(-field.decimal_places))
+    return value
+
+
+def diff_summary(summary, recalculated) -> dict:
+    """{項目名: (現在値, 再計算値)}（変わる項目のみ）"""
+    changes = {}
+    for name in RECALCULATED_FIELDS:
+        old = getattr(summary, name)
+        new = normalize(name, getattr(recalculated, name))
+        if old != new:
+            changes[name] = (old, new)
+    return changes
+
+
+class BillingRecalculation:
+    """請求データの再計算（書き込みは行わない）"""
+
+    def __init__(self, queryset, chunk_size=METER_CHUNK_SIZE):
+        self.queryset = queryset
+        self.chunk_size = chunk_size
+        self.checked = 0
+        self.changed = 0
+        self.errors = 0
+        # {(meter_id, period_end): 再計算後の請求データ}（値が変わったもののみ）
+        self.recalculated = {}
+
+    def periods(self) -> list:
+        """[(period_start, period_end)]（古い順）"""
+        return list(
+            self.queryset
+            .order_by('period_end', 'period_start')
+            .values_list('period_start', 'period_end')
+            .distinct()
+        )
+
+    def run(self):
+        """値が変わる請求データを (summary, changes) で返す。summary には再計算後の値を設定済み"""
+        for period_start, period_end in self.periods():
+            period = self.queryset.filter(period_start=period_start, period_end=period_end)
+            meter_ids = period.order_by('meter_id').values_list('meter_id', flat=True).distinct()
+            for start_id, end_id in id_ranges(meter_ids, self.chunk_size):
+                summaries = list(
+                    period
+                    .filter(meter_id__gte=start_id, meter_id__lte=end_id)
+                    .select_related('meter')
+                    .order_by('meter_id')
+                )
+                yield from self.recalculate_chunk(summaries, period_start, period_end)
+
+    def recalculate_chunk(self, summaries, period_start, period_end):
+        inputs = prefetch_billing_inputs(
+            [s.meter_id for s in summaries], period_start, period_end, skip_existing=False
+        )
+
+        for summary in summaries:
+            self.checked += 1
+            meter_id = summary.meter_id
+            prev_billing = self.recalculated.get((meter_id, period_start)) or inputs['prev_billings'].get(meter_id)
+
+            try:
+                # 案件・管轄は作成時の値を使う（summary を割り当ての代わりに渡す）
+                recalculated = build_billing_summary(
+                    summary,
+                    period_start,
+                    period_end,
+                    prev_billing=prev_billing,
+                    curr_reading=inputs['readings'].get((meter_id, period_end)),
+                    prev_reading=inputs['readings'].get((meter_id, period_start)),
+                    mid_reading=inputs['mid_readings'].get(meter_id),
+                )
+            except Exception as e:
+                logger.error(f'請求再計算エラー: {summary.meter.meter_id} {period_start}〜{period_end} - {e}')
+                self.errors += 1
+                continue
+
+            changes = diff_summary(summary, recalculated)
+            if not changes:
+                continue
+
+            for name, (_, new) in changes.items():
+                setattr(summary, name, new)
+            self.recalculated[(meter_id, period_end)] = summary
+            self.changed += 1
+            yield summary, changes
+
+
+def apply_changes(summaries, reset_fetch_status=False, batch_size=METER_CHUNK_SIZE) -> int:
+    """
+    再計算後の請求データを1トランザクションで一括更新
+
+    reset_fetch_status=True の場合は取得ステータスを pending に戻し、外部システムに再取得させる。
+    """
+    summaries = list(summaries)
+    if not summaries:
+        return 0
+
+    now = timezone.now()
+    fields = RECALCULATED_FIELDS + ['updated_at']
+    for summary in summaries:
+        summary.updated_at = now
+        if reset_fetch_status:
+            summary.fetch_status = 'pending'
+            summary.fetch_started_at = None
+            summary.fetch_completed_at = None
+            summary.fetch_error_message = ''
+            summary.fetch_claim_token = ''
+            summary.fetch_lease_expires_at = None
+    if reset_fetch_status:
+        fields += [
+            'fetch_status', 'fetch_started_at', 'fetch_completed_at', 'fetch_error_message',
+            'fetch_claim_token', 'fetch_lease_expires_at',
+        ]
+
+    with transaction.atomic():
+        BillingSummary.objects.bulk_update(summaries, fields, batch_size=batch_size)
+    return len(summaries)
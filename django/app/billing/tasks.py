@@ -8,31 +8,53 @@
   ※ import_kwh: パワコンからの発電量（累計値）
   ※ route_b_export_kwh: 系統への売電量（Bルート、累計値）
 """
-from celery import shared_task
+from celery import chord, group, shared_task
+from django.conf import settings
+from django.db import DatabaseError, IntegrityError, transaction
 from django.utils import timezone
-from datetime import timedelta
+from datetime import timedelta, date
 from decimal import Decimal
 import logging
 
+from app.billing.claims import release_expired
 from app.billing.models import BillingCalendar, BillingSummary
+from app.meters.chunks import id_ranges
 from app.meters.models import MeterAssignment
-from app.readings.models import MeterReading
+from app.readings.models import MeterReading, local_date_range_q
+from app.readings.aggregation import latest_readings, previous_readings
 
 logger = logging.getLogger(__name__)
 
 DEEMED_DAILY_KWH = Decimal('6.0')
 DEEMED_MONTHLY_KWH = Decimal('180.0')
 
+# 一括処理で1回に先読みするメーター数（BILLING_CHUNK_SIZE 未設定時）
+METER_CHUNK_SIZE = 1000
+
+# チャンクのリトライ回数（DB接続断・ロック待ちタイムアウトなど一時的なエラーを想定）
+CHUNK_MAX_RETRIES = 3
+
+# calculate_billing で期間中データを未取得であることを表す
+NOT_PREFETCHED = object()
+
+
+def get_chunk_size():
+    return getattr(settings, 'BILLING_CHUNK_SIZE', METER_CHUNK_SIZE)
+
 
 @shared_task
 def generate_billing_summary(target_date=None):
     """
     請求集計を生成（検針日翌日に実行）
     target_date: YYYY-MM-DD形式。指定しない場合は昨日
+
+    対象検針日の BillingCalendar ごとに、該当メーターをIDの範囲で
+    BILLING_CHUNK_SIZE 台ずつに分け、chord で並列実行する。
+    結果は merge_billing_results が {'processed', 'created', 'errors'} にまとめる。
+    作成済みの請求データはスキップするため、再実行しても重複しない。
     """
     if target_date:
-        from datetime import datetime
-        billing_date = datetime.strptime(target_date, '%Y-%m-%d').date()
+        billing_date = date.fromisoformat(target_date)
     else:
         billing_date = timezone.now().date() - timedelta(days=1)
     
@@ -41,35 +63,91 @@ def generate_billing_summary(target_date=None):
     # 対象検針日のBillingCalendarを取得
     calendars = BillingCalendar.objects.filter(actual_billing_date=billing_date)
     
-    if not calendars.exists():
+    header = []
+    for calendar in calendars:
+        # 前回検針日を取得
+        prev_calendar = get_previous_billing_date(calendar)
+        if not prev_calendar:
+            logger.warning(f'前回検針日が見つかりません: zone={calendar.zone}, base_billing_day={calendar.base_billing_day}')
+            continue
+        
+        for start_id, end_id in calendar_meter_ranges(calendar, get_chunk_size()):
+            header.append(generate_billing_chunk.s(
+                calendar.id, str(prev_calendar.actual_billing_date), str(billing_date), start_id, end_id
+            ))
+    
+    if not header:
         logger.info('対象の検針日がありません')
         return {'processed': 0, 'created': 0, 'errors': 0}
     
-    results = {'processed': 0, 'created': 0, 'errors': 0}
+    result = chord(group(header))(merge_billing_results.s(billing_date=str(billing_date)))
+    logger.info(f'請求集計: {calendars.count()}カレンダー {len(header)}チャンク')
+    return {'billing_date': str(billing_date), 'chunks': len(header), 'callback_id': result.id}
+
+
+@shared_task(bind=True, max_retries=CHUNK_MAX_RETRIES)
+def generate_billing_chunk(self, calendar_id, period_start, period_end, start_id, end_id):
+    """
+    請求集計のチャンク（検針カレンダーのメーターID start_id〜end_id）
+
+    DBエラー時はこのチャンクのみリトライする。リトライ上限に達した場合は
+    chord 全体を止めないよう、チャンク内の件数をエラーとして返す。
+    """
+    calendar = BillingCalendar.objects.get(id=calendar_id)
+    assignments = list(
+        active_assignments(calendar)
+        .filter(meter_id__gte=start_id, meter_id__lte=end_id)
+        .select_related('meter')
+        .order_by('meter_id')
+    )
     
-    for calendar in calendars:
-        result = process_calendar(calendar, billing_date)
-        results['processed'] += result['processed']
-        results['created'] += result['created']
-        results['errors'] += result['errors']
+    try:
+        results = process_assignments(assignments, date.fromisoformat(period_start), date.fromisoformat(period_end))
+    except DatabaseError as e:
+        if self.request.retries >= self.max_retries:
+            logger.error(f'請求集計チャンクエラー: calendar={calendar_id} {start_id}-{end_id} - {e}')
+            return {'processed': len(assignments), 'created': 0, 'errors': len(assignments)}
+        raise self.retry(exc=e, countdown=2 ** self.request.retries)
     
-    logger.info(f'請求集計完了: {results}')
+    logger.info(f'請求集計チャンク: calendar={calendar_id} {start_id}-{end_id} {period_start}〜{period_end} {results}')
     return results
 
 
-def process_calendar(calendar, billing_date):
-    """検針カレンダー単位で処理"""
-    results = {'processed': 0, 'created': 0, 'errors': 0}
-    
-    # 該当するアクティブなMeterAssignmentを取得
-    assignments = MeterAssignment.objects.filter(
+@shared_task
+def merge_billing_results(results, billing_date):
+    """chord のコールバック（チャンクごとの件数を合算）"""
+    totals = {'processed': 0, 'created': 0, 'errors': 0}
+    for result in results:
+        for key in totals:
+            totals[key] += result[key]
+    
+    logger.info(f'請求集計完了: 検針日={billing_date} {totals}（{len(results)}チャンク）')
+    return totals
+
+
+def active_assignments(calendar):
+    """検針カレンダーに該当するアクティブなMeterAssignment"""
+    return MeterAssignment.objects.filter(
         zone=calendar.zone,
         base_billing_day=calendar.base_billing_day,
         end_date__isnull=True
-    ).select_related('meter')
-    
-    if not assignments.exists():
-        return results
+    )
+
+
+def calendar_meter_ranges(calendar, chunk_size):
+    """検針カレンダーに該当するメーターのID範囲"""
+    meter_ids = active_assignments(calendar).order_by('meter_id').values_list('meter_id', flat=True).distinct()
+    return id_ranges(meter_ids, chunk_size)
+
+
+def process_calendar(calendar, billing_date):
+    """
+    検針カレンダー単位で同期処理（シェル・コマンドからの手動実行用）
+
+    generate_billing_summary のチャンクと同じく、メーターを BILLING_CHUNK_SIZE 台ずつ
+    process_assignments で処理する。
+    """
+    results = {'processed': 0, 'created': 0, 'errors': 0}
     
     # 前回検針日を取得
     prev_calendar = get_previous_billing_date(calendar)
@@ -79,19 +157,159 @@ def process_calendar(calendar, billing_date):
     
     prev_billing_date = prev_calendar.actual_billing_date
     
+    for start_id, end_id in calendar_meter_ranges(calendar, get_chunk_size()):
+        assignments = list(
+            active_assignments(calendar)
+            .filter(meter_id__gte=start_id, meter_id__lte=end_id)
+            .select_related('meter')
+            .order_by('meter_id')
+        )
+        chunk_results = process_assignments(assignments, prev_billing_date, billing_date)
+        for key in results:
+            results[key] += chunk_results[key]
+    
+    logger.info(
+        f'請求集計: zone={calendar.zone} base_billing_day={calendar.base_billing_day} '
+        f'{prev_billing_date}〜{billing_date} {results}'
+    )
+    return results
+
+
+def process_assignments(assignments, period_start, period_end):
+    """メーターをまとめて処理（process_meter の一括版）"""
+    results = {'processed': 0, 'created': 0, 'errors': 0}
+    inputs = prefetch_billing_inputs([a.meter_id for a in assignments], period_start, period_end)
+    
+    summaries = []
     for assignment in assignments:
         results['processed'] += 1
+        meter = assignment.meter
+        
+        # 既存チェック（同じメーターの割り当てが複数ある場合も1件のみ作成）
+        if meter.id in inputs['existing']:
+            logger.info(f'既存データあり: {meter.meter_id}')
+            continue
+        inputs['existing'].add(meter.id)
+        
         try:
-            created = process_meter(assignment, prev_billing_date, billing_date)
-            if created:
-                results['created'] += 1
+            summaries.append(build_billing_summary(
+                assignment,
+                period_start,
+                period_end,
+                prev_billing=inputs['prev_billings'].get(meter.id),
+                curr_reading=inputs['readings'].get((meter.id, period_end)),
+                prev_reading=inputs['readings'].get((meter.id, period_start)),
+                mid_reading=inputs['mid_readings'].get(meter.id),
+            ))
         except Exception as e:
-            logger.error(f'メーター処理エラー: {assignment.meter.meter_id} - {e}')
+            logger.error(f'メーター処理エラー: {meter.meter_id} - {e}')
             results['errors'] += 1
     
+    results['created'] += insert_summaries(summaries, period_start, period_end)
+    
     return results
 
 
+def insert_summaries(summaries, period_start, period_end) -> int:
+    """
+    請求データを一括作成し、作成した件数を返す
+
+    同じ期間の請求データが並行して作成された場合（一意制約違反）は、作成済みのメーターを除いて作成し直す。
+    それ以外のDBエラーは呼び出し元（チャンクのリトライ）に任せる。
+    """
+    while summaries:
+        try:
+            with transaction.atomic():
+                BillingSummary.objects.bulk_create(summaries, batch_size=METER_CHUNK_SIZE)
+            return len(summaries)
+        except IntegrityError:
+            existing = set(BillingSummary.objects.filter(
+                meter_id__in=[s.meter_id for s in summaries],
+                period_start=period_start,
+                period_end=period_end
+            ).values_list('meter_id', flat=True))
+            if not existing:
+                raise
+            logger.info(f'並行して作成済みのため除外: {len(existing)}件')
+            summaries = [s for s in summaries if s.meter_id not in existing]
+    return 0
+
+
+def prefetch_billing_inputs(meter_ids, period_start, period_end, skip_existing=True):
+    """
+    請求計算に必要なデータをメーターまとめて取得
+
+    skip_existing=False の場合は作成済みの請求データも対象にする（再計算用）
+
+    Returns:
+        existing: 同じ期間の請求データがあるメーターID（skip_existing=False の場合は空）
+        prev_billings: {meter_id: 前回の請求データ}
+        readings: {(meter_id, 日付): 検針日の最終レコード}（period_start / period_end）
+        mid_readings: {meter_id: 期間中の最新レコード}（今回検針値がないメーターのみ）
+    """
+    existing = set(BillingSummary.objects.filter(
+        meter_id__in=meter_ids,
+        period_start=period_start,
+        period_end=period_end
+    ).values_list('meter_id', flat=True)) if skip_existing else set()
+    
+    # 前回の請求データ（みなし累計値を引き継ぐため）
+    prev_billings = {}
+    for prev_billing in BillingSummary.objects.filter(
+        meter_id__in=meter_ids,
+        period_end=period_start
+    ).order_by('id'):
+        prev_billings[prev_billing.meter_id] = prev_billing
+    
+    # 前回・今回検針日の最終レコード
+    readings = {
+        key: to_reading(row)
+        for key, row in latest_readings(MeterReading.objects.filter(
+            local_date_range_q(period_start, period_end),
+            meter_id__in=meter_ids,
+            local_date__in=[period_start, period_end]
+        )).items()
+    }
+    
+    # 今回検針値がないメーターのみ期間中データを探す
+    missing = [
+        meter_id for meter_id in meter_ids
+        if meter_id not in existing and not has_value(readings.get((meter_id, period_end)), 'import_kwh')
+    ]
+    mid_readings = {
+        meter_id: to_reading(row)
+        for meter_id, row in previous_readings(missing, period_end, after_date=period_start).items()
+    } if missing else {}
+    
+    return {
+        'existing': existing,
+        'prev_billings': prev_billings,
+        'readings': readings,
+        'mid_readings': mid_readings,
+    }
+
+
+def to_reading(row):
+    """latest_readings の行を MeterReading（未保存）に変換"""
+    return MeterReading(
+        meter_id=row['meter_id'],
+        local_date=row['local_date'],
+        timestamp=row['last_reading_at'],
+        import_kwh=row['import_kwh'],
+        route_b_export_kwh=row['route_b_export_kwh'],
+        route_b_import_kwh=row['route_b_import_kwh'],
+    )
+
+
+def has_value(reading, field):
+    return reading is not None and bool(getattr(reading, field))
+
+
+def to_decimal(reading, field):
+    """実測累計値（未取得・0はNone）"""
+    return Decimal(str(getattr(reading, field))) if has_value(reading, field) else None
+
+
 def get_previous_billing_date(calendar):
     """前月の検針日を取得"""
     if calendar.month == 4:
@@ -133,21 +351,32 @@ def process_meter(assignment, period_start, period_end):
     
     # 今回検針日の実測データ取得
     curr_reading = MeterReading.objects.filter(
-        meter=meter,
-        timestamp__date=period_end
+        local_date_range_q(period_end, period_end),
+        meter=meter
     ).order_by('-timestamp').first()
     
     # 前回検針日の実測データ取得
     prev_reading = MeterReading.objects.filter(
-        meter=meter,
-        timestamp__date=period_start
+        local_date_range_q(period_start, period_start),
+        meter=meter
     ).order_by('-timestamp').first()
     
+    summary = build_billing_summary(assignment, period_start, period_end, prev_billing, curr_reading, prev_reading)
+    summary.save()
+    
+    logger.info(f'請求集計作成: {meter.meter_id} {period_start}〜{period_end} total={summary.total_kwh}kWh（自家消費量）')
+    return True
+
+
+def build_billing_summary(assignment, period_start, period_end, prev_billing, curr_reading, prev_reading, mid_reading=NOT_PREFETCHED):
+    """請求データを計算して BillingSummary（未保存）を返す"""
+    meter = assignment.meter
+    
     # 実測累計値（発電量と売電量）
-    curr_import = Decimal(str(curr_reading.import_kwh)) if curr_reading and curr_reading.import_kwh else None
-    curr_export = Decimal(str(curr_reading.route_b_export_kwh)) if curr_reading and curr_reading.route_b_export_kwh else None
-    prev_import = Decimal(str(prev_reading.import_kwh)) if prev_reading and prev_reading.import_kwh else None
-    prev_export = Decimal(str(prev_reading.route_b_export_kwh)) if prev_reading and prev_reading.route_b_export_kwh else None
+    curr_import = to_decimal(curr_reading, 'import_kwh')
+    curr_export = to_decimal(curr_reading, 'route_b_export_kwh')
+    prev_import = to_decimal(prev_reading, 'import_kwh')
+    prev_export = to_decimal(prev_reading, 'route_b_export_kwh')
     
     # パターン判定と計算
     result = calculate_billing(
@@ -158,11 +387,11 @@ def process_meter(assignment, period_start, period_end):
         curr_import=curr_import,
         curr_export=curr_export,
         period_start=period_start,
-        period_end=period_end
+        period_end=period_end,
+        mid_reading=mid_reading
     )
     
-    # 保存
-    BillingSummary.objects.create(
+    return BillingSummary(
         meter=meter,
         project_id=assignment.project_id,
         project_name=assignment.project_name,
@@ -183,15 +412,14 @@ def process_meter(assignment, period_start, period_end):
         is_first_billing=result['is_first_billing'],
         note=result['note']
     )
-    
-    logger.info(f'請求集計作成: {meter.meter_id} {period_start}〜{period_end} total={result["total_kwh"]}kWh（自家消費量）')
-    return True
 
 
-def calculate_billing(meter, prev_billing, prev_import, prev_export, curr_import, curr_export, period_start, period_end):
+def calculate_billing(meter, prev_billing, prev_import, prev_export, curr_import, curr_export, period_start, period_end, mid_reading=NOT_PREFETCHED):
     """
     パターン判定と計算
     
+    mid_reading: 期間中の最新レコード（先読み済みの場合。None は期間中データなし）
+    
     重要: PPA課金対象 = 自家消費量 = 発電量(import) - 売電量(route_b_export)
     
     パターン:
@@ -263,17 +491,17 @@ def calculate_billing(meter, prev_billing, prev_import, prev_export, curr_import
         return result
     
     # 今回検針値がない場合 → 期間中データを探す
-    mid_reading = MeterReading.objects.filter(
-        meter=meter,
-        timestamp__date__gt=period_start,
-        timestamp__date__lt=period_end
-    ).order_by('-timestamp').first()
+    if mid_reading is NOT_PREFETCHED:
+        mid_reading = MeterReading.objects.filter(
+            local_date_range_q(period_start + timedelta(days=1), period_end - timedelta(days=1)),
+            meter=meter
+        ).order_by('-local_date', '-timestamp').first()
     
     if mid_reading:
         # パターン4: 期間中データあり
         mid_import = Decimal(str(mid_reading.import_kwh)) if mid_reading.import_kwh else Decimal('0')
         mid_export = Decimal(str(mid_reading.route_b_export_kwh)) if mid_reading.route_b_export_kwh else Decimal('0')
-        mid_actual_date = mid_reading.timestamp.date()
+        mid_actual_date = mid_reading.local_date
         
         result['mid_actual_value'] = mid_import
         result['mid_actual_date'] = mid_actual_date
@@ -315,20 +543,14 @@ def calculate_billing(meter, prev_billing, prev_import, prev_export, curr_import
 @shared_task
 def reset_stale_processing():
     """
-    1時間以上processingのままのBillingSummaryをpendingに戻す
-    毎時実行を想定
+    取得期限（fetch_lease_expires_at）を過ぎたprocessingのBillingSummaryをpendingに戻す
+
+    期限切れの行は次回の取得で再度取得対象になるため定期実行は不要。
+    管理画面などのステータス表示を揃えたい場合に手動で実行する。
     """
-    threshold = timezone.now() - timedelta(hours=1)
-    
-    count = BillingSummary.objects.filter(
-        fetch_status='processing',
-        fetch_started_at__lt=threshold
-    ).update(
-        fetch_status='pending',
-        fetch_started_at=None
-    )
+    count = release_expired()
     
     if count > 0:
         logger.warning(f"Reset {count} stale processing BillingSummaries to pending")
     
-    return {'reset_count': count}
\ No newline at end of file
+    return {'reset_count': count}
@@ -10,13 +10,18 @@ from django.db.models.functions import Cast
 from django.db.models import IntegerField
 from django.http import HttpResponse
 import csv
+import hmac
 import io
-from django.utils import timezone
 from django.conf import settings
 from datetime import datetime
+from collections import Counter
+import logging
+from .claims import acknowledge, claim_summaries
 from .models import BillingCalendar, BillingSummary
 from .serializers import BillingCalendarSerializer, BillingSummarySerializer
 
+logger = logging.getLogger(__name__)
+
 
 class BillingCalendarListView(APIView):
     permission_classes = [IsAuthenticated]
@@ -442,64 +447,35 @@ class BillingSummaryChartView(APIView):
 
 class AnymoreApiAuthMixin:
     def check_api_key(self, request):
+        # ヘッダー値は latin-1 で復号された str のため、非ASCII文字を含んでも比較できるよう bytes で比較する
         key = request.headers.get('X-API-Key')
         expected = settings.ANYMORE_API_KEY
-        print(f"DEBUG: received key = '{key}', expected = '{expected}'")  # 追加
-        return key and key == expected
+        return bool(key) and bool(expected) and hmac.compare_digest(key.encode(), expected.encode())
 
 class BillingSummaryPendingView(APIView, AnymoreApiAuthMixin):
-    """未処理のBillingSummaryを取得し、processingにマークする"""
+    """
+    未処理のBillingSummaryを取得し、processingにマークする
+
+    取得した行には取得トークン（claim_token）と取得期限（lease_expires_at）を設定する。
+    並行して呼び出しても同じ行は返さない（app/billing/claims.py）。
+    期限までに mark-processed されなかった行は、次回以降の取得で再度返す。
+    """
     authentication_classes = []
     permission_classes = []
 
     def get(self, request):
-        print("=" * 50)
-        print("DEBUG: BillingSummaryPendingView called")
-        
         if not self.check_api_key(request):
-            print("DEBUG: API key check failed")
             return Response({'error': 'Unauthorized'}, status=status.HTTP_401_UNAUTHORIZED)
         
-        print("DEBUG: API key check passed")
-        
         limit = int(request.GET.get('limit', 500))
-        print(f"DEBUG: limit = {limit}")
-        
-        # まず全件数を確認
-        total_count = BillingSummary.objects.count()
-        print(f"DEBUG: Total BillingSummary count = {total_count}")
-        
-        pending_count = BillingSummary.objects.filter(fetch_status='pending').count()
-        print(f"DEBUG: Pending count (all) = {pending_count}")
         
-        pending_with_project = BillingSummary.objects.filter(
-            fetch_status='pending',
-            project_id__isnull=False
-        ).count()
-        print(f"DEBUG: Pending count (with project_id) = {pending_with_project}")
-        
-        # project_idがnullのpendingデータ
-        pending_without_project = BillingSummary.objects.filter(
-            fetch_status='pending',
-            project_id__isnull=True
-        ).count()
-        print(f"DEBUG: Pending count (without project_id) = {pending_without_project}")
-        
-        # fetch_statusの分布
-        from django.db.models import Count
-        status_dist = BillingSummary.objects.values('fetch_status').annotate(count=Count('id'))
-        print(f"DEBUG: fetch_status distribution = {list(status_dist)}")
-        
-        queryset = BillingSummary.objects.filter(
-            fetch_status='pending',
-            project_id__isnull=False
-        ).select_related('meter').order_by('period_end')[:limit]
+        token, expires_at, summaries = claim_summaries(
+            BillingSummary.objects.filter(project_id__isnull=False).order_by('period_end', 'id'),
+            limit=limit
+        )
         
         items = []
-        ids = []
-        
-        for item in queryset:
-            print(f"DEBUG: Processing item id={item.id}, project_id={item.project_id}, meter={item.meter.meter_id}")
+        for item in summaries:
             items.append({
                 'id': item.id,
                 'meter_id': item.meter.meter_id,
@@ -514,71 +490,64 @@ class BillingSummaryPendingView(APIView, AnymoreApiAuthMixin):
                 'deemed_method': item.deemed_method,
                 'is_first_billing': item.is_first_billing,
             })
-            ids.append(item.id)
-        
-        print(f"DEBUG: Found {len(items)} items to return")
-        print(f"DEBUG: IDs = {ids}")
-        
-        if ids:
-            updated = BillingSummary.objects.filter(id__in=ids).update(
-                fetch_status='processing',
-                fetch_started_at=timezone.now()
-            )
-            print(f"DEBUG: Updated {updated} items to 'processing'")
-        
-        print("=" * 50)
         
         return Response({
             'items': items,
-            'count': len(items)
+            'count': len(items),
+            'claim_token': token if items else '',
+            'lease_expires_at': expires_at.isoformat() if items else None,
         })
 
 
 class BillingSummaryMarkProcessedView(APIView, AnymoreApiAuthMixin):
-    """処理結果を受け取り、completed/errorにマークする"""
+    """
+    処理結果を受け取り、completed/errorにマークする
+
+    claim_token（pending で返した取得トークン）が一致する行のみ更新し、IDごとの結果を返す。
+    claim_token は必須（省略時は400）。移行期間中は BILLING_ACK_WITHOUT_TOKEN=True で
+    claim_token を省略したリクエストも受け付け、processing の行のみ更新する。
+    """
     authentication_classes = []
     permission_classes = []
 
     def post(self, request):
-        print("=" * 50)
-        print("DEBUG: BillingSummaryMarkProcessedView called")
-        
         if not self.check_api_key(request):
-            print("DEBUG: API key check failed")
             return Response({'error': 'Unauthorized'}, status=status.HTTP_401_UNAUTHORIZED)
         
-        print("DEBUG: API key check passed")
-        print(f"DEBUG: request.data = {request.data}")
-        
-        completed_ids = request.data.get('completed_ids', [])
-        error_items = request.data.get('error_items', [])
-        
-        print(f"DEBUG: completed_ids = {completed_ids}")
-        print(f"DEBUG: error_items = {error_items}")
-        
-        now = timezone.now()
-        
-        if completed_ids:
-            updated = BillingSummary.objects.filter(id__in=completed_ids).update(
-                fetch_status='completed',
-                fetch_completed_at=now,
-                fetch_error_message=''
+        claim_token = request.data.get('claim_token') or ''
+        if not claim_token and not getattr(settings, 'BILLING_ACK_WITHOUT_TOKEN', False):
+            return Response(
+                {'error': 'claim_token is required'},
+                status=status.HTTP_400_BAD_REQUEST
             )
-            print(f"DEBUG: Marked {updated} items as 'completed'")
         
-        for item in error_items:
-            updated = BillingSummary.objects.filter(id=item['id']).update(
-                fetch_status='error',
-                fetch_completed_at=now,
-                fetch_error_message=item.get('message', '')[:1000]
+        try:
+            completed_ids = [int(i) for i in request.data.get('completed_ids', [])]
+            errors = {
+                int(item['id']): str(item.get('message') or '')[:1000]
+                for item in request.data.get('error_items', [])
+            }
+        except (TypeError, ValueError, KeyError):
+            return Response(
+                {'error': 'completed_ids must be a list of ids and error_items a list of {id, message}'},
+                status=status.HTTP_400_BAD_REQUEST
             )
-            print(f"DEBUG: Marked item {item['id']} as 'error': {item.get('message', '')[:100]}")
         
-        print("=" * 50)
+        outcomes = acknowledge(claim_token, completed_ids, errors)
+        
+        counts = Counter(outcomes.values())
+        if counts['not_claimed'] or counts['not_found']:
+            logger.warning(
+                f"mark-processed: {counts['not_claimed']} not claimed, {counts['not_found']} not found "
+                f"(claim_token={claim_token or '-'})"
+            )
         
         return Response({
-            'completed_count': len(completed_ids),
-            'error_count': len(error_items)
+            'completed_count': counts['completed'],
+            'error_count': counts['error'],
+            'not_claimed_count': counts['not_claimed'],
+            'not_found_count': counts['not_found'],
+            'results': {str(row_id): outcome for row_id, outcome in outcomes.items()},
         })
 
 class BillingSummaryErrorsView(APIView, AnymoreApiAuthMixin):
@@ -636,7 +605,9 @@ class BillingSummaryRetryView(APIView, AnymoreApiAuthMixin):
                 fetch_status='pending',
                 fetch_started_at=None,
                 fetch_completed_at=None,
-                fetch_error_message=''
+                fetch_error_message='',
+                fetch_claim_token='',
+                fetch_lease_expires_at=None
             )
         else:
             count = BillingSummary.objects.filter(
@@ -646,7 +617,9 @@ class BillingSummaryRetryView(APIView, AnymoreApiAuthMixin):
                 fetch_status='pending',
                 fetch_started_at=None,
                 fetch_completed_at=None,
-                fetch_error_message=''
+                fetch_error_message='',
+                fetch_claim_token='',
+                fetch_lease_expires_at=None
             )
         
         return Response({
@@ -669,17 +642,17 @@ class BillingSummaryPendingByMonthView(APIView, AnymoreApiAuthMixin):
         if not year or not month:
             return Response({'error': 'year and month required'}, status=status.HTTP_400_BAD_REQUEST)
         
-        queryset = BillingSummary.objects.filter(
-            fetch_status='pending',
-            project_id__isnull=False,
-            period_end__year=int(year),
-            period_end__month=int(month)
-        ).select_related('meter').order_by('project_id')
+        token, expires_at, summaries = claim_summaries(
+            BillingSummary.objects.filter(
+                project_id__isnull=False,
+                period_end__year=int(year),
+                period_end__month=int(month)
+            ).order_by('project_id', 'id')
+        )
         
         items = []
-        ids = []
         
-        for item in queryset:
+        for item in summaries:
             items.append({
                 'id': item.id,
                 'meter_id': item.meter.meter_id,
@@ -694,17 +667,12 @@ class BillingSummaryPendingByMonthView(APIView, AnymoreApiAuthMixin):
                 'deemed_method': item.deemed_method,
                 'is_first_billing': item.is_first_billing,
             })
-            ids.append(item.id)
-        
-        if ids:
-            BillingSummary.objects.filter(id__in=ids).update(
-                fetch_status='processing',
-                fetch_started_at=timezone.now()
-            )
         
         return Response({
             'items': items,
             'count': len(items),
+            'claim_token': token if items else '',
+            'lease_expires_at': expires_at.isoformat() if items else None,
             'year': year,
             'month': month
         })
@@ -783,16 +751,19 @@ class BillingSummaryAllByMonthView(APIView, AnymoreApiAuthMixin):
         if not year or not month:
             return Response({'error': 'year and month required'}, status=status.HTTP_400_BAD_REQUEST)
         
-        queryset = BillingSummary.objects.filter(
-            project_id__isnull=False,
-            period_end__year=int(year),
-            period_end__month=int(month)
-        ).select_related('meter').order_by('project_id')
+        # 状態によらず全件をprocessingにマーク
+        token, expires_at, summaries = claim_summaries(
+            BillingSummary.objects.filter(
+                project_id__isnull=False,
+                period_end__year=int(year),
+                period_end__month=int(month)
+            ).order_by('project_id', 'id'),
+            force=True
+        )
         
         items = []
-        ids = []
         
-        for item in queryset:
+        for item in summaries:
             items.append({
                 'id': item.id,
                 'meter_id': item.meter.meter_id,
@@ -807,18 +778,12 @@ class BillingSummaryAllByMonthView(APIView, AnymoreApiAuthMixin):
                 'deemed_method': item.deemed_method,
                 'is_first_billing': item.is_first_billing,
             })
-            ids.append(item.id)
-        
-        # processingにマーク
-        if ids:
-            BillingSummary.objects.filter(id__in=ids).update(
-                fetch_status='processing',
-                fetch_started_at=timezone.now()
-            )
         
         return Response({
             'items': items,
             'count': len(items),
+            'claim_token': token if items else '',
+            'lease_expires_at': expires_at.isoformat() if items else None,
             'year': year,
             'month': month
         })
\ No newline at end of file
@@ -88,13 +88,14 @@ def decrypt_hex(ciphertext_hex: str, key: str) -> str:
     return decrypted.hex().upper()
 
 
-def try_decrypt(ciphertext_hex: str, keys: list) -> tuple:
+def try_decrypt(ciphertext_hex: str, keys: list, validate=None) -> tuple:
     """
     複数の鍵で復号を試みる
     
     Args:
         ciphertext_hex: 暗号化HEX文字列
         keys: 試す鍵のリスト [('key_name', 'key_value'), ...]
+        validate: 平文HEXを受け取り妥当か判定する関数（False の場合は次の鍵を試す）
     
     Returns:
         (平文HEX, 使用した鍵名) or (None, None)
@@ -102,6 +103,8 @@ def try_decrypt(ciphertext_hex: str, keys: list) -> tuple:
     for key_name, key_value in keys:
         try:
             decrypted = decrypt_hex(ciphertext_hex, key_value)
+            if validate is not None and not validate(decrypted):
+                raise ValueError('invalid plaintext header')
             logger.debug(f'Decryption succeeded with {key_name}')
             return decrypted, key_name
         except Exception as e:
@@ -0,0 +1,130 @@
+"""
+メーター暗号鍵キャッシュ
+
+meter_id → 鍵情報（data_key / master_key と前回復号に成功した鍵名）を保持し、
+受信パケットごとの MeterKey 参照と総当たり復号を省く。
+
+キャッシュは件数上限（LRU）・TTL付きで、共有キャッシュ（settings.CACHES）を併用できる（app/meters/ttl_cache.py）。
+"""
+from django.conf import settings
+import logging
+
+from app.keys.crypto import try_decrypt, DEFAULT_KEY
+from app.keys.models import MeterKey
+from app.keys.protocol import is_valid_header
+from app.meters.ttl_cache import TTLCache
+
+logger = logging.getLogger(__name__)
+
+CACHE_KEY_PREFIX = 'meter_key:'
+
+
+class MeterKeyCache(TTLCache):
+    """meter_id → 鍵情報のキャッシュ（件数上限・TTL付き、共有キャッシュを併用可）"""
+
+    def __init__(self, max_size=10000, ttl=300, shared_alias=None):
+        super().__init__(max_size, ttl, shared_alias, key_prefix=CACHE_KEY_PREFIX, name='key')
+
+    def invalidate(self, meter_id):
+        self.delete(meter_id)
+
+
+meter_key_cache = MeterKeyCache(
+    max_size=getattr(settings, 'METER_KEY_CACHE_MAX_SIZE', 10000),
+    ttl=getattr(settings, 'METER_KEY_CACHE_TTL', 300),
+    shared_alias=getattr(settings, 'METER_KEY_CACHE_SHARED_ALIAS', None),
+)
+
+
+def build_entry(meter_key) -> dict:
+    """MeterKey（None可）からキャッシュエントリを作成"""
+    if meter_key:
+        return {
+            'keys': [
+                ('data_key', meter_key.data_key),
+                ('master_key', meter_key.master_key),
+            ],
+            'last_key': 'data_key',
+        }
+    return {'keys': [], 'last_key': 'default_key'}
+
+
+def get_entries(meter_ids) -> dict:
+    """
+    複数メーターの鍵情報を取得（キャッシュにないものは1クエリでDBから取得）
+
+    Returns:
+        {meter_id: entry}
+    """
+    entries = {}
+    missing = []
+    for meter_id in meter_ids:
+        entry = meter_key_cache.get(meter_id)
+        if entry is None:
+            missing.append(meter_id)
+        else:
+            entries[meter_id] = entry
+
+    if missing:
+        meter_keys = {
+            k.meter.meter_id: k
+            for k in MeterKey.objects.filter(meter__meter_id__in=missing).select_related('meter')
+        }
+        for meter_id in missing:
+            entry = build_entry(meter_keys.get(meter_id))
+            meter_key_cache.set(meter_id, entry)
+            entries[meter_id] = entry
+
+    return entries
+
+
+def get_entry(meter_id) -> dict:
+    return get_entries([meter_id])[meter_id]
+
+
+def keys_in_order(entry) -> list:
+    """前回成功した鍵を先頭に、残りは data_key → master_key → default_key の順"""
+    keys = entry['keys'] + [('default_key', DEFAULT_KEY)]
+    hinted = [k for k in keys if k[0] == entry['last_key']]
+    return hinted + [k for k in keys if k[0] != entry['last_key']]
+
+
+def decrypt_for_meter(meter_id, payload_hex, entry=None) -> tuple:
+    """
+    キャッシュした鍵でメーターの受信データを復号
+
+    パディングが正しくてもヘッダー（パケットタイプ・メーターID）が妥当でない場合は復号失敗として次の鍵を試す
+    （誤った鍵を成功扱いにして前回成功した鍵として記録しないため）。
+    キャッシュの鍵で復号できない場合は、他プロセスで鍵が更新された可能性があるため
+    DBから再取得して1度だけ再試行する。
+
+    Returns:
+        (平文HEX, 使用した鍵名) or (None, None)
+    """
+    if entry is None:
+        entry = get_entry(meter_id)
+
+    def validate(decrypted):
+        return is_valid_header(decrypted, meter_id)
+
+    decrypted_hex, used_key = try_decrypt(payload_hex, keys_in_order(entry), validate)
+
+    if not decrypted_hex:
+        meter_key_cache.invalidate(meter_id)
+        fresh = get_entry(meter_id)
+        if fresh['keys'] == entry['keys']:
+            return None, None
+        entry = fresh
+        decrypted_hex, used_key = try_decrypt(payload_hex, keys_in_order(entry), validate)
+        if not decrypted_hex:
+            return None, None
+
+    if used_key != entry['last_key']:
+        meter_key_cache.set(meter_id, {**entry, 'last_key': used_key})
+
+    return decrypted_hex, used_key
+
+
+def invalidate(meter_id):
+    """鍵更新時に呼び出す"""
+    meter_key_cache.invalidate(meter_id)
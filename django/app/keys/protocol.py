@@ -27,65 +27,118 @@ PACKET_TYPE_KEY_EXCHANGE = 0b0101 # 鍵交換
 PACKET_TYPE_MULTI = 0b1010        # マルチパケット
 PACKET_TYPE_EVENT = 0b1011        # イベントログ
 
+PACKET_TYPE_NAMES = {
+    PACKET_TYPE_INSTANT: 'instant',
+    PACKET_TYPE_INTERVAL: 'interval',
+    PACKET_TYPE_KEY_EXCHANGE: 'key_exchange',
+    PACKET_TYPE_MULTI: 'multi',
+    PACKET_TYPE_EVENT: 'event',
+}
+
+
+# 固定長レイアウト（すべて big endian）
+# ヘッダー: Meter Status(2) + Meter ID(6)
+HEADER_STRUCT = struct.Struct('>H6s')
+# 30分値/瞬時値: ヘッダー + Timestamp + Import + Export + Pulse + RouteB Import + RouteB Export
+INTERVAL_STRUCT = struct.Struct('>H6sIIIIII')
+# イベントログ: ヘッダー + Timestamp + Import + Pulse + Record No + Event Code
+EVENT_STRUCT = struct.Struct('>H6sIIIHH')
+UINT8 = struct.Struct('B')
+UINT16_LE = struct.Struct('<H')
+UINT16_BE = struct.Struct('>H')
+UINT32_LE = struct.Struct('<I')
+UINT32_BE = struct.Struct('>I')
+
+KWH_UNIT = Decimal(100)
+
+
+def to_bytes(data) -> bytes:
+    """HEX文字列 / bytes / memoryview をバイト列として扱える形に変換"""
+    if isinstance(data, str):
+        return bytes.fromhex(data.replace(' ', ''))
+    return data
+
+
+def decode_meter_id(raw) -> str:
+    """6バイトBCDからメーターIDを読み取る"""
+    # BCD: 4A220004683F -> J220004683
+    hex_str = raw.hex().upper()
+    # 最初の1バイトがASCII文字コード
+    first_char = chr(raw[0]) if 0x20 <= raw[0] <= 0x7F else '?'
+    # 残りはBCD数字
+    return first_char + hex_str[2:11]  # 220004683
+
+
+def decode_timestamp(unix_ts: int):
+    try:
+        return datetime.fromtimestamp(unix_ts)
+    except (ValueError, OSError):
+        return None
+
+
+def split_meter_status(meter_status: int) -> tuple:
+    """Meter Status から (パケットタイプ bit#12-9, ステータスビット bit#8-0) を取り出す"""
+    return (meter_status >> 9) & 0x0F, meter_status & 0x1FF
+
 
 class MessageParser:
-    """C2S電文パーサー"""
+    """
+    C2S電文パーサー
+
+    HEX文字列・bytes・memoryview のいずれも受け付ける。
+    固定長部分は precompiled な struct.Struct の unpack_from で一度に読み取る。
+    """
     
-    def __init__(self, hex_data: str):
-        self.hex_data = hex_data.upper().replace(' ', '')
-        self.data = bytes.fromhex(self.hex_data)
+    def __init__(self, data):
+        self.data = memoryview(to_bytes(data))
         self.pos = 0
     
+    @property
+    def hex_data(self) -> str:
+        return self.data.hex().upper()
+    
+    def unpack(self, layout: struct.Struct) -> tuple:
+        values = layout.unpack_from(self.data, self.pos)
+        self.pos += layout.size
+        return values
+    
+    def remaining(self) -> int:
+        return len(self.data) - self.pos
+    
     def read_bytes(self, n: int) -> bytes:
-        result = self.data[self.pos:self.pos + n]
+        result = self.data[self.pos:self.pos + n].tobytes()
         self.pos += n
         return result
     
     def read_hex(self, n: int) -> str:
-        return self.read_bytes(n).hex().upper()
+        result = self.data[self.pos:self.pos + n].hex().upper()
+        self.pos += n
+        return result
     
     def read_uint8(self) -> int:
-        return struct.unpack('B', self.read_bytes(1))[0]
+        return self.unpack(UINT8)[0]
     
     def read_uint16_le(self) -> int:
-        return struct.unpack('<H', self.read_bytes(2))[0]
+        return self.unpack(UINT16_LE)[0]
     
     def read_uint16_be(self) -> int:
-        return struct.unpack('>H', self.read_bytes(2))[0]
+        return self.unpack(UINT16_BE)[0]
     
     def read_uint32_le(self) -> int:
-        return struct.unpack('<I', self.read_bytes(4))[0]
+        return self.unpack(UINT32_LE)[0]
     
     def read_uint32_be(self) -> int:
-        return struct.unpack('>I', self.read_bytes(4))[0]
+        return self.unpack(UINT32_BE)[0]
     
     def read_ascii(self, n: int) -> str:
         return self.read_bytes(n).decode('ascii', errors='replace').rstrip('\x00')
     
     def read_bcd_meter_id(self) -> str:
         """6バイトBCDからメーターIDを読み取る"""
-        raw = self.read_bytes(6)
-        # BCD: 4A220004683F -> J220004683
-        hex_str = raw.hex().upper()
-        # 最初の1バイトがASCII文字コード
-        first_char = chr(raw[0]) if 0x20 <= raw[0] <= 0x7F else '?'
-        # 残りはBCD数字
-        digits = hex_str[2:11]  # 220004683
-        return first_char + digits
+        return decode_meter_id(self.read_bytes(6))
     
-    def parse_header(self) -> dict:
-        """C2Sヘッダー解析"""
-        # Meter Status (2 bytes, big endian)
-        meter_status = self.read_uint16_be()
-        
-        # Meter ID (6 bytes BCD)
-        meter_id = self.read_bcd_meter_id()
-        
-        # パケットタイプ抽出 (bit#12-9)
-        packet_type = (meter_status >> 9) & 0x0F
-        
-        # ステータスビット (bit#8-0)
-        status_bits = meter_status & 0x1FF
+    def build_header(self, meter_status: int, raw_meter_id: bytes) -> dict:
+        packet_type, status_bits = split_meter_status(meter_status)
         
         # 鍵交換の場合、次の1バイトがパラメータ
         parameter = None
@@ -94,12 +147,16 @@ class MessageParser:
         
         return {
             'meter_status': meter_status,
-            'meter_id': meter_id,
+            'meter_id': decode_meter_id(raw_meter_id),
             'packet_type': packet_type,
             'status_bits': status_bits,
             'parameter': parameter,
         }
     
+    def parse_header(self) -> dict:
+        """C2Sヘッダー解析"""
+        return self.build_header(*self.unpack(HEADER_STRUCT))
+    
     def parse_key_exchange(self) -> dict:
         """鍵交換要求のパース"""
         header = self.parse_header()
@@ -115,75 +172,122 @@ class MessageParser:
     
     def parse_interval_data(self) -> dict:
         """30分値/瞬時値データのパース"""
-        header = self.parse_header()
-        
-        # タイムスタンプ (Unix timestamp, 4 bytes, big endian)
-        unix_ts = self.read_uint32_be()
-        try:
-            timestamp = datetime.fromtimestamp(unix_ts)
-        except (ValueError, OSError):
-            timestamp = None
-        
-        # 電力データ（4bytes each, big endian, unit: 0.01kWh）
-        import_kwh = Decimal(self.read_uint32_be()) / 100
-        export_kwh = Decimal(self.read_uint32_be()) / 100
-        
-        # Pulse count (4 bytes) - 通常は 0xFFFFFFFE
-        pulse_count = self.read_uint32_be()
-        
-        # Route-B データ
-        route_b_import_kwh = Decimal(self.read_uint32_be()) / 100
-        route_b_export_kwh = Decimal(self.read_uint32_be()) / 100
+        (
+            meter_status, raw_meter_id, unix_ts,
+            import_raw, export_raw, pulse_count,
+            route_b_import_raw, route_b_export_raw,
+        ) = self.unpack(INTERVAL_STRUCT)
         
+        # 電力データの単位は 0.01kWh、Pulse count は通常 0xFFFFFFFE
         return {
-            **header,
-            'timestamp': timestamp,
-            'import_kwh': import_kwh,
-            'export_kwh': export_kwh,
+            **self.build_header(meter_status, raw_meter_id),
+            'timestamp': decode_timestamp(unix_ts),
+            'import_kwh': Decimal(import_raw) / KWH_UNIT,
+            'export_kwh': Decimal(export_raw) / KWH_UNIT,
             'pulse_count': pulse_count,
-            'route_b_import_kwh': route_b_import_kwh,
-            'route_b_export_kwh': route_b_export_kwh,
+            'route_b_import_kwh': Decimal(route_b_import_raw) / KWH_UNIT,
+            'route_b_export_kwh': Decimal(route_b_export_raw) / KWH_UNIT,
         }
     
     def parse_event_log(self) -> dict:
         """イベントログのパース"""
-        header = self.parse_header()
+        if self.remaining() >= EVENT_STRUCT.size:
+            (
+                meter_status, raw_meter_id, unix_ts,
+                import_raw, pulse_count, record_no, event_code_raw,
+            ) = self.unpack(EVENT_STRUCT)
+            header = self.build_header(meter_status, raw_meter_id)
+        else:
+            # 末尾のフィールドが省略された電文
+            header = self.parse_header()
+            unix_ts = self.read_uint32_be()
+            import_raw = self.read_uint32_be() if self.remaining() >= 4 else None
+            pulse_count = self.read_uint32_be() if self.remaining() >= 4 else None
+            record_no = self.read_uint16_be() if self.remaining() >= 2 else None
+            event_code_raw = self.read_uint16_be() if self.remaining() >= 2 else None
         
-        # Unix timestamp
-        unix_ts = self.read_uint32_be()
-        try:
-            timestamp = datetime.fromtimestamp(unix_ts)
-        except (ValueError, OSError):
-            timestamp = None
+        return {
+            **header,
+            'timestamp': decode_timestamp(unix_ts),
+            'import_kwh': Decimal(import_raw) / KWH_UNIT if import_raw is not None else None,
+            'pulse_count': pulse_count,
+            'record_no': record_no,
+            'event_code': f"{event_code_raw:04X}" if event_code_raw else None,
+        }
+
+    def parse_multi(self) -> dict:
+        """
+        マルチパケットのパース
         
-        # Import energy
-        import_kwh = Decimal(self.read_uint32_be()) / 100 if self.pos + 4 <= len(self.data) else None
+        構造:
+        - ヘッダー（Meter Status + Meter ID）
+        - Record Count: 1byte
+        - Record × N: Length 2bytes (big endian) + C2S電文（Meter Statusから始まる単体パケット）
         
-        # Pulse count
-        pulse_count = self.read_uint32_be() if self.pos + 4 <= len(self.data) else None
+        各レコードは単体パケットと同じ形式でパースし、'raw_hex' に元の電文を入れる。
+        """
+        header = self.parse_header()
         
-        # Record No (2 bytes)
-        record_no = self.read_uint16_be() if self.pos + 2 <= len(self.data) else None
+        count = self.read_uint8() if self.remaining() >= 1 else 0
+        records = []
         
-        # Event code (2 bytes)
-        event_code_raw = self.read_uint16_be() if self.pos + 2 <= len(self.data) else None
-        event_code = f"{event_code_raw:04X}" if event_code_raw else None
+        for _ in range(count):
+            if self.remaining() < 2:
+                break
+            length = self.read_uint16_be()
+            if length == 0 or length > self.remaining():
+                logger.warning(f'Truncated multi-packet record: length={length}')
+                break
+            
+            record_data = self.data[self.pos:self.pos + length]
+            self.pos += length
+            record_type = get_packet_type(record_data)
+            parser = MessageParser(record_data)
+            
+            if record_type in (PACKET_TYPE_INSTANT, PACKET_TYPE_INTERVAL):
+                record = parser.parse_interval_data()
+            elif record_type == PACKET_TYPE_EVENT:
+                record = parser.parse_event_log()
+            else:
+                logger.warning(f'Unsupported record type in multi-packet: {record_type}')
+                continue
+            
+            record['raw_hex'] = record_data.hex().upper()
+            records.append(record)
         
         return {
             **header,
-            'timestamp': timestamp,
-            'import_kwh': import_kwh,
-            'pulse_count': pulse_count,
-            'record_no': record_no,
-            'event_code': event_code,
+            'record_count': count,
+            'records': records,
         }
 
 
-def get_packet_type(hex_data: str) -> int:
-    """電文からパケットタイプを抽出"""
-    if len(hex_data) < 4:
-        return -1
-    meter_status = int(hex_data[:4], 16)
+def is_valid_header(data, meter_id: str) -> bool:
+    """
+    復号結果のヘッダーが妥当か（パケットタイプが既知で、埋め込まれたメーターIDが一致する）
+
+    誤った鍵で復号してもPKCS7のパディング検査を通ることがあるため、鍵の判定に使う。
+    """
+    data = to_bytes(data)
+    if len(data) < HEADER_STRUCT.size:
+        return False
+    meter_status, raw_meter_id = HEADER_STRUCT.unpack_from(data)
+    packet_type, _ = split_meter_status(meter_status)
+    # decode_meter_id と同じ桁数に揃える（encode_meter_id と同じく数字部分は9桁まで0埋め）
+    expected = (meter_id[:1] + meter_id[1:10].ljust(9, '0')).upper()
+    return packet_type in PACKET_TYPE_NAMES and decode_meter_id(raw_meter_id) == expected
+
+
+def get_packet_type(data) -> int:
+    """電文（HEX文字列またはbytes）からパケットタイプを抽出"""
+    if isinstance(data, str):
+        if len(data) < 4:
+            return -1
+        meter_status = int(data[:4], 16)
+    else:
+        if len(data) < 2:
+            return -1
+        meter_status = (data[0] << 8) | data[1]
     return (meter_status >> 9) & 0x0F
 
 
@@ -200,6 +304,50 @@ def is_event_log(hex_data: str) -> bool:
     return get_packet_type(hex_data) == PACKET_TYPE_EVENT
 
 
+def is_multi_packet(hex_data: str) -> bool:
+    return get_packet_type(hex_data) == PACKET_TYPE_MULTI
+
+
+# 30分値/瞬時値の一括デコード用（INTERVAL_STRUCT と同じ並び、電力値は 0.01kWh 単位のまま）
+INTERVAL_DTYPE = [
+    ('meter_status', '>u2'),
+    ('meter_id', 'S6'),
+    ('timestamp', '>u4'),
+    ('import', '>u4'),
+    ('export', '>u4'),
+    ('pulse_count', '>u4'),
+    ('route_b_import', '>u4'),
+    ('route_b_export', '>u4'),
+]
+
+
+def decode_interval_batch(payloads):
+    """
+    複数の30分値/瞬時値電文をまとめてNumPy構造化配列に変換
+
+    再送・バックフィルなど大量の電文を集計する用途向け。
+    パケットタイプは (array['meter_status'] >> 9) & 0x0F で取り出せる。
+
+    Args:
+        payloads: 平文電文（HEX文字列またはbytes）のリスト
+
+    Returns:
+        numpy.ndarray（dtype: INTERVAL_DTYPE をネイティブバイトオーダーにしたもの）
+    """
+    import numpy as np
+
+    size = INTERVAL_STRUCT.size
+    buffer = bytearray(size * len(payloads))
+    for i, payload in enumerate(payloads):
+        data = to_bytes(payload)
+        if len(data) < size:
+            raise ValueError(f'Interval payload too short at index {i}: {len(data)} bytes')
+        buffer[i * size:(i + 1) * size] = data[:size]
+
+    dtype = np.dtype(INTERVAL_DTYPE)
+    return np.frombuffer(buffer, dtype=dtype).astype(dtype.newbyteorder('='))
+
+
 # ========== S2C電文ビルダー (変更なし) ==========
 
 class MessageBuilder:
@@ -290,4 +438,73 @@ def build_b_route_query() -> str:
     builder.write_bytes(bytes.fromhex('0000111B00'))
     builder.write_uint8(0)
     builder.write_uint16_le(0)
-    return builder.to_hex()
\ No newline at end of file
+    return builder.to_hex()
+
+# ========== C2S電文ビルダー（負荷試験・検証用） ==========
+
+def encode_meter_id(meter_id: str) -> bytes:
+    """メーターIDを6バイトBCDに変換（decode_meter_id の逆変換）"""
+    # J220004683 -> 4A220004683F
+    digits = meter_id[1:10].ljust(9, '0')
+    return bytes([ord(meter_id[0])]) + bytes.fromhex(digits + 'F')
+
+
+def build_meter_status(packet_type: int, status_bits: int = 0) -> int:
+    return ((packet_type & 0x0F) << 9) | (status_bits & 0x1FF)
+
+
+def _to_unix(timestamp) -> int:
+    return int(timestamp.timestamp()) if isinstance(timestamp, datetime) else int(timestamp)
+
+
+def _to_raw_kwh(value) -> int:
+    return int(Decimal(value) * KWH_UNIT)
+
+
+def build_interval_packet(meter_id: str, timestamp, import_kwh, export_kwh=0,
+                          route_b_import_kwh=0, route_b_export_kwh=0,
+                          instant=False, pulse_count=0xFFFFFFFE) -> str:
+    """30分値/瞬時値の電文（平文HEX）を生成"""
+    packet_type = PACKET_TYPE_INSTANT if instant else PACKET_TYPE_INTERVAL
+    return INTERVAL_STRUCT.pack(
+        build_meter_status(packet_type),
+        encode_meter_id(meter_id),
+        _to_unix(timestamp),
+        _to_raw_kwh(import_kwh),
+        _to_raw_kwh(export_kwh),
+        pulse_count,
+        _to_raw_kwh(route_b_import_kwh),
+        _to_raw_kwh(route_b_export_kwh),
+    ).hex().upper()
+
+
+def build_event_packet(meter_id: str, timestamp, event_code: int, record_no: int = 1,
+                       import_kwh=0, pulse_count=0xFFFFFFFE) -> str:
+    """イベントログの電文（平文HEX）を生成"""
+    return EVENT_STRUCT.pack(
+        build_meter_status(PACKET_TYPE_EVENT),
+        encode_meter_id(meter_id),
+        _to_unix(timestamp),
+        _to_raw_kwh(import_kwh),
+        pulse_count,
+        record_no,
+        event_code,
+    ).hex().upper()
+
+
+def build_key_exchange_packet(meter_id: str, parameter: int) -> str:
+    """鍵交換要求の電文（平文HEX）を生成（0: 新規登録, 1: 再接続, 2: ACK）"""
+    return (
+        HEADER_STRUCT.pack(build_meter_status(PACKET_TYPE_KEY_EXCHANGE), encode_meter_id(meter_id))
+        + UINT8.pack(parameter)
+    ).hex().upper()
+
+
+def build_multi_packet(meter_id: str, records: list) -> str:
+    """マルチパケットの電文（平文HEX）を生成（records は単体電文のHEXリスト）"""
+    data = bytearray(HEADER_STRUCT.pack(build_meter_status(PACKET_TYPE_MULTI), encode_meter_id(meter_id)))
+    data += UINT8.pack(len(records))
+    for record_hex in records:
+        record = bytes.fromhex(record_hex)
+        data += UINT16_BE.pack(len(record)) + record
+    return data.hex().upper()
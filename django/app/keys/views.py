@@ -5,6 +5,7 @@ from rest_framework import status
 from rest_framework.permissions import IsAuthenticated
 import secrets
 from .models import MeterKey
+from . import key_cache
 from .serializers import MeterKeySerializer, MeterKeyDetailSerializer
 
 
@@ -58,6 +59,7 @@ class KeyCreateView(APIView):
             master_key=request.data.get('master_key', DEFAULT_KEY),
             data_key=request.data.get('data_key', DEFAULT_KEY),
         )
+        key_cache.invalidate(key.meter.meter_id)
         return Response(MeterKeySerializer(key).data, status=status.HTTP_201_CREATED)
 
 
@@ -76,6 +78,7 @@ class KeyRegenerateView(APIView):
         key.key_version += 1
         key.last_key_exchange = None
         key.save()
+        key_cache.invalidate(key.meter.meter_id)
         return Response({'status': 'regenerated', 'key_version': key.key_version})
 
 
@@ -94,6 +97,7 @@ class KeyResetView(APIView):
         key.registered_at = None
         key.last_key_exchange = None
         key.save()
+        key_cache.invalidate(key.meter.meter_id)
         return Response({'status': 'reset'})
 
 
@@ -118,6 +122,7 @@ class KeyBulkImportView(APIView):
                         'data_key': item.get('data_key', DEFAULT_KEY),
                     }
                 )
+                key_cache.invalidate(meter.meter_id)
                 if is_created:
                     created += 1
                 else:
@@ -0,0 +1,24 @@
+"""
+メーターIDの範囲分割
+
+Celery の group / chord でメーター単位の処理を並列化する際に、
+対象メーターをID順に chunk_size 台ずつの (開始ID, 終了ID) に分ける。
+IDの範囲で渡すため、チャンクのタスク引数はメーター数によらず小さい。
+"""
+from app.meters.models import Meter
+
+
+def id_ranges(ids, chunk_size) -> list:
+    """昇順のIDリストを chunk_size 件ずつの [(開始ID, 終了ID)] に分割（両端を含む）"""
+    ids = list(ids)
+    return [
+        (ids[i], ids[min(i + chunk_size, len(ids)) - 1])
+        for i in range(0, len(ids), chunk_size)
+    ]
+
+
+def meter_id_ranges(chunk_size, queryset=None) -> list:
+    """削除されていないメーター（または queryset）のID範囲"""
+    if queryset is None:
+        queryset = Meter.objects.filter(is_deleted=False)
+    return id_ranges(queryset.order_by('id').values_list('id', flat=True), chunk_size)
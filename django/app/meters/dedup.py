@@ -0,0 +1,99 @@
+"""
+重複パケット抑止
+
+AWS IoT は QoS1 で配信するため、同じ電文が再送されることがある。
+(meter_id, パケットタイプ, タイムスタンプ, 電文ハッシュ) をキーとして
+保存済みの電文を記録し、再送分はDBに到達する前に 'duplicate' として応答する。
+
+キャッシュは件数上限（LRU）・TTL付きで、共有キャッシュ（settings.CACHES）を併用できる（app/meters/ttl_cache.py）。
+
+記録は保存に成功した後に行う（保存失敗時の再送を取りこぼさないため）。
+鍵交換パケットはメーターが応答を待っているため対象外。
+"""
+from django.conf import settings
+import hashlib
+import logging
+
+from app.keys.protocol import (
+    to_bytes,
+    get_packet_type,
+    HEADER_STRUCT,
+    UINT32_BE,
+    PACKET_TYPE_KEY_EXCHANGE,
+    PACKET_TYPE_INSTANT,
+    PACKET_TYPE_INTERVAL,
+    PACKET_TYPE_EVENT,
+)
+from app.meters.ttl_cache import TTLCache
+
+logger = logging.getLogger(__name__)
+
+CACHE_KEY_PREFIX = 'dedup:'
+
+TIMESTAMPED_PACKET_TYPES = (PACKET_TYPE_INSTANT, PACKET_TYPE_INTERVAL, PACKET_TYPE_EVENT)
+
+
+def packet_key(meter_id, decrypted_hex):
+    """重複判定キー（対象外のパケットはNone）"""
+    data = to_bytes(decrypted_hex)
+    packet_type = get_packet_type(data)
+    if packet_type < 0 or packet_type == PACKET_TYPE_KEY_EXCHANGE:
+        return None
+
+    timestamp = ''
+    offset = HEADER_STRUCT.size
+    if packet_type in TIMESTAMPED_PACKET_TYPES and len(data) >= offset + UINT32_BE.size:
+        timestamp = UINT32_BE.unpack_from(data, offset)[0]
+
+    digest = hashlib.blake2b(data, digest_size=8).hexdigest()
+    return f'{meter_id}:{packet_type}:{timestamp}:{digest}'
+
+
+class DuplicateFilter:
+    """保存済み電文のキャッシュ（件数上限・TTL付き、共有キャッシュを併用可）"""
+
+    def __init__(self, max_size=100000, ttl=600, shared_alias=None, enabled=True):
+        self.enabled = enabled
+        self.cache = TTLCache(max_size, ttl, shared_alias, key_prefix=CACHE_KEY_PREFIX, name='dedup')
+        self.marked = 0
+
+    @property
+    def stats(self) -> dict:
+        return {**self.cache.stats, 'marked': self.marked}
+
+    def is_duplicate(self, key) -> bool:
+        if not self.enabled or key is None:
+            return False
+        return self.cache.get(key) is not None
+
+    def mark(self, keys):
+        """保存済みとして記録"""
+        keys = [key for key in keys if key is not None]
+        if not self.enabled or not keys:
+            return
+
+        self.cache.set_many({key: 1 for key in keys})
+        self.marked += len(keys)
+
+    def clear(self):
+        self.cache.clear()
+
+
+duplicate_filter = DuplicateFilter(
+    max_size=getattr(settings, 'RECEIVE_DEDUP_MAX_SIZE', 100000),
+    ttl=getattr(settings, 'RECEIVE_DEDUP_TTL', 600),
+    shared_alias=getattr(settings, 'RECEIVE_DEDUP_SHARED_ALIAS', None),
+    enabled=getattr(settings, 'RECEIVE_DEDUP_ENABLED', True),
+)
+
+
+def is_duplicate(key) -> bool:
+    return duplicate_filter.is_duplicate(key)
+
+
+def mark(keys):
+    duplicate_filter.mark(keys)
+
+
+def get_stats() -> dict:
+    return dict(duplicate_filter.stats)
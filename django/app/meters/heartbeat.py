@@ -0,0 +1,95 @@
+"""
+メーター受信ハートビート
+パケット受信ごとの last_received_at / status 更新を、
+履歴（HistoricalMeter）を作らない直接UPDATEで行う
+"""
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+import logging
+import threading
+import time
+
+from app.meters.models import Meter
+
+logger = logging.getLogger(__name__)
+
+# 同一プロセス内で最後にハートビートを書き込んだ時刻 {meter pk: monotonic秒}
+_last_written = {}
+_lock = threading.Lock()
+
+
+def _get_interval() -> float:
+    return getattr(settings, 'METER_HEARTBEAT_INTERVAL', 60)
+
+
+def _prune(now_mono, interval):
+    """期限切れのエントリを削除（メーター数に比例してメモリが増え続けないように）"""
+    expired = [pk for pk, written in _last_written.items() if now_mono - written >= interval]
+    for pk in expired:
+        del _last_written[pk]
+
+
+def touch_meters(meters) -> int:
+    """
+    受信したメーターの last_received_at / status を更新
+
+    - QuerySet.update() で更新するため HistoricalMeter は作成されない
+    - METER_HEARTBEAT_INTERVAL 秒以内に更新済みのメーターはスキップし、
+      バースト受信時の書き込みを1回にまとめる
+    - status が active 以外のメーターは常に更新する
+    - 書き込み時刻の記録はコミット後に行う（呼び出し元のトランザクションがロールバックした場合、
+      次の受信で書き込み直す）
+
+    Returns:
+        UPDATEしたメーター数
+    """
+    interval = _get_interval()
+    now_mono = time.monotonic()
+
+    with _lock:
+        targets = [
+            meter for meter in meters
+            if not (
+                meter.status == 'active'
+                and meter.pk in _last_written
+                and now_mono - _last_written[meter.pk] < interval
+            )
+        ]
+
+    if not targets:
+        return 0
+
+    now = timezone.now()
+    updated = Meter.objects.filter(pk__in=[m.pk for m in targets]).update(
+        last_received_at=now,
+        status='active',
+    )
+
+    for meter in targets:
+        meter.last_received_at = now
+        meter.status = 'active'
+
+    pks = [meter.pk for meter in targets]
+    transaction.on_commit(lambda: _record_written(pks, now_mono, interval))
+
+    return updated
+
+
+def _record_written(pks, now_mono, interval):
+    with _lock:
+        for pk in pks:
+            _last_written[pk] = now_mono
+        if len(_last_written) > getattr(settings, 'METER_HEARTBEAT_MAX_ENTRIES', 100000):
+            _prune(now_mono, interval)
+
+
+def touch_meter(meter) -> bool:
+    """単一メーターのハートビート更新"""
+    return touch_meters([meter]) > 0
+
+
+def clear():
+    """プロセス内の書き込み記録をクリア"""
+    with _lock:
+        _last_written.clear()
@@ -0,0 +1,444 @@
+"""
+メーターデータ取り込みパイプライン
+受信API（単発/バッチ）共通の復号・パース・保存処理
+"""
+from django.db import transaction
+from django.utils import timezone
+from functools import partial
+from simple_history.utils import bulk_create_with_history
+import logging
+import secrets
+
+from app.meters.models import Meter
+from app.meters import dedup
+from app.meters.heartbeat import touch_meters
+from app.meters.instrumentation import NULL_TRACE
+from app.readings.models import MeterReading, MeterEvent, local_date_of
+from app.readings.bulk import bulk_upsert_readings
+from app.readings.aggregation import lock_meters, update_running_summaries
+from app.readings.raw_data import raw_fields
+from app.keys.models import MeterKey
+from app.keys import key_cache
+from app.keys.protocol import (
+    MessageParser,
+    get_packet_type,
+    PACKET_TYPE_KEY_EXCHANGE,
+    PACKET_TYPE_INSTANT,
+    PACKET_TYPE_INTERVAL,
+    PACKET_TYPE_EVENT,
+    PACKET_TYPE_MULTI,
+)
+from app.keys.mqtt_service import (
+    send_key_response_new, send_key_response_reconnect, send_key_confirm
+)
+
+logger = logging.getLogger(__name__)
+
+
+def generate_key() -> str:
+    """16文字のランダムキーを生成（ASCII印字可能文字）"""
+    chars = ''.join(chr(i) for i in range(0x21, 0x7F))
+    return ''.join(secrets.choice(chars) for _ in range(16))
+
+
+def get_reading_type(packet_type: int) -> str:
+    return 'interval' if packet_type == PACKET_TYPE_INTERVAL else 'instant'
+
+
+def to_aware(value):
+    """パーサーが返すnaive datetime（TIME_ZONE基準）をaware datetimeに変換"""
+    if value is not None and timezone.is_naive(value):
+        return timezone.make_aware(value)
+    return value
+
+
+class InvalidRecord(ValueError):
+    """保存できないレコード（必須項目の欠落など）"""
+
+
+# MeterEvent の NOT NULL 項目（パーサーは値が読めない場合 None を返す）
+EVENT_REQUIRED_FIELDS = ('record_no', 'event_code')
+
+
+def validate_event(data):
+    """イベントログの必須項目を確認（欠落している場合は InvalidRecord）"""
+    missing = [name for name in EVENT_REQUIRED_FIELDS if data.get(name) is None]
+    if missing:
+        raise InvalidRecord(f'missing {", ".join(missing)}')
+
+
+def get_or_create_meters(meter_ids) -> dict:
+    """
+    メーターを一括取得（未登録のものはpendingで作成）
+
+    Returns:
+        {meter_id: Meter}
+    """
+    meter_ids = set(meter_ids)
+    meters = {m.meter_id: m for m in Meter.objects.filter(meter_id__in=meter_ids)}
+
+    missing = meter_ids - set(meters)
+    if missing:
+        bulk_create_with_history(
+            [Meter(meter_id=meter_id, status='pending') for meter_id in missing],
+            Meter,
+            ignore_conflicts=True,
+        )
+        for meter in Meter.objects.filter(meter_id__in=missing):
+            meters[meter.meter_id] = meter
+        logger.info(f'New meters registered: {sorted(missing)}')
+
+    return meters
+
+
+def handle_key_exchange(meter, meter_key, decrypted_hex, used_key):
+    """
+    鍵交換処理
+
+    Returns:
+        (レスポンスdict, HTTPステータス)
+    """
+    parser = MessageParser(decrypted_hex)
+    data = parser.parse_key_exchange()
+    param = data['parameter']
+
+    logger.info(f'Key exchange from {meter.meter_id}: type={data["type"]}, param={param}')
+
+    if param == 0:
+        # 新規登録
+        if used_key != 'default_key':
+            logger.warning(f'New registration but not using default key')
+
+        master_key = generate_key()
+        data_key = generate_key()
+
+        if meter_key:
+            meter_key.master_key = master_key
+            meter_key.data_key = data_key
+            meter_key.key_version += 1
+            meter_key.save()
+        else:
+            meter_key = MeterKey.objects.create(
+                meter=meter,
+                master_key=master_key,
+                data_key=data_key,
+            )
+        key_cache.invalidate(meter.meter_id)
+
+        success = send_key_response_new(meter.meter_id, master_key, data_key)
+
+        return {
+            'status': 'key_exchange_initiated',
+            'type': 'new_registration',
+            'response_sent': success,
+        }, 200
+
+    elif param == 1:
+        # 再接続
+        if not meter_key:
+            logger.error(f'Reconnection but no key found for {meter.meter_id}')
+            return {'error': 'no key found'}, 400
+
+        new_data_key = generate_key()
+
+        meter_key.data_key = new_data_key
+        meter_key.key_version += 1
+        meter_key.last_key_exchange = timezone.now()
+        meter_key.save()
+        key_cache.invalidate(meter.meter_id)
+
+        success = send_key_response_reconnect(
+            meter.meter_id, new_data_key, meter_key.master_key
+        )
+
+        return {
+            'status': 'key_exchange_initiated',
+            'type': 'reconnection',
+            'response_sent': success,
+        }, 200
+
+    elif param == 2:
+        # ACK
+        if meter_key:
+            if not meter_key.registered_at:
+                meter_key.registered_at = timezone.now()
+            meter_key.last_key_exchange = timezone.now()
+            meter_key.save()
+
+        meter.status = 'active'
+        meter.registered_at = meter.registered_at or timezone.now()
+        meter.save()
+
+        if meter_key:
+            send_key_confirm(meter.meter_id, meter_key.data_key)
+
+        return {
+            'status': 'key_exchange_completed',
+        }, 200
+
+    return {'status': 'unknown_key_exchange_type'}, 200
+
+
+class ReceiveBatch:
+    """
+    受信データの一括保存バッファ
+
+    30分値/瞬時値は (meter, timestamp, reading_type) 単位で後勝ちにまとめ、
+    flush() で一括UPSERT（INSERT ... ON DUPLICATE KEY UPDATE）を行う。
+    日次集計（DailySummary）も同じトランザクションで逐次更新する。
+    trace を渡すとハートビート更新を heartbeat として計測する。
+    """
+
+    def __init__(self, trace=NULL_TRACE):
+        self.trace = trace
+        self.readings = {}
+        self.events = []
+        self.meters = {}
+        self.created_keys = set()
+
+    def add_reading(self, meter, data, decrypted_hex):
+        """30分値/瞬時値を追加し、結果照合用のキーを返す"""
+        reading_type = get_reading_type(data['packet_type'])
+        timestamp = to_aware(data['timestamp'])
+        key = (meter.pk, timestamp, reading_type)
+
+        self.readings[key] = MeterReading(
+            meter=meter,
+            timestamp=timestamp,
+            local_date=local_date_of(timestamp),
+            reading_type=reading_type,
+            import_kwh=data['import_kwh'],
+            export_kwh=data['export_kwh'],
+            route_b_import_kwh=data['route_b_import_kwh'],
+            route_b_export_kwh=data['route_b_export_kwh'],
+            **raw_fields(decrypted_hex),
+        )
+        self.meters[meter.pk] = meter
+        return key
+
+    def add_event(self, meter, data, decrypted_hex):
+        """イベントログを追加（必須項目が欠落している場合は InvalidRecord）"""
+        validate_event(data)
+        timestamp = to_aware(data['timestamp']) or timezone.now()
+        event = MeterEvent(
+            meter=meter,
+            timestamp=timestamp,
+            local_date=local_date_of(timestamp),
+            record_no=data.get('record_no'),
+            event_code=data.get('event_code'),
+            import_kwh=data.get('import_kwh'),
+            **raw_fields(decrypted_hex),
+        )
+        self.events.append(event)
+        return event
+
+    def add_multi(self, meter, data) -> dict:
+        """マルチパケットの各レコードを追加し、件数を返す"""
+        counts = {'readings': 0, 'events': 0, 'skipped': 0}
+        for record in data['records']:
+            if record['packet_type'] == PACKET_TYPE_EVENT:
+                try:
+                    self.add_event(meter, record, record['raw_hex'])
+                except InvalidRecord as e:
+                    logger.warning(f'Skipped multi-packet event from {meter.meter_id}: {e}')
+                    counts['skipped'] += 1
+                    continue
+                counts['events'] += 1
+            elif record['timestamp']:
+                self.add_reading(meter, record, record['raw_hex'])
+                counts['readings'] += 1
+            else:
+                counts['skipped'] += 1
+        return counts
+
+    def flush(self):
+        """バッファ内容を保存"""
+        if not self.readings and not self.events:
+            return
+
+        with transaction.atomic():
+            if self.readings:
+                self._save_readings()
+            if self.events:
+                MeterEvent.objects.bulk_create(self.events)
+            with self.trace.span('heartbeat'):
+                touch_meters(self.meters.values())
+
+        logger.info(f'Flushed {len(self.readings)} readings, {len(self.events)} events')
+
+    def _save_readings(self):
+        meter_ids = {key[0] for key in self.readings}
+        timestamps = {key[1] for key in self.readings}
+
+        # 同じメーターの受信処理・再集計を直列化（created の判定と日次集計の逐次更新を正しくするため）
+        lock_meters(meter_ids)
+
+        # 既存行の判定は応答の created 用（保存自体は一意制約によるUPSERT）
+        existing = set(
+            MeterReading.objects.filter(
+                meter_id__in=meter_ids,
+                timestamp__in=timestamps,
+            ).values_list('meter_id', 'timestamp', 'reading_type')
+        )
+        self.created_keys.update(key for key in self.readings if key not in existing)
+
+        bulk_upsert_readings(self.readings.values())
+        update_running_summaries(self.readings.values(), self.created_keys, meters_locked=True)
+
+
+def flush_individually(pending) -> set:
+    """
+    一括保存に失敗した場合にパケットごとに保存し直す
+
+    保存できなかったパケットのみ 'save failed' とし、他のパケットは保存する。
+
+    Args:
+        pending: [(処理結果, ReceiveBatch に追加する関数), ...]
+
+    Returns:
+        新規作成した30分値/瞬時値のキー
+    """
+    created_keys = set()
+    for result, add in pending:
+        batch = ReceiveBatch()
+        add(batch)
+        try:
+            batch.flush()
+        except Exception as e:
+            logger.error(f'Failed to save packet from {result["meter_id"]}: {e}')
+            for name in ('status', 'created', 'record_count', 'readings', 'events', 'skipped'):
+                result.pop(name, None)
+            result['error'] = 'save failed'
+            continue
+        created_keys |= batch.created_keys
+    return created_keys
+
+
+def ingest_packets(items) -> list:
+    """
+    受信パケットをまとめて処理
+
+    保存は1回の一括保存で行い、失敗した場合はパケットごとに保存し直す
+    （不正なパケットがあっても他のパケットは保存する）。
+
+    Args:
+        items: [{'meter_id': ..., 'payload': ...}, ...]
+
+    Returns:
+        各パケットの処理結果（itemsと同順）
+    """
+    results = []
+    valid = []
+    for index, item in enumerate(items):
+        meter_id = item.get('meter_id', '') if isinstance(item, dict) else ''
+        payload_hex = item.get('payload', '') if isinstance(item, dict) else ''
+        result = {'index': index, 'meter_id': meter_id}
+        results.append(result)
+        if not meter_id or not payload_hex:
+            result['error'] = 'missing meter_id or payload'
+            continue
+        valid.append((result, meter_id, payload_hex))
+
+    if not valid:
+        return results
+
+    meters = get_or_create_meters(meter_id for _, meter_id, _ in valid)
+    # キャッシュにない鍵を1クエリで読み込んでおく
+    key_cache.get_entries(meters.keys())
+
+    batch = ReceiveBatch()
+    reading_results = []
+    dedup_keys = {}
+    # 一括保存に失敗した場合の保存し直し用 [(処理結果, ReceiveBatch に追加する関数)]
+    pending = []
+
+    for result, meter_id, payload_hex in valid:
+        meter = meters[meter_id]
+
+        decrypted_hex, used_key = key_cache.decrypt_for_meter(meter_id, payload_hex)
+        if not decrypted_hex:
+            logger.error(f'Failed to decrypt data from {meter_id}')
+            result['error'] = 'decryption failed'
+            continue
+
+        packet_type = get_packet_type(decrypted_hex)
+
+        # 再送された電文（保存済み、または同じバッチ内で受信済み）は保存しない
+        dedup_key = dedup.packet_key(meter_id, decrypted_hex)
+        if dedup_key is not None:
+            if dedup_key in dedup_keys or dedup.is_duplicate(dedup_key):
+                result['status'] = 'duplicate'
+                continue
+            dedup_keys[dedup_key] = result
+
+        try:
+            if packet_type == PACKET_TYPE_KEY_EXCHANGE:
+                meter_key = MeterKey.objects.filter(meter=meter).first()
+                data, _ = handle_key_exchange(meter, meter_key, decrypted_hex, used_key)
+                result.update(data)
+
+            elif packet_type in (PACKET_TYPE_INSTANT, PACKET_TYPE_INTERVAL):
+                data = MessageParser(decrypted_hex).parse_interval_data()
+                if not data['timestamp']:
+                    result['error'] = 'invalid timestamp'
+                    continue
+                add = partial(ReceiveBatch.add_reading, meter=meter, data=data, decrypted_hex=decrypted_hex)
+                key = add(batch)
+                pending.append((result, add))
+                result.update({
+                    'status': 'saved',
+                    'reading_type': key[2],
+                    'timestamp': key[1].isoformat(),
+                    'import_kwh': str(data['import_kwh']),
+                    'route_b_export_kwh': str(data['route_b_export_kwh']),
+                })
+                reading_results.append((result, key))
+
+            elif packet_type == PACKET_TYPE_EVENT:
+                data = MessageParser(decrypted_hex).parse_event_log()
+                add = partial(ReceiveBatch.add_event, meter=meter, data=data, decrypted_hex=decrypted_hex)
+                add(batch)
+                pending.append((result, add))
+                result.update({
+                    'status': 'saved',
+                    'event_code': data.get('event_code'),
+                })
+
+            elif packet_type == PACKET_TYPE_MULTI:
+                data = MessageParser(decrypted_hex).parse_multi()
+                add = partial(ReceiveBatch.add_multi, meter=meter, data=data)
+                counts = add(batch)
+                pending.append((result, add))
+                result.update({
+                    'status': 'saved',
+                    'record_count': data['record_count'],
+                    **counts,
+                })
+
+            else:
+                logger.warning(f'Unknown packet type: {packet_type}')
+                result.update({
+                    'status': 'unknown_packet_type',
+                    'packet_type': packet_type,
+                    'hex_preview': decrypted_hex[:32],
+                })
+        except InvalidRecord as e:
+            logger.error(f'Invalid packet from {meter_id}: {e}')
+            result['error'] = f'invalid record: {e}'
+        except Exception as e:
+            logger.error(f'Failed to process packet from {meter_id}: {e}')
+            result['error'] = 'parse failed'
+
+    try:
+        batch.flush()
+        created_keys = batch.created_keys
+    except Exception as e:
+        logger.error(f'Batch save failed ({len(pending)} packets), retrying one by one: {e}')
+        created_keys = flush_individually(pending)
+    dedup.mark(key for key, result in dedup_keys.items() if result.get('status') == 'saved')
+
+    for result, key in reading_results:
+        if result.get('status') == 'saved':
+            result['created'] = key in created_keys
+
+    return results
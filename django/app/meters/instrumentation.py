@@ -0,0 +1,188 @@
+"""
+受信処理のステージ別計測
+
+RECEIVE_TIMING_ENABLED=True の場合、受信APIの各ステージ（復号・保存など）の
+所要時間とSQL発行数をパケットタイプ別に集計する。
+
+    trace = start_trace()
+    with trace:
+        with trace.span('decrypt'):
+            ...
+
+集計結果は /api/meters/receive/metrics/ で参照でき、
+RECEIVE_TIMING_HEADER=True の場合はレスポンスに Server-Timing ヘッダーを付与する。
+無効時は何もしないトレース（NULL_TRACE）を返すため、計測コストはほぼかからない。
+"""
+from contextlib import nullcontext
+from django.conf import settings
+from django.db import connection
+import threading
+import time
+
+# ヒストグラムの上限値（ミリ秒）
+BUCKETS_MS = (1, 2.5, 5, 10, 25, 50, 100, 250, 500, 1000, 2500)
+
+_NULL_SPAN = nullcontext()
+
+
+def is_enabled() -> bool:
+    return getattr(settings, 'RECEIVE_TIMING_ENABLED', False)
+
+
+class NullTrace:
+    """計測無効時のトレース"""
+
+    label = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def span(self, stage):
+        return _NULL_SPAN
+
+    def set_label(self, label):
+        pass
+
+    def apply_header(self, response):
+        return response
+
+
+NULL_TRACE = NullTrace()
+
+
+class Span:
+    def __init__(self, trace, stage):
+        self.trace = trace
+        self.stage = stage
+
+    def __enter__(self):
+        self.queries = self.trace.queries
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        elapsed_ms = (time.perf_counter() - self.started) * 1000
+        stage = self.trace.stages.setdefault(self.stage, [0.0, 0])
+        stage[0] += elapsed_ms
+        stage[1] += self.trace.queries - self.queries
+        return False
+
+
+class Trace:
+    """1リクエスト分の計測"""
+
+    def __init__(self, recorder, label='unknown'):
+        self.recorder = recorder
+        self.label = label
+        self.stages = {}
+        self.queries = 0
+        self.total_ms = 0.0
+
+    def __enter__(self):
+        self._wrapper = connection.execute_wrapper(self._count_query)
+        self._wrapper.__enter__()
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.total_ms = (time.perf_counter() - self.started) * 1000
+        self._wrapper.__exit__(*exc)
+        self.recorder.record(self)
+        return False
+
+    def _count_query(self, execute, sql, params, many, context):
+        self.queries += 1
+        return execute(sql, params, many, context)
+
+    def span(self, stage):
+        return Span(self, stage)
+
+    def set_label(self, label):
+        self.label = label
+
+    def server_timing(self) -> str:
+        entries = [
+            f'{stage};dur={elapsed_ms:.2f};desc="{queries} queries"'
+            for stage, (elapsed_ms, queries) in self.stages.items()
+        ]
+        entries.append(f'total;dur={self.total_ms:.2f};desc="{self.label}, {self.queries} queries"')
+        return ', '.join(entries)
+
+    def apply_header(self, response):
+        if getattr(settings, 'RECEIVE_TIMING_HEADER', False):
+            response['Server-Timing'] = self.server_timing()
+        return response
+
+
+class TimingRecorder:
+    """パケットタイプ・ステージ別のヒストグラム（プロセス内）"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stats = {}
+
+    def record(self, trace):
+        stages = list(trace.stages.items()) + [('total', (trace.total_ms, trace.queries))]
+        with self._lock:
+            by_stage = self._stats.setdefault(trace.label, {})
+            for stage, (elapsed_ms, queries) in stages:
+                stat = by_stage.get(stage)
+                if stat is None:
+                    stat = by_stage[stage] = {
+                        'count': 0,
+                        'sum_ms': 0.0,
+                        'max_ms': 0.0,
+                        'queries': 0,
+                        'buckets': [0] * (len(BUCKETS_MS) + 1),
+                    }
+                stat['count'] += 1
+                stat['sum_ms'] += elapsed_ms
+                stat['max_ms'] = max(stat['max_ms'], elapsed_ms)
+                stat['queries'] += queries
+                stat['buckets'][self._bucket_index(elapsed_ms)] += 1
+
+    @staticmethod
+    def _bucket_index(elapsed_ms) -> int:
+        for i, upper in enumerate(BUCKETS_MS):
+            if elapsed_ms <= upper:
+                return i
+        return len(BUCKETS_MS)
+
+    def snapshot(self) -> dict:
+        """集計結果（バケットは累積件数、le=上限ミリ秒）"""
+        labels = [str(upper) for upper in BUCKETS_MS] + ['+Inf']
+        with self._lock:
+            result = {}
+            for label, by_stage in self._stats.items():
+                result[label] = {}
+                for stage, stat in by_stage.items():
+                    cumulative = 0
+                    buckets = {}
+                    for le, n in zip(labels, stat['buckets']):
+                        cumulative += n
+                        buckets[le] = cumulative
+                    result[label][stage] = {
+                        'count': stat['count'],
+                        'mean_ms': round(stat['sum_ms'] / stat['count'], 3),
+                        'max_ms': round(stat['max_ms'], 3),
+                        'queries_per_call': round(stat['queries'] / stat['count'], 2),
+                        'buckets': buckets,
+                    }
+            return result
+
+    def reset(self):
+        with self._lock:
+            self._stats.clear()
+
+
+recorder = TimingRecorder()
+
+
+def start_trace(label='unknown'):
+    """計測を開始（無効時は NULL_TRACE）"""
+    if not is_enabled():
+        return NULL_TRACE
+    return Trace(recorder, label)
@@ -0,0 +1,330 @@
+from collections import Counter
+from datetime import timedelta
+from decimal import Decimal
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import override_settings
+from django.utils import timezone
+from rest_framework.test import APIRequestFactory
+from unittest import mock
+import json
+import queue
+import random
+import threading
+import time
+
+from app.keys import key_cache
+from app.keys.crypto import encrypt_hex, DEFAULT_KEY
+from app.keys.models import MeterKey
+from app.keys.protocol import (
+    build_interval_packet,
+    build_event_packet,
+    build_key_exchange_packet,
+)
+from app.meters import dedup, heartbeat
+from app.meters.ingest import generate_key
+from app.meters.models import Meter
+from app.meters.receive_api import MeterReceiveView, MeterBatchReceiveView
+
+# 比較対象の指標（True: 大きいほど良い）
+BASELINE_METRICS = {
+    'throughput_pps': True,
+    'latency_ms.p50': False,
+    'latency_ms.p95': False,
+    'latency_ms.p99': False,
+    'queries_per_packet': False,
+}
+
+
+def percentile(sorted_values, p):
+    if not sorted_values:
+        return 0
+    index = min(len(sorted_values) - 1, max(0, int(round(p / 100 * len(sorted_values))) - 1))
+    return sorted_values[index]
+
+
+def get_metric(report, name):
+    value = report
+    for part in name.split('.'):
+        value = value.get(part) if isinstance(value, dict) else None
+    return value
+
+
+class Command(BaseCommand):
+    help = '受信処理の負荷試験（擬似メーターの暗号化電文を受信APIに送り、レイテンシ・スループットを計測）'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--meters', type=int, default=100, help='擬似メーター数（デフォルト: 100）')
+        parser.add_argument('--packets', type=int, default=10, help='メーターあたりの30分値件数（デフォルト: 10）')
+        parser.add_argument(
+            '--mode',
+            choices=['single', 'batch', 'async'],
+            default='single',
+            help='single: 単体受信, batch: 一括受信, async: 非同期受付（Redis必須）',
+        )
+        parser.add_argument('--batch-size', type=int, default=100, help='batch モードの1リクエスト件数（デフォルト: 100）')
+        parser.add_argument('--concurrency', type=int, default=4, help='同時実行数（デフォルト: 4）')
+        parser.add_argument('--rate', type=float, default=0, help='送信レート（リクエスト/秒、0: 無制限）')
+        parser.add_argument('--event-ratio', type=float, default=0.0, help='イベントログの割合（0〜1）')
+        parser.add_argument('--key-exchange-ratio', type=float, default=0.0, help='鍵交換（ACK）の割合（0〜1）')
+        parser.add_argument('--duplicate-ratio', type=float, default=0.0, help='再送電文の割合（0〜1）')
+        parser.add_argument('--seed', type=int, default=1, help='乱数シード（デフォルト: 1）')
+        parser.add_argument('--publish', action='store_true', help='S2C応答を実際に送信する（デフォルト: 送信しない）')
+        parser.add_argument('--no-drain', action='store_true', help='async モードでキューの処理時間を計測しない')
+        parser.add_argument('--keep-data', action='store_true', help='試験データを削除しない')
+        parser.add_argument(
+            '--allow-destructive',
+            action='store_true',
+            help='接続先DBに試験データを作成・削除することを許可する（必須、本番DBでは実行しないこと）',
+        )
+        parser.add_argument('--output', type=str, default='', help='結果をJSONで保存するパス')
+        parser.add_argument('--baseline', type=str, default='', help='比較するベースラインJSONのパス')
+        parser.add_argument('--save-baseline', type=str, default='', help='結果をベースラインとして保存するパス')
+
+    def handle(self, *args, **options):
+        if options['meters'] < 1 or options['packets'] < 1:
+            raise CommandError('--meters と --packets は1以上を指定してください')
+
+        if not options['allow_destructive']:
+            raise CommandError(
+                f'接続先DB（{connection.settings_dict["NAME"]}）に試験データを作成・削除します。'
+                '試験用DBであることを確認して --allow-destructive を指定してください'
+            )
+
+        self.random = random.Random(options['seed'])
+        meter_ids = [f'Z{i:09d}' for i in range(options['meters'])]
+
+        existing = Meter.objects.filter(meter_id__in=meter_ids).count()
+        if existing:
+            raise CommandError(
+                f'擬似メーターIDと同じメーターが{existing}台登録済みです（前回の試験データが残っている場合は手動で削除してください）'
+            )
+        data_keys = self.setup_meters(meter_ids)
+        packets = self.build_packets(meter_ids, data_keys, options)
+        bodies, view = self.build_requests(packets, options)
+
+        # キャッシュを空にして計測（鍵キャッシュのウォームアップも含める）
+        key_cache.meter_key_cache.clear()
+        dedup.duplicate_filter.clear()
+        heartbeat.clear()
+
+        self.stdout.write(
+            f'負荷試験開始: {options["mode"]} / メーター {len(meter_ids)}台 / '
+            f'電文 {len(packets)}件 / リクエスト {len(bodies)}件 / 同時実行 {options["concurrency"]}'
+        )
+
+        patches = []
+        if not options['publish']:
+            patches.append(mock.patch('app.keys.mqtt_service.publish_to_meter', return_value=True))
+
+        try:
+            for patch in patches:
+                patch.start()
+            with override_settings(RECEIVE_ASYNC_MODE=options['mode'] == 'async'):
+                report = self.run(view, bodies, len(packets), options)
+        finally:
+            for patch in patches:
+                patch.stop()
+            if not options['keep_data']:
+                self.cleanup()
+
+        self.print_report(report)
+
+        if options['baseline']:
+            with open(options['baseline']) as f:
+                self.print_comparison(json.load(f), report)
+        for path in (options['output'], options['save_baseline']):
+            if path:
+                with open(path, 'w') as f:
+                    json.dump(report, f, ensure_ascii=False, indent=2)
+                self.stdout.write(f'結果を保存: {path}')
+
+    def cleanup(self):
+        """この試験で作成したメーター（と関連データ）のみ削除"""
+        deleted, _ = Meter.objects.filter(id__in=self.created_meter_ids).delete()
+        if deleted:
+            self.stdout.write(f'試験データ削除: {deleted}件')
+
+    def setup_meters(self, meter_ids) -> dict:
+        """擬似メーターと鍵を登録し {meter_id: data_key} を返す"""
+        now = timezone.now()
+        Meter.objects.bulk_create([
+            Meter(meter_id=meter_id, status='active', registered_at=now) for meter_id in meter_ids
+        ])
+        # 登録前に同じメーターIDがないことを確認済みのため、すべてこの試験で作成したメーター
+        meters = list(Meter.objects.filter(meter_id__in=meter_ids))
+        self.created_meter_ids = [meter.id for meter in meters]
+        MeterKey.objects.bulk_create([
+            MeterKey(meter=meter, master_key=generate_key(), data_key=generate_key(), registered_at=now)
+            for meter in meters
+        ])
+        return dict(MeterKey.objects.filter(meter__meter_id__in=meter_ids).values_list('meter__meter_id', 'data_key'))
+
+    def build_packets(self, meter_ids, data_keys, options) -> list:
+        """[(meter_id, 暗号化HEX), ...] を時刻順（メーター横断）に生成"""
+        now = timezone.now().replace(second=0, microsecond=0)
+        start = now - timedelta(minutes=now.minute % 30 + 30 * options['packets'])
+        totals = {meter_id: Decimal(self.random.randint(0, 100000)) / 100 for meter_id in meter_ids}
+
+        packets = []
+        for i in range(options['packets']):
+            timestamp = start + timedelta(minutes=30 * i)
+            for meter_id in meter_ids:
+                roll = self.random.random()
+                if roll < options['key_exchange_ratio']:
+                    plain = build_key_exchange_packet(meter_id, 2)
+                elif roll < options['key_exchange_ratio'] + options['event_ratio']:
+                    plain = build_event_packet(meter_id, timestamp, self.random.randint(1, 0x20), i + 1, totals[meter_id])
+                else:
+                    totals[meter_id] += Decimal(self.random.randint(0, 200)) / 100
+                    plain = build_interval_packet(
+                        meter_id, timestamp, totals[meter_id],
+                        route_b_import_kwh=Decimal(self.random.randint(0, 50)) / 100,
+                        route_b_export_kwh=Decimal(self.random.randint(0, 150)) / 100,
+                    )
+                packet = (meter_id, encrypt_hex(plain, data_keys.get(meter_id, DEFAULT_KEY)))
+                packets.append(packet)
+
+                # QoS1の再送を模擬（少し後に同じ電文が届く）
+                if self.random.random() < options['duplicate_ratio']:
+                    packets.append(packet)
+
+        return packets
+
+    def build_requests(self, packets, options):
+        if options['mode'] == 'batch':
+            size = max(1, options['batch_size'])
+            bodies = [
+                {'items': [{'meter_id': m, 'payload': p} for m, p in packets[i:i + size]]}
+                for i in range(0, len(packets), size)
+            ]
+            return bodies, ('/api/meters/receive/batch/', MeterBatchReceiveView.as_view())
+
+        bodies = [{'meter_id': m, 'payload': p} for m, p in packets]
+        return bodies, ('/api/meters/receive/', MeterReceiveView.as_view())
+
+    def run(self, view, bodies, packet_count, options) -> dict:
+        path, view_func = view
+        factory = APIRequestFactory()
+        api_key = getattr(settings, 'LAMBDA_API_KEY', '')
+        rate = options['rate']
+
+        tasks = queue.Queue()
+        for i, body in enumerate(bodies):
+            tasks.put((i, body))
+
+        samples = []
+        outcomes = Counter()
+        lock = threading.Lock()
+        started = time.perf_counter()
+
+        def count_queries(counter):
+            def wrapper(execute, sql, params, many, context):
+                counter[0] += 1
+                return execute(sql, params, many, context)
+            return wrapper
+
+        def worker():
+            try:
+                while True:
+                    try:
+                        i, body = tasks.get_nowait()
+                    except queue.Empty:
+                        return
+
+                    # レート指定時は予定時刻からのレイテンシを計測（送信遅れも含める）
+                    scheduled = started + i / rate if rate else None
+                    if scheduled and scheduled > time.perf_counter():
+                        time.sleep(scheduled - time.perf_counter())
+
+                    request = factory.post(path, body, format='json', HTTP_X_API_KEY=api_key)
+                    counter = [0]
+                    sent = time.perf_counter()
+                    with connection.execute_wrapper(count_queries(counter)):
+                        response = view_func(request)
+                    latency = time.perf_counter() - (scheduled or sent)
+
+                    with lock:
+                        samples.append((latency, counter[0]))
+                        for result in response.data.get('results', [response.data]):
+                            outcomes[result.get('status') or result.get('error') or str(response.status_code)] += 1
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=worker) for _ in range(max(1, options['concurrency']))]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        elapsed = time.perf_counter() - started
+        drain_sec = None
+        if options['mode'] == 'async' and not options['no_drain'] and outcomes.get('accepted'):
+            drain_sec = self.drain_queue()
+            elapsed += drain_sec
+
+        latencies = sorted(s[0] * 1000 for s in samples)
+        queries = sum(s[1] for s in samples)
+
+        return {
+            'mode': options['mode'],
+            'meters': options['meters'],
+            'packets': packet_count,
+            'requests': len(bodies),
+            'concurrency': options['concurrency'],
+            'rate': rate,
+            'database': connection.vendor,
+            'elapsed_sec': round(elapsed, 3),
+            'drain_sec': round(drain_sec, 3) if drain_sec is not None else None,
+            'throughput_pps': round(packet_count / elapsed, 1) if elapsed else 0,
+            'latency_ms': {
+                'p50': round(percentile(latencies, 50), 2),
+                'p95': round(percentile(latencies, 95), 2),
+                'p99': round(percentile(latencies, 99), 2),
+                'max': round(latencies[-1], 2) if latencies else 0,
+                'mean': round(sum(latencies) / len(latencies), 2) if latencies else 0,
+            },
+            'queries_per_packet': round(queries / packet_count, 2),
+            'outcomes': dict(outcomes),
+            'dedup': dedup.get_stats(),
+        }
+
+    def drain_queue(self) -> float:
+        """非同期受付分をワーカーで処理し、所要時間を返す"""
+        from app.meters.receive_queue import ReceiveQueueWorker
+
+        worker = ReceiveQueueWorker(consumer='bench-ingest', block_ms=100)
+        worker.ensure_group()
+        started = time.perf_counter()
+        while worker.run_once():
+            pass
+        connection.close()
+        return time.perf_counter() - started
+
+    def print_report(self, report):
+        latency = report['latency_ms']
+        self.stdout.write(self.style.SUCCESS('負荷試験結果'))
+        self.stdout.write(f'  所要時間: {report["elapsed_sec"]}秒' + (
+            f'（キュー処理 {report["drain_sec"]}秒を含む）' if report['drain_sec'] is not None else ''
+        ))
+        self.stdout.write(f'  スループット: {report["throughput_pps"]} 電文/秒')
+        self.stdout.write(
+            f'  レイテンシ（1リクエスト）: p50 {latency["p50"]}ms / p95 {latency["p95"]}ms / '
+            f'p99 {latency["p99"]}ms / max {latency["max"]}ms'
+        )
+        self.stdout.write(f'  クエリ数: {report["queries_per_packet"]} /電文')
+        self.stdout.write(f'  結果: {report["outcomes"]}')
+        self.stdout.write(f'  重複抑止: {report["dedup"]}')
+
+    def print_comparison(self, baseline, report):
+        self.stdout.write(f'ベースライン比較（{baseline.get("mode")} / 電文 {baseline.get("packets")}件）')
+        for name, higher_is_better in BASELINE_METRICS.items():
+            before = get_metric(baseline, name)
+            after = get_metric(report, name)
+            if not before or after is None:
+                continue
+            change = (after - before) / before * 100
+            improved = change >= 0 if higher_is_better else change <= 0
+            line = f'  {name}: {before} -> {after} ({change:+.1f}%)'
+            self.stdout.write(self.style.SUCCESS(line) if improved else self.style.WARNING(line))
@@ -6,7 +6,8 @@ import random
 import calendar as cal
 
 from app.meters.models import Meter, MeterAssignment
-from app.readings.models import MeterReading, DailySummary, MonthlySummary
+from app.readings.models import MeterReading, DailySummary, MonthlySummary, local_date_range_q
+from app.readings.bulk import bulk_upsert_readings
 from app.billing.models import BillingCalendar, BillingSummary
 
 DEEMED_DAILY_KWH = Decimal('6.0')
@@ -238,11 +239,11 @@ class Command(BaseCommand):
             current_time += timedelta(minutes=30)
 
             if len(readings) >= 2000:
-                MeterReading.objects.bulk_create(readings, ignore_conflicts=True)
+                bulk_upsert_readings(readings)
                 readings = []
 
         if readings:
-            MeterReading.objects.bulk_create(readings, ignore_conflicts=True)
+            bulk_upsert_readings(readings)
 
         count = MeterReading.objects.filter(meter=meter).count()
         self.stdout.write(f'  30分データ: {count}件')
@@ -368,20 +369,19 @@ class Command(BaseCommand):
     def calculate_billing(self, meter, prev_used_value, period_start, period_end, is_first):
         """請求データを計算"""
         prev_reading = MeterReading.objects.filter(
-            meter=meter,
-            timestamp__date=period_start
+            local_date_range_q(period_start, period_start),
+            meter=meter
         ).order_by('-timestamp').first()
 
         curr_reading = MeterReading.objects.filter(
-            meter=meter,
-            timestamp__date=period_end
+            local_date_range_q(period_end, period_end),
+            meter=meter
         ).order_by('-timestamp').first()
 
         mid_reading = MeterReading.objects.filter(
-            meter=meter,
-            timestamp__date__gt=period_start,
-            timestamp__date__lt=period_end
-        ).order_by('-timestamp').first()
+            local_date_range_q(period_start + timedelta(days=1), period_end - timedelta(days=1)),
+            meter=meter
+        ).order_by('-local_date', '-timestamp').first()
 
         prev_actual = Decimal(str(prev_reading.import_kwh)) if prev_reading else None
         curr_actual = Decimal(str(curr_reading.import_kwh)) if curr_reading else None
@@ -424,7 +424,7 @@ class Command(BaseCommand):
         elif mid_reading:
             # 日次みなし
             mid_actual = Decimal(str(mid_reading.import_kwh))
-            mid_date = mid_reading.timestamp.date()
+            mid_date = mid_reading.local_date
 
             result['mid_actual_value'] = mid_actual
             result['mid_actual_date'] = mid_date
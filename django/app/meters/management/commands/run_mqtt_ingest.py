@@ -0,0 +1,107 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+import signal
+import socket
+
+from app.meters import dedup
+from app.meters.mqtt_ingest import MicroBatcher, MqttIngestService, shared_topic
+
+
+class Command(BaseCommand):
+    help = 'MQTT C2Sトピックを購読してメーターデータを取り込む（Lambda受信の代替）'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--host',
+            type=str,
+            default=getattr(settings, 'MQTT_INGEST_HOST', '') or settings.AWS_IOT_ENDPOINT,
+            help='MQTTブローカー（デフォルト: MQTT_INGEST_HOST / AWS_IOT_ENDPOINT）',
+        )
+        parser.add_argument(
+            '--port',
+            type=int,
+            default=getattr(settings, 'MQTT_INGEST_PORT', 8883),
+            help='ポート（デフォルト: 8883）',
+        )
+        parser.add_argument(
+            '--topic',
+            type=str,
+            default=getattr(settings, 'MQTT_INGEST_TOPIC', '+'),
+            help='購読トピックフィルタ（{meter_id}C2S 以外は無視、デフォルト: +）',
+        )
+        parser.add_argument(
+            '--group',
+            type=str,
+            default=getattr(settings, 'MQTT_INGEST_GROUP', 'anymore-meter-ingest'),
+            help='共有サブスクリプションのグループ名（空文字で通常購読）',
+        )
+        parser.add_argument(
+            '--client-id',
+            type=str,
+            default='',
+            help='クライアントID（デフォルト: ホスト名から生成）',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=getattr(settings, 'MQTT_INGEST_BATCH_SIZE', 500),
+            help='まとめて保存する最大件数（デフォルト: 500）',
+        )
+        parser.add_argument(
+            '--batch-wait-ms',
+            type=int,
+            default=getattr(settings, 'MQTT_INGEST_BATCH_WAIT_MS', 200),
+            help='バッチをまとめる最大待ち時間ミリ秒（デフォルト: 200）',
+        )
+        parser.add_argument(
+            '--payload-format',
+            choices=['binary', 'hex'],
+            default='binary',
+            help='ペイロード形式（binary: 暗号文バイナリ, hex: HEX文字列）',
+        )
+        parser.add_argument('--username', type=str, default=getattr(settings, 'MQTT_INGEST_USERNAME', ''))
+        parser.add_argument('--password', type=str, default=getattr(settings, 'MQTT_INGEST_PASSWORD', ''))
+        parser.add_argument('--ca-certs', type=str, default=getattr(settings, 'MQTT_INGEST_CA_CERTS', ''))
+        parser.add_argument('--certfile', type=str, default=getattr(settings, 'MQTT_INGEST_CERTFILE', ''))
+        parser.add_argument('--keyfile', type=str, default=getattr(settings, 'MQTT_INGEST_KEYFILE', ''))
+
+    def handle(self, *args, **options):
+        topic = shared_topic(options['group'], options['topic'])
+        client_id = options['client_id'] or f'anymore-meter-ingest-{socket.gethostname()}'
+
+        batcher = MicroBatcher(
+            max_batch=options['batch_size'],
+            max_wait_ms=options['batch_wait_ms'],
+        )
+        service = MqttIngestService(
+            batcher,
+            topic,
+            payload_format=options['payload_format'],
+            client_id=client_id,
+        )
+
+        def shutdown(signum, frame):
+            self.stdout.write(self.style.WARNING('停止シグナル受信、残りのメッセージを保存して終了します'))
+            batcher.stop()
+
+        signal.signal(signal.SIGINT, shutdown)
+        signal.signal(signal.SIGTERM, shutdown)
+
+        self.stdout.write(f'MQTT取り込み開始')
+        self.stdout.write(f'  ブローカー: {options["host"]}:{options["port"]}')
+        self.stdout.write(f'  トピック: {topic}')
+        self.stdout.write(f'  バッチ: {options["batch_size"]}件 / {options["batch_wait_ms"]}ms')
+
+        service.connect(
+            options['host'],
+            options['port'],
+            username=options['username'] or None,
+            password=options['password'] or None,
+            ca_certs=options['ca_certs'] or None,
+            certfile=options['certfile'] or None,
+            keyfile=options['keyfile'] or None,
+        )
+        service.run_forever()
+
+        self.stdout.write(self.style.SUCCESS(f'MQTT取り込み終了: {batcher.stats}'))
+        self.stdout.write(f'重複抑止: {dedup.get_stats()}')
@@ -0,0 +1,63 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+import signal
+
+from app.meters import dedup
+from app.meters.receive_queue import ReceiveQueueWorker
+
+
+class Command(BaseCommand):
+    help = '受信キュー（RECEIVE_ASYNC_MODE）のメーターデータを取り出して保存する'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--consumer',
+            type=str,
+            default='',
+            help='コンシューマー名（デフォルト: ホスト名から生成）',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=getattr(settings, 'RECEIVE_QUEUE_BATCH_SIZE', 500),
+            help='1回に取り出す最大件数（デフォルト: 500）',
+        )
+        parser.add_argument(
+            '--block-ms',
+            type=int,
+            default=1000,
+            help='新着待ちの最大時間ミリ秒（デフォルト: 1000）',
+        )
+        parser.add_argument(
+            '--reclaim-idle-ms',
+            type=int,
+            default=60000,
+            help='未ACKメッセージを引き取るまでの時間ミリ秒（デフォルト: 60000）',
+        )
+        parser.add_argument(
+            '--max-deliveries',
+            type=int,
+            default=getattr(settings, 'RECEIVE_QUEUE_MAX_DELIVERIES', 5),
+            help='この回数を超えて配信されたメッセージは1件ずつ保存し、失敗分をデッドレターに移す（デフォルト: 5）',
+        )
+
+    def handle(self, *args, **options):
+        worker = ReceiveQueueWorker(
+            consumer=options['consumer'] or None,
+            batch_size=options['batch_size'],
+            block_ms=options['block_ms'],
+            reclaim_idle_ms=options['reclaim_idle_ms'],
+            max_deliveries=options['max_deliveries'],
+        )
+
+        def shutdown(signum, frame):
+            self.stdout.write(self.style.WARNING('停止シグナル受信、処理中のバッチ完了後に終了します'))
+            worker.stop()
+
+        signal.signal(signal.SIGINT, shutdown)
+        signal.signal(signal.SIGTERM, shutdown)
+
+        self.stdout.write(f'受信キューワーカー開始: {worker.stream} / {worker.consumer}')
+        worker.run()
+        self.stdout.write(self.style.SUCCESS(f'受信キューワーカー終了: {worker.stats}'))
+        self.stdout.write(f'重複抑止: {dedup.get_stats()}')
@@ -0,0 +1,278 @@
+"""
+MQTT C2S 直接受信（Lambda → HTTP を経由しない取り込み）
+
+メーターは {meter_id}C2S トピックに送信する（S2C は {meter_id}S2C）。
+共有サブスクリプション（$share/<group>/<filter>）で購読し、
+受信メッセージをまとめて ingest_packets() に渡す。
+
+複数プロセスで起動すると、ブローカーが同じグループ内でメッセージを振り分ける。
+
+QoS1 のメッセージは保存後にACKする。永続セッション（clean_session=False）で接続するため、
+保存できずにACKしなかったメッセージは再接続後にブローカーから再送される。
+再試行しても保存できないバッチは1件ずつ保存し直し、それでも保存できないメッセージはログに残してACKする
+（同じメッセージが再送され続けて取り込みが止まらないように）。
+DB接続エラーで保存できない場合は接続し直し、未ACKのメッセージで送信ウィンドウ（inflight）が埋まったままにしない。
+"""
+from django.db import InterfaceError, OperationalError, close_old_connections
+import logging
+import queue
+import threading
+import time
+
+from app.meters.ingest import ingest_packets
+
+logger = logging.getLogger(__name__)
+
+C2S_SUFFIX = 'C2S'
+
+# DB停止・接続断とみなすエラー（メッセージをACKせず、接続し直して再送させる）
+OUTAGE_ERRORS = (OperationalError, InterfaceError)
+
+
+def topic_to_meter_id(topic: str):
+    """{meter_id}C2S トピックからメーターIDを取り出す（対象外はNone）"""
+    name = topic.rsplit('/', 1)[-1]
+    if not name.endswith(C2S_SUFFIX) or len(name) == len(C2S_SUFFIX):
+        return None
+    return name[:-len(C2S_SUFFIX)]
+
+
+def shared_topic(group: str, topic_filter: str) -> str:
+    if not group:
+        return topic_filter
+    return f'$share/{group}/{topic_filter}'
+
+
+class MicroBatcher:
+    """
+    受信メッセージのマイクロバッチ処理
+
+    max_batch 件たまるか、最初のメッセージから max_wait_ms 経過した時点で
+    まとめて ingest_packets() に渡す。受信スレッド（MQTTのネットワークループ）からは
+    put() のみを呼び出し、DB処理は run() を実行するスレッドで行う。
+    """
+
+    def __init__(self, max_batch=500, max_wait_ms=200, on_flushed=None, ingest=ingest_packets,
+                 max_retries=3, retry_wait=1.0, on_failed=None):
+        self.max_batch = max_batch
+        self.max_wait = max_wait_ms / 1000
+        self.on_flushed = on_flushed
+        self.ingest = ingest
+        self.max_retries = max_retries
+        self.retry_wait = retry_wait
+        self.on_failed = on_failed
+        self.queue = queue.Queue()
+        self.stop_event = threading.Event()
+        self.stats = {'received': 0, 'flushed': 0, 'batches': 0, 'errors': 0, 'dropped': 0}
+
+    def put(self, meter_id, payload_hex, ack=None):
+        self.stats['received'] += 1
+        self.queue.put((meter_id, payload_hex, ack))
+
+    def stop(self):
+        self.stop_event.set()
+
+    def collect(self) -> list:
+        """1バッチ分のメッセージを取り出す"""
+        try:
+            first = self.queue.get(timeout=self.max_wait)
+        except queue.Empty:
+            return []
+
+        messages = [first]
+        deadline = time.monotonic() + self.max_wait
+        while len(messages) < self.max_batch:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                messages.append(self.queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return messages
+
+    def flush(self, messages) -> list:
+        if not messages:
+            return []
+
+        items = [{'meter_id': meter_id, 'payload': payload_hex} for meter_id, payload_hex, _ in messages]
+        started = time.monotonic()
+        results = self.ingest_with_retry(items)
+        if results is None:
+            self.stats['errors'] += 1
+            results = self.ingest_individually(items)
+        if results is None:
+            # DB停止などで保存できない場合はACKせず、接続し直してブローカーから再送させる
+            if self.on_failed:
+                self.on_failed()
+            return []
+
+        for _, _, ack in messages:
+            if ack:
+                ack()
+
+        self.stats['flushed'] += len(items)
+        self.stats['batches'] += 1
+        logger.info(f'MQTT ingest flushed {len(items)} items in {(time.monotonic() - started) * 1000:.1f}ms')
+
+        if self.on_flushed:
+            self.on_flushed(results)
+        return results
+
+    def ingest_with_retry(self, items):
+        """保存（DB停止・接続断は max_retries 回まで再試行、失敗時は None）"""
+        for attempt in range(self.max_retries + 1):
+            try:
+                close_old_connections()
+                return self.ingest(items)
+            except OUTAGE_ERRORS as e:
+                logger.error(f'MQTT ingest batch failed ({len(items)} items, attempt {attempt + 1}): {e}')
+                if attempt < self.max_retries and not self.stop_event.is_set():
+                    time.sleep(self.retry_wait * 2 ** attempt)
+            except Exception as e:
+                logger.error(f'MQTT ingest batch failed ({len(items)} items): {e}')
+                return None
+        return None
+
+    def ingest_individually(self, items):
+        """
+        1件ずつ保存（バッチ全体の保存に失敗した場合）
+
+        保存できないメッセージはログに残して破棄する（ACKして再送させない）。
+        DB停止・接続断（OUTAGE_ERRORS）の場合は None を返す。
+        """
+        results = []
+        for index, item in enumerate(items):
+            try:
+                close_old_connections()
+                result = self.ingest([item])[0]
+            except OUTAGE_ERRORS as e:
+                logger.error(f'MQTT ingest unavailable: {e}')
+                return None
+            except Exception as e:
+                logger.error(
+                    f'MQTT ingest dropped message from {item["meter_id"]}: {e} payload={item["payload"]}'
+                )
+                self.stats['dropped'] += 1
+                result = {'meter_id': item['meter_id'], 'error': 'ingest failed'}
+            results.append({**result, 'index': index})
+        return results
+
+    def drain(self):
+        """キューに残っているメッセージをすべて処理"""
+        while True:
+            messages = []
+            while len(messages) < self.max_batch:
+                try:
+                    messages.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+            if not messages:
+                return
+            self.flush(messages)
+
+    def run(self):
+        while not self.stop_event.is_set():
+            self.flush(self.collect())
+        self.drain()
+
+
+def create_client(client_id, manual_ack=True, clean_session=False):
+    """
+    paho-mqtt クライアント生成（1.x / 2.x 両対応）
+
+    clean_session=False（永続セッション）の場合、未ACKの QoS1 メッセージは再接続後に再送される。
+    永続セッションは client_id 単位のため、再起動しても同じ client_id を使うこと。
+    """
+    import paho.mqtt.client as mqtt
+
+    if hasattr(mqtt, 'CallbackAPIVersion'):
+        return mqtt.Client(
+            mqtt.CallbackAPIVersion.VERSION2,
+            client_id=client_id,
+            clean_session=clean_session,
+            manual_ack=manual_ack,
+        )
+    return mqtt.Client(client_id=client_id, clean_session=clean_session)
+
+
+class MqttIngestService:
+    """C2Sトピックを購読して MicroBatcher に渡す"""
+
+    def __init__(self, batcher, topic, qos=1, payload_format='binary', client=None, client_id='',
+                 manual_ack=True, clean_session=False):
+        self.batcher = batcher
+        self.topic = topic
+        self.qos = qos
+        self.payload_format = payload_format
+        self.client = client or create_client(client_id, manual_ack, clean_session)
+        # paho-mqtt 1.x は手動ACK非対応（受信時に自動ACK）
+        self.manual_ack = manual_ack and hasattr(self.client, 'ack')
+        # 接続ごとの番号（message id は接続ごとに振られるため、前の接続で受信したメッセージはACKしない）
+        self.generation = 0
+        self.connect_args = None
+        batcher.on_failed = self.reconnect
+
+        self.client.on_connect = self.on_connect
+        self.client.on_disconnect = self.on_disconnect
+        self.client.on_message = self.on_message
+
+    def on_connect(self, client, userdata, flags, reason_code, *args):
+        logger.info(f'MQTT connected ({reason_code}), subscribing {self.topic}')
+        client.subscribe(self.topic, qos=self.qos)
+
+    def on_disconnect(self, client, userdata, *args):
+        logger.warning(f'MQTT disconnected: {args}')
+
+    def on_message(self, client, userdata, message):
+        meter_id = topic_to_meter_id(message.topic)
+        if not meter_id:
+            self.ack(message)
+            return
+
+        if self.payload_format == 'hex':
+            payload_hex = message.payload.decode('ascii', errors='replace').strip()
+        else:
+            payload_hex = message.payload.hex().upper()
+
+        generation = self.generation
+        self.batcher.put(meter_id, payload_hex, ack=lambda: self.ack(message, generation))
+
+    def ack(self, message, generation=None):
+        if generation is not None and generation != self.generation:
+            # 再接続前に受信したメッセージ（ブローカーから再送されるため、重複抑止で除外される）
+            return
+        if self.manual_ack and message.qos > 0:
+            self.client.ack(message.mid, message.qos)
+
+    def reconnect(self):
+        """
+        保存に失敗した後に接続し直す
+
+        未ACKのメッセージは永続セッションに残り、再接続後に再送される。
+        接続し直さないと未ACKのメッセージが送信ウィンドウを使い続け、購読が止まることがある。
+        """
+        logger.warning('MQTT reconnecting after failed ingest batch')
+        self.generation += 1
+        self.client.disconnect()
+        self.client.loop_stop()
+        host, port, keepalive = self.connect_args
+        self.client.connect_async(host, port, keepalive)
+        self.client.loop_start()
+
+    def connect(self, host, port=8883, keepalive=60, username=None, password=None,
+                ca_certs=None, certfile=None, keyfile=None):
+        if username:
+            self.client.username_pw_set(username, password)
+        if ca_certs or certfile:
+            self.client.tls_set(ca_certs=ca_certs, certfile=certfile, keyfile=keyfile)
+        self.connect_args = (host, port, keepalive)
+        self.client.connect(host, port, keepalive)
+
+    def run_forever(self):
+        self.client.loop_start()
+        try:
+            self.batcher.run()
+        finally:
+            self.client.loop_stop()
+            self.client.disconnect()
@@ -9,12 +9,12 @@ from rest_framework.permissions import AllowAny
 from django.conf import settings
 from django.utils import timezone
 import logging
-import secrets
 
 from app.meters.models import Meter
-from app.readings.models import MeterReading, MeterEvent
+from app.readings.models import MeterEvent
+from app.readings.raw_data import raw_fields
 from app.keys.models import MeterKey
-from app.keys.crypto import decrypt_hex, try_decrypt, DEFAULT_KEY
+from app.keys import key_cache
 from app.keys.protocol import (
     MessageParser,
     get_packet_type,
@@ -22,32 +22,46 @@ from app.keys.protocol import (
     PACKET_TYPE_INSTANT,
     PACKET_TYPE_INTERVAL,
     PACKET_TYPE_EVENT,
+    PACKET_TYPE_MULTI,
+    PACKET_TYPE_NAMES,
 )
-from app.keys.mqtt_service import (
-    send_key_response_new, send_key_response_reconnect, send_key_confirm
+from app.meters import dedup, receive_queue
+from app.meters.instrumentation import NULL_TRACE, start_trace, is_enabled, recorder
+from app.meters.ingest import (
+    InvalidRecord,
+    ReceiveBatch,
+    handle_key_exchange,
+    ingest_packets,
+    validate_event,
 )
 
 logger = logging.getLogger(__name__)
 
 
-def generate_key() -> str:
-    """16文字のランダムキーを生成（ASCII印字可能文字）"""
-    chars = ''.join(chr(i) for i in range(0x21, 0x7F))
-    return ''.join(secrets.choice(chars) for _ in range(16))
-
-
 class MeterReceiveView(APIView):
     """
     メーターデータ受信エンドポイント
     POST /api/meters/receive/
     """
     permission_classes = [AllowAny]
+    trace_label = 'unknown'
+    trace = NULL_TRACE
     
-    def post(self, request):
-        # Lambda認証
+    def dispatch(self, request, *args, **kwargs):
+        # ステージ別計測（RECEIVE_TIMING_ENABLED=False の場合は何もしない）
+        self.trace = start_trace(self.trace_label)
+        with self.trace:
+            response = super().dispatch(request, *args, **kwargs)
+        return self.trace.apply_header(response)
+    
+    def is_authorized(self, request):
+        """Lambda認証"""
         api_key = request.headers.get('X-API-Key', '')
         expected_key = getattr(settings, 'LAMBDA_API_KEY', '')
-        if expected_key and api_key != expected_key:
+        return not expected_key or api_key == expected_key
+    
+    def post(self, request):
+        if not self.is_authorized(request):
             return Response({'error': 'unauthorized'}, status=status.HTTP_401_UNAUTHORIZED)
         
         meter_id = request.data.get('meter_id', '')
@@ -58,35 +72,34 @@ class MeterReceiveView(APIView):
         
         logger.info(f'Received data from {meter_id}: {payload_hex[:50]}...')
         
+        # 非同期受付モード（鍵交換以外はキューに追加して即時応答）
+        if getattr(settings, 'RECEIVE_ASYNC_MODE', False):
+            response = self.accept_async(meter_id, payload_hex)
+            if response is not None:
+                return response
+        
+        # 復号試行（キャッシュした鍵で、前回成功した鍵から試す）
+        decrypted_hex, used_key = self.decrypt(meter_id, payload_hex)
+        
+        # 再送された電文は保存済みのため、DBに触れずに応答する
+        with self.trace.span('dedup'):
+            dedup_key = dedup.packet_key(meter_id, decrypted_hex) if decrypted_hex else None
+            duplicate = dedup.is_duplicate(dedup_key)
+        if duplicate:
+            logger.info(f'Duplicate packet from {meter_id}')
+            self.trace.set_label('duplicate')
+            return Response({'status': 'duplicate'})
+        
         # メーター取得または作成
-        meter, created = Meter.objects.get_or_create(
-            meter_id=meter_id,
-            defaults={'status': 'pending'}
-        )
+        with self.trace.span('meter'):
+            meter, created = Meter.objects.get_or_create(
+                meter_id=meter_id,
+                defaults={'status': 'pending'}
+            )
         
         if created:
             logger.info(f'New meter registered: {meter_id}')
         
-        # 鍵取得
-        try:
-            meter_key = MeterKey.objects.get(meter=meter)
-        except MeterKey.DoesNotExist:
-            meter_key = None
-        
-        # 復号試行
-        if meter_key:
-            keys_to_try = [
-                ('data_key', meter_key.data_key),
-                ('master_key', meter_key.master_key),
-                ('default_key', DEFAULT_KEY),
-            ]
-        else:
-            keys_to_try = [
-                ('default_key', DEFAULT_KEY),
-            ]
-        
-        decrypted_hex, used_key = try_decrypt(payload_hex, keys_to_try)
-        
         if not decrypted_hex:
             logger.error(f'Failed to decrypt data from {meter_id}')
             return Response({'error': 'decryption failed'}, status=status.HTTP_400_BAD_REQUEST)
@@ -96,14 +109,20 @@ class MeterReceiveView(APIView):
         # パケットタイプ判定
         packet_type = get_packet_type(decrypted_hex)
         logger.info(f'Packet type: {packet_type}')
+        self.trace.set_label(PACKET_TYPE_NAMES.get(packet_type, 'unknown'))
         
         # パケットタイプ別処理
         if packet_type == PACKET_TYPE_KEY_EXCHANGE:
-            return self.handle_key_exchange(meter, meter_key, decrypted_hex, used_key)
+            with self.trace.span('key_lookup'):
+                meter_key = MeterKey.objects.filter(meter=meter).first()
+            with self.trace.span('key_exchange'):
+                return self.handle_key_exchange(meter, meter_key, decrypted_hex, used_key)
         elif packet_type in (PACKET_TYPE_INSTANT, PACKET_TYPE_INTERVAL):
-            return self.handle_interval_data(meter, decrypted_hex)
+            response = self.handle_interval_data(meter, decrypted_hex)
         elif packet_type == PACKET_TYPE_EVENT:
-            return self.handle_event_log(meter, decrypted_hex)
+            response = self.handle_event_log(meter, decrypted_hex)
+        elif packet_type == PACKET_TYPE_MULTI:
+            response = self.handle_multi_packet(meter, decrypted_hex)
         else:
             logger.warning(f'Unknown packet type: {packet_type}')
             return Response({
@@ -111,115 +130,81 @@ class MeterReceiveView(APIView):
                 'packet_type': packet_type,
                 'hex_preview': decrypted_hex[:32],
             })
+        
+        if response.status_code == status.HTTP_200_OK:
+            with self.trace.span('dedup'):
+                dedup.mark([dedup_key])
+        return response
     
-    def handle_key_exchange(self, meter, meter_key, decrypted_hex, used_key):
-        """鍵交換処理"""
-        parser = MessageParser(decrypted_hex)
-        data = parser.parse_key_exchange()
-        param = data['parameter']
-        
-        logger.info(f'Key exchange from {meter.meter_id}: type={data["type"]}, param={param}')
-        
-        if param == 0:
-            # 新規登録
-            if used_key != 'default_key':
-                logger.warning(f'New registration but not using default key')
-            
-            master_key = generate_key()
-            data_key = generate_key()
-            
-            if meter_key:
-                meter_key.master_key = master_key
-                meter_key.data_key = data_key
-                meter_key.key_version += 1
-                meter_key.save()
-            else:
-                meter_key = MeterKey.objects.create(
-                    meter=meter,
-                    master_key=master_key,
-                    data_key=data_key,
-                )
-            
-            success = send_key_response_new(meter.meter_id, master_key, data_key)
-            
-            return Response({
-                'status': 'key_exchange_initiated',
-                'type': 'new_registration',
-                'response_sent': success,
-            })
+    def decrypt(self, meter_id, payload_hex):
+        """
+        鍵の取得（key_lookup）と復号（decrypt）を分けて計測して復号
+
+        キャッシュの鍵で復号できずDBから鍵を再取得した場合、再取得は decrypt に含まれる。
+        """
+        with self.trace.span('key_lookup'):
+            entry = key_cache.get_entry(meter_id)
+        with self.trace.span('decrypt'):
+            return key_cache.decrypt_for_meter(meter_id, payload_hex, entry=entry)
+    
+    def accept_async(self, meter_id, payload_hex):
+        """
+        受信データをキューに追加して202を返す
+        鍵交換パケットはメーターがS2C応答を待っているため、Noneを返して同期処理させる
+        """
+        decrypted_hex, _ = self.decrypt(meter_id, payload_hex)
         
-        elif param == 1:
-            # 再接続
-            if not meter_key:
-                logger.error(f'Reconnection but no key found for {meter.meter_id}')
-                return Response({'error': 'no key found'}, status=status.HTTP_400_BAD_REQUEST)
-            
-            new_data_key = generate_key()
-            
-            meter_key.data_key = new_data_key
-            meter_key.key_version += 1
-            meter_key.last_key_exchange = timezone.now()
-            meter_key.save()
-            
-            success = send_key_response_reconnect(
-                meter.meter_id, new_data_key, meter_key.master_key
-            )
-            
-            return Response({
-                'status': 'key_exchange_initiated',
-                'type': 'reconnection',
-                'response_sent': success,
-            })
+        if not decrypted_hex:
+            logger.error(f'Failed to decrypt data from {meter_id}')
+            return Response({'error': 'decryption failed'}, status=status.HTTP_400_BAD_REQUEST)
         
-        elif param == 2:
-            # ACK
-            if meter_key:
-                if not meter_key.registered_at:
-                    meter_key.registered_at = timezone.now()
-                meter_key.last_key_exchange = timezone.now()
-                meter_key.save()
-            
-            meter.status = 'active'
-            meter.registered_at = meter.registered_at or timezone.now()
-            meter.save()
-            
-            if meter_key:
-                send_key_confirm(meter.meter_id, meter_key.data_key)
-            
-            return Response({
-                'status': 'key_exchange_completed',
-            })
+        if get_packet_type(decrypted_hex) == PACKET_TYPE_KEY_EXCHANGE:
+            return None
+        
+        # 保存済みの記録はワーカーが保存成功後に行う
+        with self.trace.span('dedup'):
+            duplicate = dedup.is_duplicate(dedup.packet_key(meter_id, decrypted_hex))
+        if duplicate:
+            logger.info(f'Duplicate packet from {meter_id}')
+            self.trace.set_label('duplicate')
+            return Response({'status': 'duplicate'})
         
-        return Response({'status': 'unknown_key_exchange_type'})
+        try:
+            with self.trace.span('enqueue'):
+                message_id = receive_queue.enqueue(meter_id, payload_hex)
+        except Exception as e:
+            logger.warning(f'Failed to enqueue data from {meter_id}, processing synchronously: {e}')
+            return None
+        
+        self.trace.set_label('async')
+        return Response({
+            'status': 'accepted',
+            'message_id': message_id,
+        }, status=status.HTTP_202_ACCEPTED)
+    
+    def handle_key_exchange(self, meter, meter_key, decrypted_hex, used_key):
+        """鍵交換処理"""
+        data, status_code = handle_key_exchange(meter, meter_key, decrypted_hex, used_key)
+        return Response(data, status=status_code)
     
     def handle_interval_data(self, meter, decrypted_hex):
         """30分値/瞬時値データ処理"""
-        parser = MessageParser(decrypted_hex)
-        data = parser.parse_interval_data()
+        with self.trace.span('parse'):
+            parser = MessageParser(decrypted_hex)
+            data = parser.parse_interval_data()
         
         if not data['timestamp']:
             logger.error(f'Invalid timestamp in interval data')
             return Response({'error': 'invalid timestamp'}, status=status.HTTP_400_BAD_REQUEST)
         
-        reading_type = 'interval' if data['packet_type'] == PACKET_TYPE_INTERVAL else 'instant'
-        
-        reading, created = MeterReading.objects.update_or_create(
-            meter=meter,
-            timestamp=data['timestamp'],
-            reading_type=reading_type,
-            defaults={
-                'import_kwh': data['import_kwh'],
-                'export_kwh': data['export_kwh'],
-                'route_b_import_kwh': data['route_b_import_kwh'],
-                'route_b_export_kwh': data['route_b_export_kwh'],
-                'raw_data': decrypted_hex,
-            }
-        )
-        
-        meter.last_received_at = timezone.now()
-        if meter.status != 'active':
-            meter.status = 'active'
-        meter.save()
+        batch = ReceiveBatch(trace=self.trace)
+        key = batch.add_reading(meter, data, decrypted_hex)
+        reading_type = key[2]
+        
+        # 一意制約によるUPSERT（最終受信日時の更新を含む）
+        with self.trace.span('save'):
+            batch.flush()
+        created = key in batch.created_keys
         
         logger.info(f'Saved {reading_type} data: {meter.meter_id} @ {data["timestamp"]}')
         
@@ -234,17 +219,25 @@ class MeterReceiveView(APIView):
     
     def handle_event_log(self, meter, decrypted_hex):
         """イベントログ処理"""
-        parser = MessageParser(decrypted_hex)
-        data = parser.parse_event_log()
-        
-        event = MeterEvent.objects.create(
-            meter=meter,
-            timestamp=data['timestamp'] or timezone.now(),
-            record_no=data.get('record_no'),
-            event_code=data.get('event_code'),
-            import_kwh=data.get('import_kwh'),
-            raw_data=decrypted_hex,
-        )
+        with self.trace.span('parse'):
+            parser = MessageParser(decrypted_hex)
+            data = parser.parse_event_log()
+        
+        try:
+            validate_event(data)
+        except InvalidRecord as e:
+            logger.error(f'Invalid event log from {meter.meter_id}: {e}')
+            return Response({'error': f'invalid record: {e}'}, status=status.HTTP_400_BAD_REQUEST)
+        
+        with self.trace.span('save'):
+            event = MeterEvent.objects.create(
+                meter=meter,
+                timestamp=data['timestamp'] or timezone.now(),
+                record_no=data.get('record_no'),
+                event_code=data.get('event_code'),
+                import_kwh=data.get('import_kwh'),
+                **raw_fields(decrypted_hex),
+            )
         
         logger.info(f'Saved event: {meter.meter_id} - {data.get("event_code")}')
         
@@ -252,4 +245,91 @@ class MeterReceiveView(APIView):
             'status': 'saved',
             'event_id': event.id,
             'event_code': data.get('event_code'),
-        })
\ No newline at end of file
+        })
+    
+    def handle_multi_packet(self, meter, decrypted_hex):
+        """マルチパケット処理（含まれるレコードをまとめて保存）"""
+        with self.trace.span('parse'):
+            parser = MessageParser(decrypted_hex)
+            data = parser.parse_multi()
+        
+        batch = ReceiveBatch(trace=self.trace)
+        counts = batch.add_multi(meter, data)
+        with self.trace.span('save'):
+            batch.flush()
+        
+        logger.info(f'Saved multi-packet: {meter.meter_id} - {counts}')
+        
+        return Response({
+            'status': 'saved',
+            'record_count': data['record_count'],
+            **counts,
+        })
+
+
+class MeterBatchReceiveView(MeterReceiveView):
+    """
+    メーターデータ一括受信エンドポイント
+    POST /api/meters/receive/batch/
+    
+    リクエスト: {"items": [{"meter_id": "...", "payload": "..."}, ...]}
+    レスポンス: {"count": N, "results": [各パケットの処理結果, ...]}
+    """
+    trace_label = 'batch'
+    
+    def post(self, request):
+        if not self.is_authorized(request):
+            return Response({'error': 'unauthorized'}, status=status.HTTP_401_UNAUTHORIZED)
+        
+        items = request.data.get('items')
+        if not isinstance(items, list) or not items:
+            return Response({'error': 'missing items'}, status=status.HTTP_400_BAD_REQUEST)
+        
+        max_items = getattr(settings, 'RECEIVE_BATCH_MAX_ITEMS', 1000)
+        if len(items) > max_items:
+            return Response(
+                {'error': f'too many items (max {max_items})'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        logger.info(f'Received batch: {len(items)} items')
+        
+        with self.trace.span('ingest'):
+            results = ingest_packets(items)
+        
+        return Response({
+            'count': len(results),
+            'results': results,
+        })
+
+
+class ReceiveMetricsView(APIView):
+    """
+    受信処理の計測結果
+    GET /api/meters/receive/metrics/  集計結果（ローカルからのアクセスまたはLambda APIキーが必要）
+    DELETE /api/meters/receive/metrics/  集計リセット
+    """
+    permission_classes = [AllowAny]
+    
+    def is_authorized(self, request):
+        if request.META.get('REMOTE_ADDR') in ('127.0.0.1', '::1'):
+            return True
+        expected_key = getattr(settings, 'LAMBDA_API_KEY', '')
+        return bool(expected_key) and request.headers.get('X-API-Key', '') == expected_key
+    
+    def get(self, request):
+        if not self.is_authorized(request):
+            return Response({'error': 'forbidden'}, status=status.HTTP_403_FORBIDDEN)
+        
+        return Response({
+            'enabled': is_enabled(),
+            'timing': recorder.snapshot(),
+            'dedup': dedup.get_stats(),
+        })
+    
+    def delete(self, request):
+        if not self.is_authorized(request):
+            return Response({'error': 'forbidden'}, status=status.HTTP_403_FORBIDDEN)
+        
+        recorder.reset()
+        return Response({'status': 'reset'})
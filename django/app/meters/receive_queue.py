@@ -0,0 +1,216 @@
+"""
+メーターデータ受信キュー（非同期受付モード）
+
+RECEIVE_ASYNC_MODE=True の場合、受信APIは暗号文をRedis Streamに追加して
+202を返す。ワーカー（run_receive_worker）がコンシューマーグループで
+まとめて取り出し、ingest_packets() で保存する。
+"""
+from django.conf import settings
+from django.db import close_old_connections
+import logging
+import socket
+import time
+
+import redis
+
+from app.meters.ingest import ingest_packets
+
+logger = logging.getLogger(__name__)
+
+GROUP_NAME = 'ingest'
+
+_client = None
+
+
+def get_stream_name() -> str:
+    return getattr(settings, 'RECEIVE_QUEUE_STREAM', 'meter:receive')
+
+
+def get_dead_letter_stream_name() -> str:
+    return getattr(settings, 'RECEIVE_QUEUE_DEAD_LETTER_STREAM', 'meter:receive:dead')
+
+
+def get_redis():
+    global _client
+    if _client is None:
+        url = getattr(settings, 'RECEIVE_QUEUE_URL', '') or settings.CELERY_BROKER_URL
+        _client = redis.Redis.from_url(url)
+    return _client
+
+
+def enqueue(meter_id: str, payload_hex: str) -> str:
+    """受信データをキューに追加してメッセージIDを返す"""
+    message_id = get_redis().xadd(
+        get_stream_name(),
+        {'meter_id': meter_id, 'payload': payload_hex, 'received_at': str(time.time())},
+        maxlen=getattr(settings, 'RECEIVE_QUEUE_MAXLEN', 1000000),
+        approximate=True,
+    )
+    return message_id.decode() if isinstance(message_id, bytes) else message_id
+
+
+def _decode(value):
+    return value.decode() if isinstance(value, bytes) else value
+
+
+def to_item(fields) -> dict:
+    return {'meter_id': _decode(fields.get(b'meter_id', b'')), 'payload': _decode(fields.get(b'payload', b''))}
+
+
+class ReceiveQueueWorker:
+    """
+    受信キューのワーカー
+
+    XREADGROUP で最大 batch_size 件を取り出して一括保存し、XACK/XDEL する。
+    保存に失敗したメッセージは未ACKのまま残り、reclaim_idle_ms 経過後に
+    他のワーカー（または自身）が XAUTOCLAIM で引き取って再処理する。
+    配信回数が max_deliveries を超えたメッセージは1件ずつ保存し直し、
+    それでも失敗したものはデッドレターストリームに移してACKする（1件の不正データでバッチ全体が止まらないように）。
+    """
+
+    def __init__(self, consumer=None, batch_size=500, block_ms=1000, reclaim_idle_ms=60000,
+                 client=None, ingest=ingest_packets, max_deliveries=5):
+        self.consumer = consumer or f'{socket.gethostname()}-{id(self)}'
+        self.batch_size = batch_size
+        self.block_ms = block_ms
+        self.reclaim_idle_ms = reclaim_idle_ms
+        self.max_deliveries = max_deliveries
+        self.client = client or get_redis()
+        self.ingest = ingest
+        self.stream = get_stream_name()
+        self.dead_letter_stream = get_dead_letter_stream_name()
+        self.stopped = False
+        self.stats = {'processed': 0, 'batches': 0, 'errors': 0, 'reclaimed': 0, 'dead_lettered': 0}
+
+    def ensure_group(self):
+        try:
+            self.client.xgroup_create(self.stream, GROUP_NAME, id='0', mkstream=True)
+        except redis.ResponseError as e:
+            if 'BUSYGROUP' not in str(e):
+                raise
+
+    def read(self) -> list:
+        """新着メッセージを取り出す [(message_id, fields), ...]"""
+        response = self.client.xreadgroup(
+            GROUP_NAME,
+            self.consumer,
+            {self.stream: '>'},
+            count=self.batch_size,
+            block=self.block_ms,
+        )
+        if not response:
+            return []
+        return response[0][1]
+
+    def reclaim(self) -> list:
+        """処理が止まったワーカーの未ACKメッセージを引き取る"""
+        response = self.client.xautoclaim(
+            self.stream,
+            GROUP_NAME,
+            self.consumer,
+            min_idle_time=self.reclaim_idle_ms,
+            start_id='0-0',
+            count=self.batch_size,
+        )
+        messages = [m for m in response[1] if m[1]]
+        self.stats['reclaimed'] += len(messages)
+        return messages
+
+    def delivery_counts(self, messages) -> dict:
+        """{message_id: 配信回数}（XPENDING、XAUTOCLAIM で引き取った時点の回数）"""
+        message_ids = [message_id for message_id, _ in messages]
+        pending = self.client.xpending_range(
+            self.stream,
+            GROUP_NAME,
+            min=message_ids[0],
+            max=message_ids[-1],
+            count=len(message_ids),
+            consumername=self.consumer,
+        )
+        return {entry['message_id']: entry['times_delivered'] for entry in pending}
+
+    def split_exhausted(self, messages):
+        """配信回数が max_deliveries 以下のメッセージと、超えたメッセージに分ける"""
+        if not messages:
+            return [], []
+        counts = self.delivery_counts(messages)
+        retry = [m for m in messages if counts.get(m[0], 0) <= self.max_deliveries]
+        exhausted = [m for m in messages if counts.get(m[0], 0) > self.max_deliveries]
+        return retry, exhausted
+
+    def acknowledge(self, message_ids, dead_letters=()):
+        """ACK/削除（dead_letters はデッドレターストリームに追加してから）"""
+        pipe = self.client.pipeline()
+        for fields in dead_letters:
+            pipe.xadd(
+                self.dead_letter_stream,
+                fields,
+                maxlen=getattr(settings, 'RECEIVE_QUEUE_MAXLEN', 1000000),
+                approximate=True,
+            )
+        pipe.xack(self.stream, GROUP_NAME, *message_ids)
+        pipe.xdel(self.stream, *message_ids)
+        pipe.execute()
+
+    def process(self, messages) -> int:
+        if not messages:
+            return 0
+
+        message_ids = [message_id for message_id, _ in messages]
+        items = [to_item(fields) for _, fields in messages]
+
+        started = time.monotonic()
+        try:
+            close_old_connections()
+            self.ingest(items)
+        except Exception as e:
+            self.stats['errors'] += 1
+            logger.error(f'Receive queue batch failed ({len(items)} items): {e}')
+            return 0
+
+        self.acknowledge(message_ids)
+
+        self.stats['processed'] += len(items)
+        self.stats['batches'] += 1
+        logger.info(f'Receive queue processed {len(items)} items in {(time.monotonic() - started) * 1000:.1f}ms')
+        return len(items)
+
+    def process_individually(self, messages) -> int:
+        """1件ずつ保存し、失敗したメッセージはデッドレターストリームに移す"""
+        if not messages:
+            return 0
+
+        dead_letters = []
+        for message_id, fields in messages:
+            try:
+                close_old_connections()
+                self.ingest([to_item(fields)])
+            except Exception as e:
+                logger.error(f'Receive queue message {_decode(message_id)} moved to dead letter: {e}')
+                dead_letters.append({
+                    **fields,
+                    'message_id': message_id,
+                    'error': str(e)[:1000],
+                })
+
+        self.acknowledge([message_id for message_id, _ in messages], dead_letters)
+
+        processed = len(messages) - len(dead_letters)
+        self.stats['processed'] += processed
+        self.stats['dead_lettered'] += len(dead_letters)
+        return processed
+
+    def run_once(self) -> int:
+        retry, exhausted = self.split_exhausted(self.reclaim())
+        processed = self.process_individually(exhausted)
+        processed += self.process(retry)
+        processed += self.process(self.read())
+        return processed
+
+    def run(self):
+        self.ensure_group()
+        while not self.stopped:
+            self.run_once()
+
+    def stop(self):
+        self.stopped = True
@@ -0,0 +1,69 @@
+from django.db import IntegrityError
+from django.test import TestCase
+from unittest import mock
+
+from app.keys import key_cache
+from app.keys.crypto import encrypt_hex, DEFAULT_KEY
+from app.keys.protocol import EVENT_STRUCT, build_event_packet, build_interval_packet
+from app.meters import dedup, heartbeat
+from app.meters.ingest import ingest_packets
+from app.readings.bulk import bulk_upsert_readings
+from app.readings.models import MeterEvent, MeterReading
+
+GOOD_METER = 'T000000101'
+BAD_METER = 'T000000102'
+BASE_TS = 1790000000
+
+
+def interval_item(meter_id, i):
+    payload = build_interval_packet(meter_id, BASE_TS + i * 1800, 100 + i)
+    return {'meter_id': meter_id, 'payload': encrypt_hex(payload, DEFAULT_KEY)}
+
+
+def event_item(meter_id, plain_hex):
+    return {'meter_id': meter_id, 'payload': encrypt_hex(plain_hex, DEFAULT_KEY)}
+
+
+class IngestPacketsTest(TestCase):
+    """一括受信で不正なパケットがあっても他のパケットを保存する"""
+
+    def setUp(self):
+        key_cache.meter_key_cache.clear()
+        dedup.duplicate_filter.clear()
+        heartbeat.clear()
+
+    def test_invalid_events_do_not_roll_back_batch(self):
+        # イベントコード0（event_code=None）と、レコード番号以降が欠けたイベント（record_no=None）
+        zero_code = build_event_packet(GOOD_METER, BASE_TS, 0)
+        truncated = build_event_packet(GOOD_METER, BASE_TS + 60, 3)[:(EVENT_STRUCT.size - 4) * 2]
+        items = [interval_item(GOOD_METER, i) for i in range(3)] + [
+            event_item(GOOD_METER, zero_code),
+            event_item(GOOD_METER, truncated),
+        ]
+
+        results = ingest_packets(items)
+
+        self.assertEqual([r.get('status') for r in results[:3]], ['saved'] * 3)
+        self.assertTrue(all(r['created'] for r in results[:3]))
+        self.assertEqual(results[3]['error'], 'invalid record: missing event_code')
+        self.assertEqual(results[4]['error'], 'invalid record: missing record_no, event_code')
+        self.assertEqual(MeterReading.objects.filter(meter__meter_id=GOOD_METER).count(), 3)
+        self.assertEqual(MeterEvent.objects.count(), 0)
+
+    def test_failed_bulk_save_falls_back_to_each_packet(self):
+        def failing_upsert(readings, *args, **kwargs):
+            readings = list(readings)
+            if any(r.meter.meter_id == BAD_METER for r in readings):
+                raise IntegrityError('simulated failure')
+            return bulk_upsert_readings(readings, *args, **kwargs)
+
+        items = [interval_item(GOOD_METER, 0), interval_item(BAD_METER, 0), interval_item(GOOD_METER, 1)]
+        with mock.patch('app.meters.ingest.bulk_upsert_readings', side_effect=failing_upsert):
+            results = ingest_packets(items)
+
+        self.assertEqual(results[0]['status'], 'saved')
+        self.assertEqual(results[1]['error'], 'save failed')
+        self.assertNotIn('status', results[1])
+        self.assertEqual(results[2]['status'], 'saved')
+        self.assertEqual(MeterReading.objects.filter(meter__meter_id=GOOD_METER).count(), 2)
+        self.assertEqual(MeterReading.objects.filter(meter__meter_id=BAD_METER).count(), 0)
@@ -0,0 +1,98 @@
+"""
+件数上限・TTL付きキャッシュ
+
+メーター暗号鍵キャッシュ（app/keys/key_cache.py）と重複パケット抑止（app/meters/dedup.py）で共用する。
+
+- プロセス内キャッシュ: 件数上限（LRU）とTTLで破棄
+- 共有キャッシュ（任意）: settings.CACHES の指定エイリアスを利用（複数プロセス間で共有）
+
+共有キャッシュの障害時は警告を出してプロセス内キャッシュのみで動作する。
+"""
+from collections import OrderedDict
+from django.core.cache import caches
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class TTLCache:
+    """件数上限（LRU）・TTL付きのプロセス内キャッシュ（共有キャッシュを併用可）"""
+
+    def __init__(self, max_size=10000, ttl=300, shared_alias=None, key_prefix='', name='ttl'):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.shared_alias = shared_alias
+        self.key_prefix = key_prefix
+        self.name = name
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.stats = {'hits': 0, 'shared_hits': 0, 'misses': 0}
+
+    @property
+    def shared(self):
+        return caches[self.shared_alias] if self.shared_alias else None
+
+    def get(self, key):
+        """値を返す（ないか期限切れの場合は None）"""
+        now = time.monotonic()
+        with self._lock:
+            item = self._entries.get(key)
+            if item is not None:
+                expires_at, value = item
+                if expires_at > now:
+                    self._entries.move_to_end(key)
+                    self.stats['hits'] += 1
+                    return value
+                del self._entries[key]
+
+        if self.shared is not None:
+            try:
+                value = self.shared.get(self.key_prefix + key)
+            except Exception as e:
+                logger.warning(f'Shared {self.name} cache get failed: {e}')
+                value = None
+            if value is not None:
+                self._set_local({key: value})
+                self.stats['shared_hits'] += 1
+                return value
+
+        self.stats['misses'] += 1
+        return None
+
+    def set(self, key, value):
+        self.set_many({key: value})
+
+    def set_many(self, mapping):
+        if not mapping:
+            return
+        self._set_local(mapping)
+        if self.shared is not None:
+            try:
+                self.shared.set_many({self.key_prefix + key: value for key, value in mapping.items()}, self.ttl)
+            except Exception as e:
+                logger.warning(f'Shared {self.name} cache set failed: {e}')
+
+    def delete(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+        if self.shared is not None:
+            try:
+                self.shared.delete(self.key_prefix + key)
+            except Exception as e:
+                logger.warning(f'Shared {self.name} cache delete failed: {e}')
+
+    def clear(self):
+        """プロセス内キャッシュを空にする（共有キャッシュはTTLで破棄）"""
+        with self._lock:
+            self._entries.clear()
+
+    def _set_local(self, mapping):
+        expires_at = time.monotonic() + self.ttl
+        with self._lock:
+            for key, value in mapping.items():
+                self._entries[key] = (expires_at, value)
+                self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
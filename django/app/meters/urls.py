@@ -15,7 +15,7 @@ from .views import (
     MeterExportView,
     SekouCustomerSearchView
 )
-from .receive_api import MeterReceiveView
+from .receive_api import MeterReceiveView, MeterBatchReceiveView, ReceiveMetricsView
 from .b_route_api import MeterBRouteCommandView
 
 urlpatterns = [
@@ -35,5 +35,7 @@ urlpatterns = [
     path('sekou/customers/', SekouCustomerSearchView.as_view()),
 
     path('receive/', MeterReceiveView.as_view()),  # Lambda受信
+    path('receive/batch/', MeterBatchReceiveView.as_view()),  # Lambda一括受信
+    path('receive/metrics/', ReceiveMetricsView.as_view()),  # 受信処理の計測結果
     path('<int:pk>/b-route/send/', MeterBRouteCommandView.as_view()),
 ]
\ No newline at end of file
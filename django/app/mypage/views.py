@@ -1,15 +1,15 @@
 import jwt
 from datetime import datetime, timedelta
-from decimal import Decimal
 
 from django.conf import settings
+from django.utils import timezone
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework.permissions import AllowAny
 from rest_framework import status
 
 from app.meters.models import MeterAssignment
-from app.readings.models import MeterReading, DailySummary, MonthlySummary
+from app.readings.models import DailySummary, HourlySummary, MonthlySummary
 
 
 class CustomerAuthMixin:
@@ -77,46 +77,23 @@ class MypageReadingsView(CustomerAuthMixin, APIView):
         return Response(data)
 
     def _get_daily_data(self, meter, target_date):
-        """日次: 時間ごとのデータ（24時間）"""
-        start = datetime.combine(target_date, datetime.min.time())
-        end = start + timedelta(days=1)
-
-        readings = list(MeterReading.objects.filter(
-            meter=meter,
-            timestamp__gte=start,
-            timestamp__lt=end,
-            reading_type='interval'
-        ).order_by('timestamp'))
-
-        hourly_data = {}
-        prev = None
-        
-        for r in readings:
-            hour = r.timestamp.hour
-            if hour not in hourly_data:
-                hourly_data[hour] = {'gen': Decimal('0'), 'exp': Decimal('0')}
-            
-            if prev and r.reading_kwh and prev.reading_kwh:
-                diff = r.reading_kwh - prev.reading_kwh
-                if diff > 0:
-                    hourly_data[hour]['gen'] += diff
-            
-            if prev and r.grid_export_kwh and prev.grid_export_kwh:
-                diff = r.grid_export_kwh - prev.grid_export_kwh
-                if diff > 0:
-                    hourly_data[hour]['exp'] += diff
-            
-            prev = r
+        """日次: 時間ごとのデータ（24時間、時間別集計から取得）"""
+        summaries = {
+            timezone.localtime(s.hour).hour: s
+            for s in HourlySummary.objects.filter(meter=meter, date=target_date)
+        }
 
         chart = []
         for i in range(24):
-            gen = float(hourly_data.get(i, {}).get('gen', 0))
-            exp = float(hourly_data.get(i, {}).get('exp', 0))
+            s = summaries.get(i)
+            gen = float(s.generation_kwh or 0) if s else 0
+            exp = float(s.export_kwh or 0) if s else 0
+            self_c = float(s.self_consumption_kwh or 0) if s else max(0, gen - exp)
             chart.append({
                 'label': str(i),
                 'generation': round(gen, 2),
                 'export': round(exp, 2),
-                'self_consumption': round(max(0, gen - exp), 2)
+                'self_consumption': round(self_c, 2)
             })
 
         return {
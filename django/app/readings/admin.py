@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import MeterReading, MeterEvent, DailySummary, MonthlySummary
+from .models import MeterReading, MeterEvent, DailySummary, HourlySummary, MonthlySummary, ReaggregationCheckpoint
 
 
 @admin.register(MeterReading)
@@ -8,6 +8,11 @@ class MeterReadingAdmin(admin.ModelAdmin):
     list_filter = ['meter', 'timestamp', 'reading_type']
     search_fields = ['meter__meter_id']
     ordering = ['-timestamp']
+    readonly_fields = ['raw_hex']
+
+    @admin.display(description='生データ(HEX)')
+    def raw_hex(self, obj):
+        return obj.raw_hex
 
 
 @admin.register(MeterEvent)
@@ -16,19 +21,39 @@ class MeterEventAdmin(admin.ModelAdmin):
     list_filter = ['event_code', 'timestamp']
     search_fields = ['meter__meter_id']
     ordering = ['-timestamp']
+    readonly_fields = ['raw_hex']
+
+    @admin.display(description='生データ(HEX)')
+    def raw_hex(self, obj):
+        return obj.raw_hex
 
 
 @admin.register(DailySummary)
 class DailySummaryAdmin(admin.ModelAdmin):
-    list_display = ['meter', 'date', 'generation_kwh', 'export_kwh', 'self_consumption_kwh', 'grid_import_kwh', 'record_count']
-    list_filter = ['meter', 'date']
+    list_display = ['meter', 'date', 'generation_kwh', 'export_kwh', 'self_consumption_kwh', 'grid_import_kwh', 'record_count', 'is_dirty']
+    list_filter = ['meter', 'date', 'is_dirty']
     search_fields = ['meter__meter_id']
     ordering = ['-date']
 
 
+@admin.register(HourlySummary)
+class HourlySummaryAdmin(admin.ModelAdmin):
+    list_display = ['meter', 'hour', 'generation_kwh', 'export_kwh', 'self_consumption_kwh', 'grid_import_kwh', 'record_count']
+    list_filter = ['date']
+    search_fields = ['meter__meter_id']
+    ordering = ['-hour']
+
+
 @admin.register(MonthlySummary)
 class MonthlySummaryAdmin(admin.ModelAdmin):
     list_display = ['meter', 'year_month', 'generation_kwh', 'export_kwh', 'self_consumption_kwh', 'grid_import_kwh']
     list_filter = ['meter', 'year_month']
     search_fields = ['meter__meter_id']
-    ordering = ['-year_month']
\ No newline at end of file
+    ordering = ['-year_month']
+
+
+@admin.register(ReaggregationCheckpoint)
+class ReaggregationCheckpointAdmin(admin.ModelAdmin):
+    list_display = ['key', 'status', 'daily_completed_through', 'monthly_completed_through', 'rows_processed', 'updated_at']
+    list_filter = ['status']
+    ordering = ['-updated_at']
@@ -0,0 +1,509 @@
+"""
+日次集計エンジン
+
+対象日の全メーター分を集合演算でまとめて集計する。
+
+1. 対象日と前日の「日ごとの最終レコード」とレコード数をウィンドウ関数で1回で取得
+2. 前日にデータがないメーターのみ、それ以前の最終レコードを追加で取得
+3. 累積値の差分を計算し、DailySummary を一括UPSERT
+4. 同じく時間帯ごとの最終レコードから HourlySummary を一括UPSERT
+
+メーター数に関係なくSQL発行数はほぼ一定（チャンク数分）になる。
+
+受信時には update_running_summaries() で当日分（日次・時間別）を逐次更新する。
+前日の集計がない・過去日のデータが遅れて届いたなど逐次更新では確定できない日は
+is_dirty を立て、aggregate_dirty_summaries() で該当の (meter, date) のみ再集計する。
+前日分は毎日 aggregate_daily で全メーターを再集計し、逐次更新の結果を確定させる。
+
+受信処理と再集計が同じメーターの集計を同時に書き換えないよう、
+どちらも Meter 行をID順にロック（lock_meters）してから集計行を読み書きする。
+"""
+from datetime import date, timedelta, timezone as dt_timezone
+from decimal import Decimal
+from django.db import transaction
+from django.db.models import Count, F, Max, Min, Q, Sum, Window
+from django.db.models.functions import FirstValue, RowNumber, TruncHour
+from django.utils import timezone
+import logging
+
+from app.meters.models import Meter
+from app.readings.models import MeterReading, DailySummary, HourlySummary, MonthlySummary, local_date_range_q
+from app.readings.bulk import (
+    bulk_upsert_daily_summaries, bulk_upsert_hourly_summaries, bulk_upsert_monthly_summaries,
+)
+
+logger = logging.getLogger(__name__)
+
+# 集計に使う累積値
+CUMULATIVE_FIELDS = ['import_kwh', 'route_b_export_kwh', 'route_b_import_kwh']
+
+# 前日より前の最終レコードを探す際の1クエリあたりのメーター数
+FALLBACK_CHUNK_SIZE = 500
+
+ONE_DAY = timedelta(days=1)
+
+
+def latest_readings(queryset) -> dict:
+    """
+    (meter_id, local_date) ごとの最終レコード・最初のレコードとレコード数
+
+    Returns:
+        {(meter_id, local_date): {'import_kwh': 最終値, ..., 'first_import_kwh': 最初の値, ...,
+                                  'first_reading_at': ..., 'last_reading_at': ..., 'record_count': n}}
+    """
+    partition = [F('meter_id'), F('local_date')]
+    first_values = {
+        f'first_{field}': Window(FirstValue(field), partition_by=partition, order_by=[F('timestamp').asc(), F('id').asc()])
+        for field in CUMULATIVE_FIELDS
+    }
+    rows = (
+        queryset
+        .annotate(
+            row_no=Window(RowNumber(), partition_by=partition, order_by=[F('timestamp').desc(), F('id').desc()]),
+            record_count=Window(Count('id'), partition_by=partition),
+            first_reading_at=Window(Min('timestamp'), partition_by=partition),
+            last_reading_at=F('timestamp'),
+            **first_values,
+        )
+        .filter(row_no=1)
+        .values(
+            'meter_id', 'local_date', 'record_count', 'first_reading_at', 'last_reading_at',
+            *CUMULATIVE_FIELDS, *first_values,
+        )
+    )
+    return {(row['meter_id'], row['local_date']): row for row in rows}
+
+
+def hourly_latest_readings(queryset) -> dict:
+    """
+    (meter_id, 時間帯) ごとの最終レコードとレコード数
+
+    JSTはUTCと時単位でずれるため、時間帯はUTCで切り捨てる（MySQLで CONVERT_TZ を使わずに済む）。
+
+    Returns:
+        {meter_id: {時間帯の開始日時: {'import_kwh': 最終値, ..., 'record_count': n, 'last_reading_at': ...}}}
+    """
+    hour_start = TruncHour('timestamp', tzinfo=dt_timezone.utc)
+    partition = [F('meter_id'), hour_start]
+    rows = (
+        queryset
+        .annotate(
+            hour_start=hour_start,
+            row_no=Window(RowNumber(), partition_by=partition, order_by=[F('timestamp').desc(), F('id').desc()]),
+            record_count=Window(Count('id'), partition_by=partition),
+            last_reading_at=F('timestamp'),
+        )
+        .filter(row_no=1)
+        .values('meter_id', 'hour_start', 'record_count', 'last_reading_at', *CUMULATIVE_FIELDS)
+    )
+    result = {}
+    for row in rows:
+        result.setdefault(row['meter_id'], {})[row['hour_start']] = row
+    return result
+
+
+def lock_meters(meter_ids=None, id_range=None) -> list:
+    """
+    Meter 行をID順にロック（トランザクション内で呼ぶ）
+
+    新しい日の DailySummary / HourlySummary はまだ行がなく select_for_update でロックできず、
+    READ COMMITTED ではギャップロックも取られないため、常に存在する Meter 行で直列化する。
+    """
+    queryset = Meter.objects.select_for_update().order_by('id')
+    if meter_ids is not None:
+        queryset = queryset.filter(id__in=meter_ids)
+    if id_range is not None:
+        queryset = queryset.filter(id__gte=id_range[0], id__lte=id_range[1])
+    return list(queryset.values_list('id', flat=True))
+
+
+def previous_readings(meter_ids, before_date, after_date=None) -> dict:
+    """before_date より前（after_date 指定時はその翌日以降）の最終レコード（メーターごと）"""
+    result = {}
+    meter_ids = list(meter_ids)
+    for i in range(0, len(meter_ids), FALLBACK_CHUNK_SIZE):
+        chunk = meter_ids[i:i + FALLBACK_CHUNK_SIZE]
+        queryset = MeterReading.objects.filter(
+            local_date_range_q(after_date + ONE_DAY if after_date else None, before_date - ONE_DAY),
+            meter_id__in=chunk,
+        )
+        last_dates = (
+            queryset
+            .values('meter_id')
+            .annotate(last_date=Max('local_date'))
+            .values_list('meter_id', 'last_date')
+        )
+        condition = Q()
+        for meter_id, last_date in last_dates:
+            condition |= Q(meter_id=meter_id) & local_date_range_q(last_date, last_date)
+        if not condition:
+            continue
+        for (meter_id, _), row in latest_readings(MeterReading.objects.filter(condition)).items():
+            result[meter_id] = row
+    return result
+
+
+def delta(curr, prev, field):
+    """累積値の差分（前回なしは累積値そのまま、マイナスは0）"""
+    curr_val = curr.get(field) if curr else None
+    prev_val = prev.get(field) if prev else None
+    if curr_val is None:
+        return None
+    if prev_val is None:
+        return curr_val  # 初回は累積値そのまま
+    return max(curr_val - prev_val, Decimal('0'))
+
+
+def calculate_deltas(curr, prev) -> dict:
+    """日次集計値（curr: 当日の最終累積値, prev: 前日以前の最終累積値）"""
+    generation_kwh = delta(curr, prev, 'import_kwh')
+    export_kwh = delta(curr, prev, 'route_b_export_kwh')
+    grid_import_kwh = delta(curr, prev, 'route_b_import_kwh')
+
+    # 自家消費量 = 発電量 - 売電量
+    self_consumption_kwh = None
+    if generation_kwh is not None:
+        if export_kwh is not None:
+            self_consumption_kwh = max(generation_kwh - export_kwh, Decimal('0'))
+        else:
+            self_consumption_kwh = generation_kwh
+
+    return {
+        'generation_kwh': generation_kwh,
+        'export_kwh': export_kwh,
+        'self_consumption_kwh': self_consumption_kwh,
+        'grid_import_kwh': grid_import_kwh,
+    }
+
+
+def build_daily_summary(meter_id, target_date, curr, prev) -> DailySummary:
+    summary = DailySummary(
+        meter_id=meter_id,
+        date=target_date,
+        record_count=curr['record_count'],
+        first_reading_at=curr['first_reading_at'],
+        last_reading_at=curr['last_reading_at'],
+        is_dirty=False,
+        **calculate_deltas(curr, prev),
+    )
+    for field in CUMULATIVE_FIELDS:
+        setattr(summary, f'first_{field}', curr[f'first_{field}'])
+        setattr(summary, f'last_{field}', curr[field])
+    return summary
+
+
+def build_hourly_summaries(meter_id, target_date, hours, prev) -> list:
+    """
+    時間別集計（前の時間帯の最終累積値との差分、最初の時間帯は前日以前の最終累積値との差分）
+
+    Args:
+        hours: {時間帯の開始日時: {'import_kwh': 最終値, ..., 'record_count': n, 'last_reading_at': ...}}
+        prev: 前日以前の最終累積値
+    """
+    summaries = []
+    for hour in sorted(hours):
+        curr = hours[hour]
+        summary = HourlySummary(
+            meter_id=meter_id,
+            date=target_date,
+            hour=hour,
+            record_count=curr['record_count'],
+            last_reading_at=curr['last_reading_at'],
+            **calculate_deltas(curr, prev),
+        )
+        for field in CUMULATIVE_FIELDS:
+            setattr(summary, f'last_{field}', curr[field])
+        summaries.append(summary)
+        prev = curr
+    return summaries
+
+
+def last_values(summary) -> dict:
+    """DailySummary / HourlySummary の最終累積値（calculate_deltas の prev 用）"""
+    return {field: getattr(summary, f'last_{field}') for field in CUMULATIVE_FIELDS}
+
+
+def aggregate_daily_summaries(target_date, meter_ids=None, id_range=None, lock=False) -> int:
+    """
+    対象日の日次集計（対象日にデータがある削除されていないメーター）
+
+    Args:
+        target_date: 対象日（JST）
+        meter_ids: 対象メーターを絞る場合のID
+        id_range: 対象メーターをIDの範囲 (開始ID, 終了ID) で絞る場合
+        lock: 受信中の日（前日・当日・再集計待ち）を集計する場合は True。
+              対象メーターをロックしてから読み込み、受信処理の逐次更新と競合しないようにする
+
+    Returns:
+        集計したメーター数
+    """
+    with transaction.atomic():
+        if lock:
+            lock_meters(meter_ids, id_range)
+        return _aggregate_daily_summaries(target_date, meter_ids, id_range)
+
+
+def _aggregate_daily_summaries(target_date, meter_ids, id_range) -> int:
+    prev_date = target_date - timedelta(days=1)
+
+    queryset = MeterReading.objects.filter(
+        local_date_range_q(prev_date, target_date),
+        meter__is_deleted=False,
+    )
+    if meter_ids is not None:
+        queryset = queryset.filter(meter_id__in=meter_ids)
+    if id_range is not None:
+        queryset = queryset.filter(meter_id__gte=id_range[0], meter_id__lte=id_range[1])
+
+    latest = latest_readings(queryset)
+    current = {meter_id: row for (meter_id, day), row in latest.items() if day == target_date}
+    previous = {meter_id: row for (meter_id, day), row in latest.items() if day == prev_date}
+
+    missing = [meter_id for meter_id in current if meter_id not in previous]
+    if missing:
+        previous.update(previous_readings(missing, prev_date))
+
+    summaries = [
+        build_daily_summary(meter_id, target_date, curr, previous.get(meter_id))
+        for meter_id, curr in current.items()
+    ]
+
+    hourly = hourly_latest_readings(queryset.filter(local_date_range_q(target_date, target_date)))
+    hourly_summaries = []
+    for meter_id, hours in hourly.items():
+        hourly_summaries.extend(build_hourly_summaries(meter_id, target_date, hours, previous.get(meter_id)))
+
+    bulk_upsert_daily_summaries(summaries)
+    bulk_upsert_hourly_summaries(hourly_summaries)
+
+    logger.info(f'Daily summaries upserted: {len(summaries)} meters ({len(missing)} without previous day)')
+    return len(summaries)
+
+
+def update_running_summaries(readings, created_keys=None, meters_locked=False) -> int:
+    """
+    保存した30分値/瞬時値で日次集計を逐次更新する（保存と同じトランザクション内で呼ぶ）
+
+    - 最初/最後の累積値とレコード数を更新し、前日の最終累積値との差分を再計算
+    - 前日の集計がない、または過去日のデータの場合は is_dirty を立てる
+    - 過去日の最終値が変わった場合は翌日も is_dirty にする（翌日の差分の基準が変わるため）
+    - 時間別集計は受信した時間帯の最終累積値を更新し、その日の全時間帯の差分を計算し直す
+      （日次集計と同じくメーターのロック下で読み込む。当日分も翌日AM1:00の aggregate_daily で再集計される）
+
+    Args:
+        readings: 保存した MeterReading
+        created_keys: 新規に挿入された (meter_id, timestamp, reading_type)。None の場合はすべて新規とみなす
+        meters_locked: 呼び出し元で lock_meters 済みの場合は True
+
+    Returns:
+        更新した (meter, date) の数
+    """
+    groups = {}
+    for reading in readings:
+        groups.setdefault((reading.meter_id, reading.local_date), []).append(reading)
+    if not groups:
+        return 0
+
+    meter_ids = {meter_id for meter_id, _ in groups}
+    dates = set()
+    for _, day in groups:
+        dates.update((day - ONE_DAY, day, day + ONE_DAY))
+
+    # 同じメーターを更新する受信処理・再集計を直列化してから集計行を読む
+    # （ロック取得後の読み込みのため、他の処理がコミットした最新の値が基準になる）
+    if not meters_locked:
+        lock_meters(meter_ids)
+    existing = {
+        (summary.meter_id, summary.date): summary
+        for summary in DailySummary.objects.select_for_update().filter(meter_id__in=meter_ids, date__in=dates)
+    }
+
+    hourly_existing = {}
+    for hourly in HourlySummary.objects.select_for_update().filter(
+        meter_id__in=meter_ids, date__in={day for _, day in groups}
+    ):
+        hourly_existing.setdefault((hourly.meter_id, hourly.date), {})[hourly.hour] = {
+            'record_count': hourly.record_count,
+            'last_reading_at': hourly.last_reading_at,
+            **last_values(hourly),
+        }
+
+    today = timezone.localdate()
+    summaries = []
+    hourly_summaries = []
+    next_dirty_ids = []
+
+    for (meter_id, day), rows in groups.items():
+        rows.sort(key=lambda reading: reading.timestamp)
+        first, last = rows[0], rows[-1]
+
+        summary = existing.get((meter_id, day)) or DailySummary(meter_id=meter_id, date=day, record_count=0)
+
+        if summary.first_reading_at is None or first.timestamp <= summary.first_reading_at:
+            summary.first_reading_at = first.timestamp
+            for field in CUMULATIVE_FIELDS:
+                setattr(summary, f'first_{field}', getattr(first, field))
+
+        last_changed = summary.last_reading_at is None or last.timestamp >= summary.last_reading_at
+        if last_changed:
+            summary.last_reading_at = last.timestamp
+            for field in CUMULATIVE_FIELDS:
+                setattr(summary, f'last_{field}', getattr(last, field))
+
+        hours = hourly_existing.get((meter_id, day), {})
+        for reading in rows:
+            created = int(created_keys is None or (reading.meter_id, reading.timestamp, reading.reading_type) in created_keys)
+            summary.record_count += created
+
+            hour = hours.setdefault(
+                reading.timestamp.replace(minute=0, second=0, microsecond=0),
+                {'record_count': 0, 'last_reading_at': None},
+            )
+            hour['record_count'] += created
+            if hour['last_reading_at'] is None or reading.timestamp >= hour['last_reading_at']:
+                hour['last_reading_at'] = reading.timestamp
+                for field in CUMULATIVE_FIELDS:
+                    hour[field] = getattr(reading, field)
+
+        prev = existing.get((meter_id, day - ONE_DAY))
+        has_baseline = prev is not None and prev.last_reading_at is not None
+        baseline = last_values(prev) if has_baseline else None
+        for field, value in calculate_deltas(last_values(summary), baseline).items():
+            setattr(summary, field, value)
+        hourly_summaries.extend(build_hourly_summaries(meter_id, day, hours, baseline))
+
+        if not has_baseline or day < today:
+            summary.is_dirty = True
+
+        following = existing.get((meter_id, day + ONE_DAY))
+        if last_changed and following is not None and not following.is_dirty:
+            next_dirty_ids.append(following.id)
+
+        summaries.append(summary)
+
+    bulk_upsert_daily_summaries(summaries)
+    bulk_upsert_hourly_summaries(hourly_summaries)
+    if next_dirty_ids:
+        DailySummary.objects.filter(id__in=next_dirty_ids).update(is_dirty=True)
+
+    return len(summaries)
+
+
+def aggregate_dirty_summaries(limit=5000) -> int:
+    """
+    is_dirty の (meter, date) のみ再集計
+
+    Returns:
+        処理した (meter, date) の数
+    """
+    started = timezone.now()
+    pairs = list(
+        DailySummary.objects
+        .filter(is_dirty=True)
+        .order_by('date')
+        .values_list('meter_id', 'date')[:limit]
+    )
+
+    meter_ids_by_date = {}
+    for meter_id, day in pairs:
+        meter_ids_by_date.setdefault(day, []).append(meter_id)
+
+    for day, meter_ids in meter_ids_by_date.items():
+        aggregate_daily_summaries(day, meter_ids, lock=True)
+        # 削除済みメーターなど集計対象外になった行はフラグのみ落とす（処理中に再度 dirty になった行は残す）
+        DailySummary.objects.filter(
+            meter_id__in=meter_ids,
+            date=day,
+            is_dirty=True,
+            calculated_at__lt=started,
+        ).update(is_dirty=False)
+
+    logger.info(f'Dirty daily summaries re-aggregated: {len(pairs)} pairs, {len(meter_ids_by_date)} days')
+    return len(pairs)
+
+
+def month_bounds(year_month) -> tuple:
+    """YYYY-MM の (月初日, 翌月初日)"""
+    year, month = map(int, year_month.split('-'))
+    first_day = date(year, month, 1)
+    next_month = date(year + 1, 1, 1) if month == 12 else date(year, month + 1, 1)
+    return first_day, next_month
+
+
+def monthly_meter_ids(year_month) -> list:
+    """
+    月次集計の対象メーターID（昇順）
+
+    当月の日次集計または月次集計があるメーター。削除済みメーターの月次集計も
+    aggregate_monthly_summaries で削除されるよう、メーターの削除状態によらず含める。
+    """
+    first_day, next_month = month_bounds(year_month)
+    ids = set(
+        DailySummary.objects.filter(date__gte=first_day, date__lt=next_month)
+        .values_list('meter_id', flat=True).distinct()
+    )
+    ids.update(
+        MonthlySummary.objects.filter(year_month=year_month)
+        .values_list('meter_id', flat=True).distinct()
+    )
+    return sorted(ids)
+
+
+def aggregate_monthly_summaries(year_month, meter_ids=None, id_range=None) -> int:
+    """
+    月次集計（DailySummary をメーターごとに1回の GROUP BY で合算し、一括UPSERT）
+
+    対象範囲のメーターのうち、当月の日次集計がなくなったメーター（削除済みメーターを含む）の
+    月次集計は同じトランザクションで削除する。
+
+    Args:
+        year_month: 対象年月（YYYY-MM）
+        meter_ids: 対象メーターを絞る場合のID
+        id_range: 対象メーターをIDの範囲 (開始ID, 終了ID) で絞る場合
+
+    Returns:
+        集計したメーター数
+    """
+    first_day, next_month = month_bounds(year_month)
+
+    def scoped(queryset):
+        if meter_ids is not None:
+            queryset = queryset.filter(meter_id__in=meter_ids)
+        if id_range is not None:
+            queryset = queryset.filter(meter_id__gte=id_range[0], meter_id__lte=id_range[1])
+        return queryset
+
+    daily = scoped(DailySummary.objects.filter(date__gte=first_day, date__lt=next_month, meter__is_deleted=False))
+    totals = (
+        daily
+        .values('meter_id')
+        .annotate(
+            generation=Sum('generation_kwh'),
+            export=Sum('export_kwh'),
+            self_consumption=Sum('self_consumption_kwh'),
+            grid_import=Sum('grid_import_kwh'),
+        )
+        .order_by('meter_id')
+    )
+    summaries = [
+        MonthlySummary(
+            meter_id=row['meter_id'],
+            year_month=year_month,
+            generation_kwh=row['generation'],
+            export_kwh=row['export'],
+            self_consumption_kwh=row['self_consumption'],
+            grid_import_kwh=row['grid_import'],
+        )
+        for row in totals
+    ]
+
+    with transaction.atomic():
+        bulk_upsert_monthly_summaries(summaries)
+        stale, _ = (
+            scoped(MonthlySummary.objects.filter(year_month=year_month))
+            .exclude(meter_id__in=daily.values('meter_id'))
+            .delete()
+        )
+
+    logger.info(f'Monthly summaries upserted for {year_month}: {len(summaries)} meters, {stale} stale rows deleted')
+    return len(summaries)
@@ -0,0 +1,81 @@
+"""
+一括UPSERT
+
+bulk_create(update_conflicts=True) で
+MySQL: INSERT ... ON DUPLICATE KEY UPDATE
+PostgreSQL / SQLite: INSERT ... ON CONFLICT (...) DO UPDATE
+を発行する。対象モデルには unique_fields に対応する一意制約が必要。
+"""
+from django.db import connections, router
+
+from app.readings.models import MeterReading, DailySummary, HourlySummary, MonthlySummary, local_date_of
+
+READING_UNIQUE_FIELDS = ['meter', 'timestamp', 'reading_type']
+READING_UPDATE_FIELDS = [
+    'import_kwh', 'export_kwh', 'route_b_import_kwh', 'route_b_export_kwh',
+    'raw_data', 'raw_payload', 'local_date',
+]
+
+DAILY_UNIQUE_FIELDS = ['meter', 'date']
+DAILY_UPDATE_FIELDS = [
+    'generation_kwh', 'export_kwh', 'self_consumption_kwh', 'grid_import_kwh',
+    'record_count', 'first_reading_at', 'last_reading_at',
+    'first_import_kwh', 'first_route_b_export_kwh', 'first_route_b_import_kwh',
+    'last_import_kwh', 'last_route_b_export_kwh', 'last_route_b_import_kwh',
+    'is_dirty', 'calculated_at',
+]
+
+HOURLY_UNIQUE_FIELDS = ['meter', 'hour']
+HOURLY_UPDATE_FIELDS = [
+    'generation_kwh', 'export_kwh', 'self_consumption_kwh', 'grid_import_kwh', 'record_count',
+    'last_reading_at', 'last_import_kwh', 'last_route_b_export_kwh', 'last_route_b_import_kwh',
+    'calculated_at',
+]
+
+MONTHLY_UNIQUE_FIELDS = ['meter', 'year_month']
+MONTHLY_UPDATE_FIELDS = [
+    'generation_kwh', 'export_kwh', 'self_consumption_kwh', 'grid_import_kwh', 'calculated_at',
+]
+
+
+def bulk_upsert(model, objs, unique_fields, update_fields, batch_size=1000) -> list:
+    """
+    一意制約が重複する行は update_fields を更新し、それ以外は挿入する
+
+    MySQL は競合対象の指定（unique_fields）に対応していないため、
+    DBが対応している場合のみ渡す（MySQL ではすべての一意制約が対象になる）。
+    """
+    objs = list(objs)
+    if not objs:
+        return objs
+
+    connection = connections[router.db_for_write(model)]
+    kwargs = {'update_conflicts': True, 'update_fields': update_fields, 'batch_size': batch_size}
+    if connection.features.supports_update_conflicts_with_target:
+        kwargs['unique_fields'] = unique_fields
+
+    return model.objects.bulk_create(objs, **kwargs)
+
+
+def bulk_upsert_readings(readings, batch_size=1000) -> list:
+    """30分値/瞬時値の一括UPSERT（meter, timestamp, reading_type 単位）"""
+    readings = list(readings)
+    for reading in readings:
+        if reading.local_date is None:
+            reading.local_date = local_date_of(reading.timestamp)
+    return bulk_upsert(MeterReading, readings, READING_UNIQUE_FIELDS, READING_UPDATE_FIELDS, batch_size)
+
+
+def bulk_upsert_daily_summaries(summaries, batch_size=1000) -> list:
+    """日次集計の一括UPSERT（meter, date 単位）"""
+    return bulk_upsert(DailySummary, summaries, DAILY_UNIQUE_FIELDS, DAILY_UPDATE_FIELDS, batch_size)
+
+
+def bulk_upsert_hourly_summaries(summaries, batch_size=1000) -> list:
+    """時間別集計の一括UPSERT（meter, hour 単位）"""
+    return bulk_upsert(HourlySummary, summaries, HOURLY_UNIQUE_FIELDS, HOURLY_UPDATE_FIELDS, batch_size)
+
+
+def bulk_upsert_monthly_summaries(summaries, batch_size=1000) -> list:
+    """月次集計の一括UPSERT（meter, year_month 単位）"""
+    return bulk_upsert(MonthlySummary, summaries, MONTHLY_UNIQUE_FIELDS, MONTHLY_UPDATE_FIELDS, batch_size)
@@ -0,0 +1,77 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+import time
+
+from app.readings.models import MeterReading, MeterEvent, local_date_of
+
+MODELS = {
+    'readings': MeterReading,
+    'events': MeterEvent,
+}
+
+
+class Command(BaseCommand):
+    help = '既存データの local_date（JST日付）を timestamp から埋める'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--model',
+            choices=['readings', 'events', 'all'],
+            default='all',
+            help='対象（readings: 30分データ, events: イベントログ, all: 両方）',
+        )
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=10000,
+            help='1トランザクションで更新する件数（デフォルト: 10000）',
+        )
+        parser.add_argument(
+            '--sleep',
+            type=float,
+            default=0,
+            help='チャンクごとの待機秒数（本番DBの負荷軽減用）',
+        )
+
+    def handle(self, *args, **options):
+        targets = MODELS.keys() if options['model'] == 'all' else [options['model']]
+
+        for name in targets:
+            self.backfill(MODELS[name], options['chunk_size'], options['sleep'])
+
+    def backfill(self, model, chunk_size, sleep):
+        table = model._meta.db_table
+        self.stdout.write(f'{table}: 更新開始')
+
+        updated = 0
+        last_id = 0
+        started = time.monotonic()
+
+        while True:
+            rows = list(
+                model.objects
+                .filter(id__gt=last_id, local_date__isnull=True)
+                .order_by('id')
+                .values_list('id', 'timestamp')[:chunk_size]
+            )
+            if not rows:
+                break
+            last_id = rows[-1][0]
+
+            # 30分データはid順にほぼ日付がまとまるため、日付ごとに1回のUPDATEで済む
+            ids_by_date = {}
+            for pk, timestamp in rows:
+                ids_by_date.setdefault(local_date_of(timestamp), []).append(pk)
+
+            with transaction.atomic():
+                for local_date, ids in ids_by_date.items():
+                    model.objects.filter(id__in=ids).update(local_date=local_date)
+
+            updated += len(rows)
+            elapsed = time.monotonic() - started
+            self.stdout.write(f'  {updated}件 更新済み（id <= {last_id}, {updated / elapsed:.0f}件/秒）')
+
+            if sleep:
+                time.sleep(sleep)
+
+        self.stdout.write(self.style.SUCCESS(f'{table}: {updated}件 更新完了'))
@@ -0,0 +1,90 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import transaction
+import time
+
+from app.readings.models import MeterReading, MeterEvent
+from app.readings.raw_data import CODECS, encode_payload
+
+MODELS = {
+    'readings': MeterReading,
+    'events': MeterEvent,
+}
+
+
+class Command(BaseCommand):
+    help = '既存の生データ（raw_data のHEX文字列）を raw_payload（バイナリ）に変換する'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--model',
+            choices=['readings', 'events', 'all'],
+            default='all',
+            help='対象（readings: 30分データ, events: イベントログ, all: 両方）',
+        )
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=5000,
+            help='1トランザクションで変換する件数（デフォルト: 5000）',
+        )
+        parser.add_argument(
+            '--compression',
+            choices=list(CODECS),
+            default=getattr(settings, 'RAW_DATA_COMPRESSION', 'none'),
+            help='圧縮方式（デフォルト: RAW_DATA_COMPRESSION）',
+        )
+        parser.add_argument(
+            '--sleep',
+            type=float,
+            default=0,
+            help='チャンクごとの待機秒数（本番DBの負荷軽減用）',
+        )
+
+    def handle(self, *args, **options):
+        targets = MODELS.keys() if options['model'] == 'all' else [options['model']]
+
+        for name in targets:
+            self.convert(MODELS[name], options['chunk_size'], options['compression'], options['sleep'])
+
+    def convert(self, model, chunk_size, compression, sleep):
+        table = model._meta.db_table
+        self.stdout.write(f'{table}: 変換開始')
+
+        converted = 0
+        skipped = 0
+        last_id = 0
+        started = time.monotonic()
+
+        while True:
+            rows = list(
+                model.objects
+                .filter(id__gt=last_id, raw_payload__isnull=True)
+                .exclude(raw_data='')
+                .order_by('id')
+                .values_list('id', 'raw_data')[:chunk_size]
+            )
+            if not rows:
+                break
+            last_id = rows[-1][0]
+
+            objs = []
+            for pk, raw_data in rows:
+                try:
+                    payload = encode_payload(raw_data.strip(), compression)
+                except ValueError:
+                    skipped += 1
+                    continue
+                objs.append(model(id=pk, raw_payload=payload, raw_data=''))
+
+            with transaction.atomic():
+                model.objects.bulk_update(objs, ['raw_payload', 'raw_data'])
+
+            converted += len(objs)
+            elapsed = time.monotonic() - started
+            self.stdout.write(f'  {converted}件 変換済み（id <= {last_id}, {converted / elapsed:.0f}件/秒）')
+
+            if sleep:
+                time.sleep(sleep)
+
+        self.stdout.write(self.style.SUCCESS(f'{table}: {converted}件 変換完了（HEX不正 {skipped}件はスキップ）'))
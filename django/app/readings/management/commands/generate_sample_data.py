@@ -6,6 +6,7 @@ import random
 
 from app.meters.models import Meter, MeterAssignment
 from app.readings.models import MeterReading, DailySummary, MonthlySummary
+from app.readings.bulk import bulk_upsert_readings
 from app.billing.models import BillingCalendar, BillingSummary
 
 
@@ -177,11 +178,11 @@ class Command(BaseCommand):
             
             # バッチ挿入（メモリ節約）
             if len(readings) >= 1000:
-                MeterReading.objects.bulk_create(readings, ignore_conflicts=True)
+                bulk_upsert_readings(readings)
                 readings = []
         
         if readings:
-            MeterReading.objects.bulk_create(readings, ignore_conflicts=True)
+            bulk_upsert_readings(readings)
         
         return MeterReading.objects.filter(meter=meter).count()
 
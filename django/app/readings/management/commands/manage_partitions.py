@@ -0,0 +1,78 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from app.readings import partitions
+
+
+class Command(BaseCommand):
+    help = 'meter_readings / meter_events の月次パーティション管理（MySQLのみ）'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--setup',
+            action='store_true',
+            help='未パーティションのテーブルを月次パーティション化する（初回のみ、テーブル再構築あり）',
+        )
+        parser.add_argument(
+            '--table',
+            choices=list(partitions.PARTITIONED_TABLES),
+            action='append',
+            help='対象テーブル（複数指定可、デフォルト: すべて）',
+        )
+        parser.add_argument(
+            '--months-ahead',
+            type=int,
+            default=getattr(settings, 'READINGS_PARTITION_MONTHS_AHEAD', 3),
+            help='先行作成する月数（デフォルト: 3）',
+        )
+        parser.add_argument(
+            '--retention-months',
+            type=int,
+            default=getattr(settings, 'READINGS_RETENTION_MONTHS', 0),
+            help='保持月数（当月を含む、0: 無期限）',
+        )
+        parser.add_argument(
+            '--mode',
+            choices=['archive', 'drop'],
+            default=getattr(settings, 'READINGS_RETENTION_MODE', 'archive'),
+            help='期限切れパーティションの処理（archive: アーカイブテーブルへ切り離し, drop: 削除）',
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='実行するDDLを表示のみ',
+        )
+
+    def handle(self, *args, **options):
+        if not partitions.is_supported():
+            self.stdout.write(self.style.WARNING('MySQL以外のDBのため何もしません'))
+            return
+
+        tables = options['table'] or list(partitions.PARTITIONED_TABLES)
+        dry_run = options['dry_run']
+
+        if options['setup']:
+            for table in tables:
+                statements = partitions.setup_table(table, options['months_ahead'], dry_run)
+                if not statements:
+                    self.stdout.write(f'{table}: パーティション化済み')
+                self.print_statements(table, statements)
+
+        result = partitions.rotate(
+            months_ahead=options['months_ahead'],
+            retention_months=options['retention_months'],
+            mode=options['mode'],
+            tables=tables,
+            dry_run=dry_run,
+        )
+        for table, statements in result.items():
+            self.print_statements(table, statements)
+            current = [name for name, _, _ in partitions.get_partitions(table)]
+            if current:
+                self.stdout.write(f'{table}: {current[0]} 〜 {current[-1]}（{len(current)}パーティション）')
+
+        self.stdout.write(self.style.SUCCESS('完了' + ('（dry-run）' if dry_run else '')))
+
+    def print_statements(self, table, statements):
+        for sql in statements:
+            self.stdout.write(f'  [{table}] {sql}')
@@ -0,0 +1,195 @@
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import date, timedelta
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+import time
+
+from app.meters.models import Meter
+from app.readings.aggregation import aggregate_daily_summaries, aggregate_monthly_summaries
+from app.readings.models import ReaggregationCheckpoint
+
+
+def init_worker():
+    """
+    ワーカープロセスの初期化
+
+    spawn（macOS / Python 3.14以降の既定）で起動したプロセスは Django が未初期化のため setup する。
+    fork の場合は親から引き継いだDB接続を使わないよう閉じる。
+    """
+    import django
+    django.setup()
+    connections.close_all()
+
+
+def reaggregate_day(target_date, meter_ids):
+    """ワーカープロセスで1日分を集計"""
+    return target_date, aggregate_daily_summaries(target_date, meter_ids)
+
+
+def month_range(start_date, end_date) -> list:
+    months = []
+    year, month = start_date.year, start_date.month
+    while (year, month) <= (end_date.year, end_date.month):
+        months.append(f'{year:04d}-{month:02d}')
+        year, month = (year + 1, 1) if month == 12 else (year, month + 1)
+    return months
+
+
+class Command(BaseCommand):
+    help = '期間を指定して日次集計・月次集計を再計算する（中断した場合は同じ引数で再実行すると続きから再開）'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--start',
+            type=date.fromisoformat,
+            required=True,
+            help='開始日（YYYY-MM-DD）',
+        )
+        parser.add_argument(
+            '--end',
+            type=date.fromisoformat,
+            help='終了日（YYYY-MM-DD、デフォルト: 開始日）',
+        )
+        parser.add_argument(
+            '--meter',
+            action='append',
+            default=[],
+            help='対象メーターID（複数指定可、デフォルト: 全メーター）',
+        )
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=1,
+            help='並列実行するプロセス数（デフォルト: 1）',
+        )
+        parser.add_argument(
+            '--skip-monthly',
+            action='store_true',
+            help='月次集計を再計算しない',
+        )
+        parser.add_argument(
+            '--restart',
+            action='store_true',
+            help='進捗を破棄して最初からやり直す',
+        )
+
+    def handle(self, *args, **options):
+        start_date = options['start']
+        end_date = options['end'] or start_date
+        if start_date > end_date:
+            raise CommandError('開始日が終了日より後になっています')
+
+        meter_ids = None
+        meter_codes = sorted(set(options['meter']))
+        if meter_codes:
+            found = dict(Meter.objects.filter(meter_id__in=meter_codes).values_list('meter_id', 'id'))
+            missing = [code for code in meter_codes if code not in found]
+            if missing:
+                raise CommandError(f'メーターが見つかりません: {", ".join(missing)}')
+            meter_ids = sorted(found.values())
+
+        checkpoint = self.get_checkpoint(start_date, end_date, meter_codes, options['restart'])
+        if checkpoint.status == 'completed':
+            self.stdout.write(self.style.WARNING('この条件の再集計は完了済みです（やり直す場合は --restart）'))
+            return
+
+        started = time.monotonic()
+        rows = self.reaggregate_daily(checkpoint, meter_ids, options['workers'], started)
+        if not options['skip_monthly']:
+            rows = self.reaggregate_monthly(checkpoint, meter_ids, started, rows)
+
+        checkpoint.status = 'completed'
+        checkpoint.save(update_fields=['status', 'updated_at'])
+
+        elapsed = time.monotonic() - started
+        self.stdout.write(self.style.SUCCESS(
+            f'完了: {rows}件（{elapsed:.1f}秒, {rows / elapsed if elapsed else 0:.0f}件/秒）'
+        ))
+
+    def get_checkpoint(self, start_date, end_date, meter_codes, restart):
+        key = f'{start_date}:{end_date}:{",".join(meter_codes) or "all"}'
+        checkpoint, created = ReaggregationCheckpoint.objects.get_or_create(
+            key=key,
+            defaults={'start_date': start_date, 'end_date': end_date, 'meters': ','.join(meter_codes)},
+        )
+        if restart and not created:
+            checkpoint.daily_completed_through = None
+            checkpoint.monthly_completed_through = ''
+            checkpoint.rows_processed = 0
+            checkpoint.status = 'running'
+            checkpoint.save()
+        elif not created and checkpoint.status != 'completed':
+            self.stdout.write(
+                f'前回の続きから再開: 日次 {checkpoint.daily_completed_through or "-"} / '
+                f'月次 {checkpoint.monthly_completed_through or "-"} まで完了済み'
+            )
+        return checkpoint
+
+    def reaggregate_daily(self, checkpoint, meter_ids, workers, started) -> int:
+        """
+        日次集計（日単位で並列実行）
+
+        完了順は前後するため、先頭から連続して完了した日までを進捗として保存する。
+        再開時は最後に保存した日の翌日からやり直す（集計はUPSERTなので重複実行しても問題ない）。
+        """
+        first = checkpoint.start_date
+        if checkpoint.daily_completed_through:
+            first = checkpoint.daily_completed_through + timedelta(days=1)
+        days = [first + timedelta(days=i) for i in range((checkpoint.end_date - first).days + 1)]
+        if not days:
+            return 0
+
+        self.stdout.write(f'日次集計: {days[0]}〜{days[-1]}（{len(days)}日, {workers}プロセス）')
+
+        rows = 0
+        completed = set()
+        next_index = 0
+
+        def on_completed(target_date, count):
+            nonlocal rows, next_index
+            rows += count
+            completed.add(target_date)
+            while next_index < len(days) and days[next_index] in completed:
+                next_index += 1
+            if next_index:
+                checkpoint.daily_completed_through = days[next_index - 1]
+            checkpoint.rows_processed += count
+            checkpoint.save(update_fields=['daily_completed_through', 'rows_processed', 'updated_at'])
+
+            elapsed = time.monotonic() - started
+            self.stdout.write(f'  {target_date}: {count}件（累計 {rows}件, {rows / elapsed:.0f}件/秒）')
+
+        if workers <= 1:
+            for target_date in days:
+                on_completed(*reaggregate_day(target_date, meter_ids))
+            return rows
+
+        # fork したプロセスに親のDB接続を引き継がせない
+        connections.close_all()
+        with ProcessPoolExecutor(max_workers=workers, initializer=init_worker) as executor:
+            futures = [executor.submit(reaggregate_day, target_date, meter_ids) for target_date in days]
+            for future in as_completed(futures):
+                on_completed(*future.result())
+        return rows
+
+    def reaggregate_monthly(self, checkpoint, meter_ids, started, rows) -> int:
+        """月次集計（日次集計の完了後に実行）。rows は日次集計までの件数で、合計件数を返す"""
+        months = [
+            year_month for year_month in month_range(checkpoint.start_date, checkpoint.end_date)
+            if year_month > checkpoint.monthly_completed_through
+        ]
+        if not months:
+            return rows
+
+        self.stdout.write(f'月次集計: {months[0]}〜{months[-1]}（{len(months)}ヶ月）')
+
+        for year_month in months:
+            count = aggregate_monthly_summaries(year_month, meter_ids)
+            rows += count
+            checkpoint.monthly_completed_through = year_month
+            checkpoint.rows_processed += count
+            checkpoint.save(update_fields=['monthly_completed_through', 'rows_processed', 'updated_at'])
+
+            elapsed = time.monotonic() - started
+            self.stdout.write(f'  {year_month}: {count}件（累計 {rows}件, {rows / elapsed:.0f}件/秒）')
+        return rows
@@ -0,0 +1,23 @@
+# Generated by Django 4.2.14 on 2026-10-18 12:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('readings', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='meterevent',
+            name='raw_payload',
+            field=models.BinaryField(blank=True, null=True, verbose_name='生データ'),
+        ),
+        migrations.AddField(
+            model_name='meterreading',
+            name='raw_payload',
+            field=models.BinaryField(blank=True, null=True, verbose_name='生データ'),
+        ),
+    ]
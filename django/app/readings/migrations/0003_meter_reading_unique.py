@@ -0,0 +1,59 @@
+# Generated by Django 4.2.14 on 2026-10-18 12:17
+
+from django.db import migrations, models
+from django.db.models import Count, Max
+
+METER_CHUNK_SIZE = 500
+DELETE_CHUNK_SIZE = 5000
+
+
+def delete_duplicate_readings(apps, schema_editor):
+    """(meter, timestamp, reading_type) が重複する行を、最新（id最大）の1行を残して削除"""
+    MeterReading = apps.get_model('readings', 'MeterReading')
+    Meter = apps.get_model('meters', 'Meter')
+
+    meter_ids = list(Meter.objects.order_by('id').values_list('id', flat=True))
+    for i in range(0, len(meter_ids), METER_CHUNK_SIZE):
+        chunk = meter_ids[i:i + METER_CHUNK_SIZE]
+        duplicates = (
+            MeterReading.objects
+            .filter(meter_id__in=chunk)
+            .values('meter_id', 'timestamp', 'reading_type')
+            .annotate(row_count=Count('id'), keep_id=Max('id'))
+            .filter(row_count__gt=1)
+        )
+
+        delete_ids = []
+        for group in duplicates:
+            delete_ids.extend(
+                MeterReading.objects
+                .filter(
+                    meter_id=group['meter_id'],
+                    timestamp=group['timestamp'],
+                    reading_type=group['reading_type'],
+                )
+                .exclude(id=group['keep_id'])
+                .values_list('id', flat=True)
+            )
+
+        for j in range(0, len(delete_ids), DELETE_CHUNK_SIZE):
+            MeterReading.objects.filter(id__in=delete_ids[j:j + DELETE_CHUNK_SIZE]).delete()
+
+
+class Migration(migrations.Migration):
+
+    # 重複削除はチャンクごとにコミットする
+    atomic = False
+
+    dependencies = [
+        ('meters', '0004_historicalmeterassignment_base_billing_day_and_more'),
+        ('readings', '0002_meter_raw_payload'),
+    ]
+
+    operations = [
+        migrations.RunPython(delete_duplicate_readings, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='meterreading',
+            constraint=models.UniqueConstraint(fields=('meter', 'timestamp', 'reading_type'), name='uniq_meter_reading_timestamp_type'),
+        ),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 4.2.14 on 2026-10-18 12:19
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('meters', '0004_historicalmeterassignment_base_billing_day_and_more'),
+        ('readings', '0003_meter_reading_unique'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='meterevent',
+            name='meter',
+            field=models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.CASCADE, related_name='events', to='meters.meter', verbose_name='メーター'),
+        ),
+        migrations.AlterField(
+            model_name='meterreading',
+            name='meter',
+            field=models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.CASCADE, related_name='readings', to='meters.meter', verbose_name='メーター'),
+        ),
+    ]
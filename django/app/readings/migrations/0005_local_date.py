@@ -0,0 +1,27 @@
+# Generated by Django 4.2.14 on 2026-10-18 12:22
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('readings', '0004_meter_fk_without_constraint'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='meterevent',
+            name='local_date',
+            field=models.DateField(blank=True, db_index=True, null=True, verbose_name='発生日'),
+        ),
+        migrations.AddField(
+            model_name='meterreading',
+            name='local_date',
+            field=models.DateField(blank=True, db_index=True, null=True, verbose_name='計測日'),
+        ),
+        migrations.AddIndex(
+            model_name='meterreading',
+            index=models.Index(fields=['meter', 'local_date', 'timestamp'], name='idx_reading_meter_local_date'),
+        ),
+    ]
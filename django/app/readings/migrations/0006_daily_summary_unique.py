@@ -0,0 +1,45 @@
+# Generated by Django 4.2.14 on 2026-10-18 12:23
+
+from django.db import migrations, models
+from django.db.models import Count, Max
+
+DELETE_CHUNK_SIZE = 5000
+
+
+def delete_duplicate_summaries(apps, schema_editor):
+    """(meter, date) が重複する行を、最新（id最大）の1行を残して削除"""
+    DailySummary = apps.get_model('readings', 'DailySummary')
+
+    duplicates = (
+        DailySummary.objects
+        .values('meter_id', 'date')
+        .annotate(row_count=Count('id'), keep_id=Max('id'))
+        .filter(row_count__gt=1)
+    )
+
+    delete_ids = []
+    for group in duplicates:
+        delete_ids.extend(
+            DailySummary.objects
+            .filter(meter_id=group['meter_id'], date=group['date'])
+            .exclude(id=group['keep_id'])
+            .values_list('id', flat=True)
+        )
+
+    for i in range(0, len(delete_ids), DELETE_CHUNK_SIZE):
+        DailySummary.objects.filter(id__in=delete_ids[i:i + DELETE_CHUNK_SIZE]).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('readings', '0005_local_date'),
+    ]
+
+    operations = [
+        migrations.RunPython(delete_duplicate_summaries, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='dailysummary',
+            constraint=models.UniqueConstraint(fields=('meter', 'date'), name='uniq_daily_summary_meter_date'),
+        ),
+    ]
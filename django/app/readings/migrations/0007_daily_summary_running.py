@@ -0,0 +1,62 @@
+# Generated by Django 4.2.14 on 2026-10-18 12:25
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('readings', '0006_daily_summary_unique'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='dailysummary',
+            name='first_import_kwh',
+            field=models.DecimalField(blank=True, decimal_places=2, max_digits=12, null=True, verbose_name='最初の発電量累計(kWh)'),
+        ),
+        migrations.AddField(
+            model_name='dailysummary',
+            name='first_reading_at',
+            field=models.DateTimeField(blank=True, null=True, verbose_name='最初の計測日時'),
+        ),
+        migrations.AddField(
+            model_name='dailysummary',
+            name='first_route_b_export_kwh',
+            field=models.DecimalField(blank=True, decimal_places=2, max_digits=12, null=True, verbose_name='最初の売電累計(kWh)'),
+        ),
+        migrations.AddField(
+            model_name='dailysummary',
+            name='first_route_b_import_kwh',
+            field=models.DecimalField(blank=True, decimal_places=2, max_digits=12, null=True, verbose_name='最初の買電累計(kWh)'),
+        ),
+        migrations.AddField(
+            model_name='dailysummary',
+            name='is_dirty',
+            field=models.BooleanField(default=False, verbose_name='再集計待ち'),
+        ),
+        migrations.AddField(
+            model_name='dailysummary',
+            name='last_import_kwh',
+            field=models.DecimalField(blank=True, decimal_places=2, max_digits=12, null=True, verbose_name='最後の発電量累計(kWh)'),
+        ),
+        migrations.AddField(
+            model_name='dailysummary',
+            name='last_reading_at',
+            field=models.DateTimeField(blank=True, null=True, verbose_name='最後の計測日時'),
+        ),
+        migrations.AddField(
+            model_name='dailysummary',
+            name='last_route_b_export_kwh',
+            field=models.DecimalField(blank=True, decimal_places=2, max_digits=12, null=True, verbose_name='最後の売電累計(kWh)'),
+        ),
+        migrations.AddField(
+            model_name='dailysummary',
+            name='last_route_b_import_kwh',
+            field=models.DecimalField(blank=True, decimal_places=2, max_digits=12, null=True, verbose_name='最後の買電累計(kWh)'),
+        ),
+        migrations.AddIndex(
+            model_name='dailysummary',
+            index=models.Index(fields=['is_dirty', 'date'], name='idx_daily_summary_dirty'),
+        ),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 4.2.14 on 2026-10-18 12:29
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('readings', '0007_daily_summary_running'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ReaggregationCheckpoint',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('key', models.CharField(max_length=255, unique=True, verbose_name='実行キー')),
+                ('start_date', models.DateField(verbose_name='開始日')),
+                ('end_date', models.DateField(verbose_name='終了日')),
+                ('meters', models.TextField(blank=True, default='', verbose_name='対象メーター')),
+                ('daily_completed_through', models.DateField(blank=True, null=True, verbose_name='日次集計完了日')),
+                ('monthly_completed_through', models.CharField(blank=True, default='', max_length=7, verbose_name='月次集計完了年月')),
+                ('rows_processed', models.BigIntegerField(default=0, verbose_name='処理件数')),
+                ('status', models.CharField(choices=[('running', '実行中'), ('completed', '完了')], default='running', max_length=20, verbose_name='状態')),
+                ('started_at', models.DateTimeField(auto_now_add=True, verbose_name='開始日時')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='更新日時')),
+            ],
+            options={
+                'verbose_name': '再集計の進捗',
+                'verbose_name_plural': '再集計の進捗',
+                'db_table': 'reaggregation_checkpoints',
+            },
+        ),
+    ]
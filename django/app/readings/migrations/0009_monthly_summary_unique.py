@@ -0,0 +1,45 @@
+# Generated by Django 4.2.14 on 2026-10-18 12:31
+
+from django.db import migrations, models
+from django.db.models import Count, Max
+
+DELETE_CHUNK_SIZE = 5000
+
+
+def delete_duplicate_summaries(apps, schema_editor):
+    """(meter, year_month) が重複する行を、最新（id最大）の1行を残して削除"""
+    MonthlySummary = apps.get_model('readings', 'MonthlySummary')
+
+    duplicates = (
+        MonthlySummary.objects
+        .values('meter_id', 'year_month')
+        .annotate(row_count=Count('id'), keep_id=Max('id'))
+        .filter(row_count__gt=1)
+    )
+
+    delete_ids = []
+    for group in duplicates:
+        delete_ids.extend(
+            MonthlySummary.objects
+            .filter(meter_id=group['meter_id'], year_month=group['year_month'])
+            .exclude(id=group['keep_id'])
+            .values_list('id', flat=True)
+        )
+
+    for i in range(0, len(delete_ids), DELETE_CHUNK_SIZE):
+        MonthlySummary.objects.filter(id__in=delete_ids[i:i + DELETE_CHUNK_SIZE]).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('readings', '0008_reaggregation_checkpoint'),
+    ]
+
+    operations = [
+        migrations.RunPython(delete_duplicate_summaries, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='monthlysummary',
+            constraint=models.UniqueConstraint(fields=('meter', 'year_month'), name='uniq_monthly_summary_meter_month'),
+        ),
+    ]
@@ -0,0 +1,45 @@
+# Generated by Django 4.2.14 on 2026-10-18 12:32
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('meters', '0004_historicalmeterassignment_base_billing_day_and_more'),
+        ('readings', '0009_monthly_summary_unique'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='HourlySummary',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField(verbose_name='日付')),
+                ('hour', models.DateTimeField(verbose_name='時間帯（開始日時）')),
+                ('generation_kwh', models.DecimalField(blank=True, decimal_places=2, max_digits=10, null=True, verbose_name='発電量(kWh)')),
+                ('export_kwh', models.DecimalField(blank=True, decimal_places=2, max_digits=10, null=True, verbose_name='売電量(kWh)')),
+                ('self_consumption_kwh', models.DecimalField(blank=True, decimal_places=2, max_digits=10, null=True, verbose_name='自家消費量(kWh)')),
+                ('grid_import_kwh', models.DecimalField(blank=True, decimal_places=2, max_digits=10, null=True, verbose_name='買電量(kWh)')),
+                ('record_count', models.IntegerField(default=0, verbose_name='レコード数')),
+                ('last_reading_at', models.DateTimeField(blank=True, null=True, verbose_name='最後の計測日時')),
+                ('last_import_kwh', models.DecimalField(blank=True, decimal_places=2, max_digits=12, null=True, verbose_name='最後の発電量累計(kWh)')),
+                ('last_route_b_export_kwh', models.DecimalField(blank=True, decimal_places=2, max_digits=12, null=True, verbose_name='最後の売電累計(kWh)')),
+                ('last_route_b_import_kwh', models.DecimalField(blank=True, decimal_places=2, max_digits=12, null=True, verbose_name='最後の買電累計(kWh)')),
+                ('calculated_at', models.DateTimeField(auto_now=True, verbose_name='集計日時')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('meter', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='hourly_summaries', to='meters.meter', verbose_name='メーター')),
+            ],
+            options={
+                'verbose_name': '時間別集計',
+                'verbose_name_plural': '時間別集計',
+                'db_table': 'hourly_summaries',
+                'indexes': [models.Index(fields=['meter', 'date'], name='idx_hourly_summary_meter_date')],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='hourlysummary',
+            constraint=models.UniqueConstraint(fields=('meter', 'hour'), name='uniq_hourly_summary_meter_hour'),
+        ),
+    ]
@@ -0,0 +1,53 @@
+# Generated by Django 4.2.14 on 2026-10-18 13:05
+
+from django.db import migrations
+from django.utils import timezone
+
+CHUNK_SIZE = 10000
+
+
+def backfill(model):
+    """local_date が NULL の行を timestamp（JST）から埋める（id順にチャンクごとにコミット）"""
+    last_id = 0
+    while True:
+        rows = list(
+            model.objects
+            .filter(id__gt=last_id, local_date__isnull=True)
+            .order_by('id')
+            .values_list('id', 'timestamp')[:CHUNK_SIZE]
+        )
+        if not rows:
+            break
+        last_id = rows[-1][0]
+
+        ids_by_date = {}
+        for pk, timestamp in rows:
+            local = timestamp.date() if timezone.is_naive(timestamp) else timezone.localtime(timestamp).date()
+            ids_by_date.setdefault(local, []).append(pk)
+
+        for local_date, ids in ids_by_date.items():
+            model.objects.filter(id__in=ids).update(local_date=local_date)
+
+
+def backfill_local_date(apps, schema_editor):
+    """
+    0005 以前に保存された行の local_date を埋める
+
+    件数が多い場合は事前に backfill_local_date コマンドで埋めておくと、このマイグレーションは残りのみ処理する
+    """
+    backfill(apps.get_model('readings', 'MeterReading'))
+    backfill(apps.get_model('readings', 'MeterEvent'))
+
+
+class Migration(migrations.Migration):
+
+    # チャンクごとにコミットする
+    atomic = False
+
+    dependencies = [
+        ('readings', '0010_hourly_summary'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_local_date, migrations.RunPython.noop),
+    ]
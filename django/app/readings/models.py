@@ -1,6 +1,38 @@
 # django/app/readings/models.py
+from datetime import datetime, time, timedelta
 from django.db import models
+from django.db.models import Q
+from django.utils import timezone
 from app.meters.models import Meter
+from app.readings.raw_data import to_hex
+
+
+def local_date_of(timestamp):
+    """計測日時のJST日付（naive の場合はJSTとみなす）"""
+    if timestamp is None:
+        return None
+    if timezone.is_naive(timestamp):
+        return timestamp.date()
+    return timezone.localtime(timestamp).date()
+
+
+def local_day_start(day):
+    """JST日付の 0:00（aware）"""
+    return timezone.make_aware(datetime.combine(day, time.min))
+
+
+def local_date_range_q(start_date=None, end_date=None) -> Q:
+    """
+    local_date の範囲（両端を含む）の条件
+
+    同じ範囲の timestamp の条件も付ける（RANGE COLUMNS(timestamp) のパーティションを刈り込むため）
+    """
+    condition = Q()
+    if start_date is not None:
+        condition &= Q(local_date__gte=start_date, timestamp__gte=local_day_start(start_date))
+    if end_date is not None:
+        condition &= Q(local_date__lte=end_date, timestamp__lt=local_day_start(end_date + timedelta(days=1)))
+    return condition
 
 
 class MeterReading(models.Model):
@@ -9,14 +41,18 @@ class MeterReading(models.Model):
         ('interval', '30分値'),
     ]
 
-    meter = models.ForeignKey(Meter, on_delete=models.CASCADE, related_name='readings', verbose_name='メーター')
+    # 月次パーティション化（app/readings/partitions.py）のため外部キー制約は張らない
+    meter = models.ForeignKey(Meter, on_delete=models.CASCADE, related_name='readings', db_constraint=False, verbose_name='メーター')
     timestamp = models.DateTimeField(verbose_name='計測日時')
+    # timestamp__date は DATE(CONVERT_TZ(...)) になりインデックスが効かないため、JST日付を非正規化して持つ
+    local_date = models.DateField(null=True, blank=True, db_index=True, verbose_name='計測日')
     reading_type = models.CharField(max_length=10, choices=READING_TYPE_CHOICES, default='interval', verbose_name='種別')
     import_kwh = models.DecimalField(max_digits=12, decimal_places=2, null=True, blank=True, verbose_name='発電量累計(kWh)')
     export_kwh = models.DecimalField(max_digits=12, decimal_places=2, null=True, blank=True, verbose_name='逆潮流累計(kWh)')
     route_b_import_kwh = models.DecimalField(max_digits=12, decimal_places=2, null=True, blank=True, verbose_name='買電累計(kWh)')
     route_b_export_kwh = models.DecimalField(max_digits=12, decimal_places=2, null=True, blank=True, verbose_name='売電累計(kWh)')
     raw_data = models.TextField(blank=True, default='', verbose_name='生データ(HEX)')
+    raw_payload = models.BinaryField(null=True, blank=True, verbose_name='生データ')
     received_at = models.DateTimeField(auto_now_add=True, verbose_name='受信日時')
     created_at = models.DateTimeField(auto_now_add=True)
 
@@ -24,19 +60,38 @@ class MeterReading(models.Model):
         db_table = 'meter_readings'
         verbose_name = '30分データ'
         verbose_name_plural = '30分データ'
+        constraints = [
+            models.UniqueConstraint(
+                fields=['meter', 'timestamp', 'reading_type'],
+                name='uniq_meter_reading_timestamp_type',
+            ),
+        ]
+        indexes = [
+            models.Index(fields=['meter', 'local_date', 'timestamp'], name='idx_reading_meter_local_date'),
+        ]
 
     def __str__(self):
         return f'{self.meter.meter_id} - {self.timestamp}'
 
+    def save(self, *args, **kwargs):
+        self.local_date = local_date_of(self.timestamp)
+        super().save(*args, **kwargs)
+
+    @property
+    def raw_hex(self):
+        return to_hex(self.raw_payload, self.raw_data)
+
 
 class MeterEvent(models.Model):
-    meter = models.ForeignKey(Meter, on_delete=models.CASCADE, related_name='events', verbose_name='メーター')
+    meter = models.ForeignKey(Meter, on_delete=models.CASCADE, related_name='events', db_constraint=False, verbose_name='メーター')
     timestamp = models.DateTimeField(verbose_name='発生日時')
+    local_date = models.DateField(null=True, blank=True, db_index=True, verbose_name='発生日')
     record_no = models.IntegerField(verbose_name='レコード番号')
     event_code = models.CharField(max_length=10, verbose_name='イベントコード')
     event_description = models.CharField(max_length=100, blank=True, default='', verbose_name='イベント説明')
     import_kwh = models.DecimalField(max_digits=12, decimal_places=2, null=True, blank=True, verbose_name='発電量(kWh)')
     raw_data = models.TextField(blank=True, default='', verbose_name='生データ(HEX)')
+    raw_payload = models.BinaryField(null=True, blank=True, verbose_name='生データ')
     received_at = models.DateTimeField(auto_now_add=True, verbose_name='受信日時')
     created_at = models.DateTimeField(auto_now_add=True)
 
@@ -48,6 +103,14 @@ class MeterEvent(models.Model):
     def __str__(self):
         return f'{self.meter.meter_id} - {self.event_code} - {self.timestamp}'
 
+    def save(self, *args, **kwargs):
+        self.local_date = local_date_of(self.timestamp)
+        super().save(*args, **kwargs)
+
+    @property
+    def raw_hex(self):
+        return to_hex(self.raw_payload, self.raw_data)
+
 
 class DailySummary(models.Model):
     meter = models.ForeignKey(Meter, on_delete=models.CASCADE, related_name='daily_summaries', verbose_name='メーター')
@@ -57,6 +120,16 @@ class DailySummary(models.Model):
     self_consumption_kwh = models.DecimalField(max_digits=10, decimal_places=2, null=True, blank=True, verbose_name='自家消費量(kWh)')
     grid_import_kwh = models.DecimalField(max_digits=10, decimal_places=2, null=True, blank=True, verbose_name='買電量(kWh)')
     record_count = models.IntegerField(default=0, verbose_name='レコード数')
+    # 受信時の逐次集計用（当日の最初/最後の累積値）
+    first_reading_at = models.DateTimeField(null=True, blank=True, verbose_name='最初の計測日時')
+    last_reading_at = models.DateTimeField(null=True, blank=True, verbose_name='最後の計測日時')
+    first_import_kwh = models.DecimalField(max_digits=12, decimal_places=2, null=True, blank=True, verbose_name='最初の発電量累計(kWh)')
+    first_route_b_export_kwh = models.DecimalField(max_digits=12, decimal_places=2, null=True, blank=True, verbose_name='最初の売電累計(kWh)')
+    first_route_b_import_kwh = models.DecimalField(max_digits=12, decimal_places=2, null=True, blank=True, verbose_name='最初の買電累計(kWh)')
+    last_import_kwh = models.DecimalField(max_digits=12, decimal_places=2, null=True, blank=True, verbose_name='最後の発電量累計(kWh)')
+    last_route_b_export_kwh = models.DecimalField(max_digits=12, decimal_places=2, null=True, blank=True, verbose_name='最後の売電累計(kWh)')
+    last_route_b_import_kwh = models.DecimalField(max_digits=12, decimal_places=2, null=True, blank=True, verbose_name='最後の買電累計(kWh)')
+    is_dirty = models.BooleanField(default=False, verbose_name='再集計待ち')
     calculated_at = models.DateTimeField(auto_now=True, verbose_name='集計日時')
     created_at = models.DateTimeField(auto_now_add=True)
 
@@ -64,11 +137,51 @@ class DailySummary(models.Model):
         db_table = 'daily_summaries'
         verbose_name = '日次集計'
         verbose_name_plural = '日次集計'
+        constraints = [
+            models.UniqueConstraint(fields=['meter', 'date'], name='uniq_daily_summary_meter_date'),
+        ]
+        indexes = [
+            models.Index(fields=['is_dirty', 'date'], name='idx_daily_summary_dirty'),
+        ]
 
     def __str__(self):
         return f'{self.meter.meter_id} - {self.date}'
 
 
+class HourlySummary(models.Model):
+    """時間別集計（日次集計と同じパイプラインで更新、マイページの日表示用）"""
+
+    meter = models.ForeignKey(Meter, on_delete=models.CASCADE, related_name='hourly_summaries', verbose_name='メーター')
+    date = models.DateField(verbose_name='日付')
+    hour = models.DateTimeField(verbose_name='時間帯（開始日時）')
+    generation_kwh = models.DecimalField(max_digits=10, decimal_places=2, null=True, blank=True, verbose_name='発電量(kWh)')
+    export_kwh = models.DecimalField(max_digits=10, decimal_places=2, null=True, blank=True, verbose_name='売電量(kWh)')
+    self_consumption_kwh = models.DecimalField(max_digits=10, decimal_places=2, null=True, blank=True, verbose_name='自家消費量(kWh)')
+    grid_import_kwh = models.DecimalField(max_digits=10, decimal_places=2, null=True, blank=True, verbose_name='買電量(kWh)')
+    record_count = models.IntegerField(default=0, verbose_name='レコード数')
+    # 次の時間帯の差分計算用（時間帯内の最後の累積値）
+    last_reading_at = models.DateTimeField(null=True, blank=True, verbose_name='最後の計測日時')
+    last_import_kwh = models.DecimalField(max_digits=12, decimal_places=2, null=True, blank=True, verbose_name='最後の発電量累計(kWh)')
+    last_route_b_export_kwh = models.DecimalField(max_digits=12, decimal_places=2, null=True, blank=True, verbose_name='最後の売電累計(kWh)')
+    last_route_b_import_kwh = models.DecimalField(max_digits=12, decimal_places=2, null=True, blank=True, verbose_name='最後の買電累計(kWh)')
+    calculated_at = models.DateTimeField(auto_now=True, verbose_name='集計日時')
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        db_table = 'hourly_summaries'
+        verbose_name = '時間別集計'
+        verbose_name_plural = '時間別集計'
+        constraints = [
+            models.UniqueConstraint(fields=['meter', 'hour'], name='uniq_hourly_summary_meter_hour'),
+        ]
+        indexes = [
+            models.Index(fields=['meter', 'date'], name='idx_hourly_summary_meter_date'),
+        ]
+
+    def __str__(self):
+        return f'{self.meter.meter_id} - {self.hour}'
+
+
 class MonthlySummary(models.Model):
     meter = models.ForeignKey(Meter, on_delete=models.CASCADE, related_name='monthly_summaries', verbose_name='メーター')
     year_month = models.CharField(max_length=7, verbose_name='年月')
@@ -83,6 +196,37 @@ class MonthlySummary(models.Model):
         db_table = 'monthly_summaries'
         verbose_name = '月次集計'
         verbose_name_plural = '月次集計'
+        constraints = [
+            models.UniqueConstraint(fields=['meter', 'year_month'], name='uniq_monthly_summary_meter_month'),
+        ]
+
+    def __str__(self):
+        return f'{self.meter.meter_id} - {self.year_month}'
+
+
+class ReaggregationCheckpoint(models.Model):
+    """reaggregate_summaries コマンドの進捗（中断後の再開用）"""
+
+    STATUS_CHOICES = [
+        ('running', '実行中'),
+        ('completed', '完了'),
+    ]
+
+    key = models.CharField(max_length=255, unique=True, verbose_name='実行キー')
+    start_date = models.DateField(verbose_name='開始日')
+    end_date = models.DateField(verbose_name='終了日')
+    meters = models.TextField(blank=True, default='', verbose_name='対象メーター')
+    daily_completed_through = models.DateField(null=True, blank=True, verbose_name='日次集計完了日')
+    monthly_completed_through = models.CharField(max_length=7, blank=True, default='', verbose_name='月次集計完了年月')
+    rows_processed = models.BigIntegerField(default=0, verbose_name='処理件数')
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='running', verbose_name='状態')
+    started_at = models.DateTimeField(auto_now_add=True, verbose_name='開始日時')
+    updated_at = models.DateTimeField(auto_now=True, verbose_name='更新日時')
+
+    class Meta:
+        db_table = 'reaggregation_checkpoints'
+        verbose_name = '再集計の進捗'
+        verbose_name_plural = '再集計の進捗'
 
     def __str__(self):
-        return f'{self.meter.meter_id} - {self.year_month}'
\ No newline at end of file
+        return f'{self.key} ({self.status})'
@@ -0,0 +1,218 @@
+"""
+meter_readings / meter_events の月次パーティション管理（MySQLのみ）
+
+RANGE COLUMNS(timestamp) で月ごとにパーティションを分け、
+- 将来分のパーティションを先行して作成（pmax を REORGANIZE）
+- 保持期間を過ぎたパーティションをアーカイブテーブルへ切り離し（EXCHANGE）または削除（DROP）
+を行う。保持期間を過ぎたデータの削除は DELETE ではなくパーティション単位のメタデータ操作になる。
+
+パーティションの境界は TIME_ZONE（Asia/Tokyo）の月初をUTCに変換した値。
+MySQLの制約上、パーティション化するテーブルは
+- 主キーに timestamp を含める（id, timestamp）
+- 外部キー制約を持たない（MeterReading / MeterEvent の meter は db_constraint=False）
+必要がある。MySQL以外のDBでは何もしない。
+"""
+from datetime import datetime, timezone as dt_timezone
+from django.db import connection
+from django.utils import timezone
+import logging
+import re
+
+logger = logging.getLogger(__name__)
+
+PARTITIONED_TABLES = {
+    'meter_readings': 'timestamp',
+    'meter_events': 'timestamp',
+}
+
+MAX_PARTITION = 'pmax'
+PARTITION_NAME_RE = re.compile(r'^p(\d{4})(\d{2})$')
+
+
+def is_supported() -> bool:
+    return connection.vendor == 'mysql'
+
+
+def add_months(year: int, month: int, months: int) -> tuple:
+    index = year * 12 + (month - 1) + months
+    return index // 12, index % 12 + 1
+
+
+def partition_name(year: int, month: int) -> str:
+    return f'p{year:04d}{month:02d}'
+
+
+def month_upper_bound(year: int, month: int) -> str:
+    """pYYYYMM の上限（翌月1日 0:00 JST をUTCで表した値）"""
+    next_year, next_month = add_months(year, month, 1)
+    local = timezone.make_aware(datetime(next_year, next_month, 1))
+    return local.astimezone(dt_timezone.utc).strftime('%Y-%m-%d %H:%M:%S')
+
+
+def partition_definition(year: int, month: int) -> str:
+    return f"PARTITION {partition_name(year, month)} VALUES LESS THAN ('{month_upper_bound(year, month)}')"
+
+
+def current_month() -> tuple:
+    now = timezone.localtime()
+    return now.year, now.month
+
+
+def get_partitions(table: str) -> list:
+    """[(パーティション名, 年, 月)]（月次パーティションのみ、古い順）"""
+    with connection.cursor() as cursor:
+        cursor.execute(
+            """
+            SELECT PARTITION_NAME FROM information_schema.PARTITIONS
+            WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s AND PARTITION_NAME IS NOT NULL
+            ORDER BY PARTITION_ORDINAL_POSITION
+            """,
+            [table],
+        )
+        names = [row[0] for row in cursor.fetchall()]
+
+    partitions = []
+    for name in names:
+        match = PARTITION_NAME_RE.match(name)
+        if match:
+            partitions.append((name, int(match.group(1)), int(match.group(2))))
+    return partitions
+
+
+def is_partitioned(table: str) -> bool:
+    with connection.cursor() as cursor:
+        cursor.execute(
+            """
+            SELECT COUNT(*) FROM information_schema.PARTITIONS
+            WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s AND PARTITION_NAME IS NOT NULL
+            """,
+            [table],
+        )
+        return cursor.fetchone()[0] > 0
+
+
+def execute(sql: str, dry_run=False):
+    logger.info(f'Partition DDL: {sql}')
+    if not dry_run:
+        with connection.cursor() as cursor:
+            cursor.execute(sql)
+
+
+def setup_table(table: str, months_ahead=3, dry_run=False) -> list:
+    """
+    既存テーブルを月次パーティション化する（初回のみ、テーブル全体の再構築が走る）
+
+    最古データの月から months_ahead ヶ月先までのパーティションと pmax を作成する。
+    """
+    column = PARTITIONED_TABLES[table]
+    if is_partitioned(table):
+        return []
+
+    with connection.cursor() as cursor:
+        cursor.execute(f'SELECT MIN(`{column}`) FROM `{table}`')
+        oldest = cursor.fetchone()[0]
+
+    end_year, end_month = add_months(*current_month(), months_ahead)
+    if oldest:
+        oldest = timezone.localtime(timezone.make_aware(oldest, dt_timezone.utc) if timezone.is_naive(oldest) else oldest)
+        year, month = oldest.year, oldest.month
+    else:
+        year, month = current_month()
+
+    definitions = []
+    while (year, month) <= (end_year, end_month):
+        definitions.append(partition_definition(year, month))
+        year, month = add_months(year, month, 1)
+    definitions.append(f'PARTITION {MAX_PARTITION} VALUES LESS THAN (MAXVALUE)')
+
+    statements = [
+        f'ALTER TABLE `{table}` DROP PRIMARY KEY, ADD PRIMARY KEY (`id`, `{column}`)',
+        f'ALTER TABLE `{table}` PARTITION BY RANGE COLUMNS(`{column}`) ({", ".join(definitions)})',
+    ]
+    for sql in statements:
+        execute(sql, dry_run)
+    return statements
+
+
+def ensure_future_partitions(table: str, months_ahead=3, dry_run=False) -> list:
+    """months_ahead ヶ月先までのパーティションを pmax から切り出して作成"""
+    partitions = get_partitions(table)
+    if not partitions:
+        return []
+
+    _, year, month = partitions[-1]
+    end_year, end_month = add_months(*current_month(), months_ahead)
+
+    definitions = []
+    year, month = add_months(year, month, 1)
+    while (year, month) <= (end_year, end_month):
+        definitions.append(partition_definition(year, month))
+        year, month = add_months(year, month, 1)
+
+    if not definitions:
+        return []
+
+    definitions.append(f'PARTITION {MAX_PARTITION} VALUES LESS THAN (MAXVALUE)')
+    sql = f'ALTER TABLE `{table}` REORGANIZE PARTITION {MAX_PARTITION} INTO ({", ".join(definitions)})'
+    execute(sql, dry_run)
+    return [sql]
+
+
+def expired_partitions(table: str, retention_months: int) -> list:
+    """保持期間（当月を含めて retention_months ヶ月）を過ぎたパーティション"""
+    cutoff = add_months(*current_month(), -(retention_months - 1))
+    return [name for name, year, month in get_partitions(table) if (year, month) < cutoff]
+
+
+def archive_table_name(table: str, name: str) -> str:
+    return f'{table}_archive_{name[1:]}'
+
+
+def retire_partitions(table: str, retention_months: int, mode='archive', dry_run=False) -> list:
+    """
+    保持期間を過ぎたパーティションを処理
+
+    archive: 同じ構造のアーカイブテーブル（{table}_archive_YYYYMM）へ EXCHANGE してから空のパーティションを DROP
+    drop: パーティションごと DROP（データは削除される）
+    """
+    if retention_months <= 0:
+        return []
+
+    statements = []
+    for name in expired_partitions(table, retention_months):
+        if mode == 'archive':
+            archive = archive_table_name(table, name)
+            statements += [
+                f'CREATE TABLE `{archive}` LIKE `{table}`',
+                f'ALTER TABLE `{archive}` REMOVE PARTITIONING',
+                f'ALTER TABLE `{table}` EXCHANGE PARTITION {name} WITH TABLE `{archive}`',
+            ]
+        statements.append(f'ALTER TABLE `{table}` DROP PARTITION {name}')
+
+    for sql in statements:
+        execute(sql, dry_run)
+    return statements
+
+
+def rotate(months_ahead=3, retention_months=0, mode='archive', tables=None, dry_run=False) -> dict:
+    """
+    将来パーティション作成と期限切れパーティションの処理
+
+    Returns:
+        {テーブル名: 実行したDDLのリスト}
+    """
+    if not is_supported():
+        logger.info(f'Partition rotation skipped: {connection.vendor} is not supported')
+        return {}
+
+    result = {}
+    for table in tables or PARTITIONED_TABLES:
+        if not is_partitioned(table):
+            logger.warning(f'{table} is not partitioned, run manage_partitions --setup first')
+            result[table] = []
+            continue
+        result[table] = (
+            ensure_future_partitions(table, months_ahead, dry_run)
+            + retire_partitions(table, retention_months, mode, dry_run)
+        )
+    return result
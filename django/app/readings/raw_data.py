@@ -0,0 +1,89 @@
+"""
+受信電文（復号済み平文）の保存形式
+
+RAW_DATA_STORAGE:
+- 'binary': raw_payload（BinaryField）に保存し、raw_data は空にする
+- 'hex': 従来どおり raw_data（TextField）に大文字HEXで保存
+
+raw_payload の先頭1バイトは圧縮方式（CODEC_*）、以降が本体。
+RAW_DATA_COMPRESSION で 'none' / 'zlib' / 'zstd' を選択する
+（zstd は zstandard パッケージが必要）。
+電文は数十バイトのため、圧縮は長い電文が多い場合のみ効果がある。
+"""
+from django.conf import settings
+import zlib
+
+CODEC_NONE = 0
+CODEC_ZLIB = 1
+CODEC_ZSTD = 2
+
+CODECS = {
+    'none': CODEC_NONE,
+    'zlib': CODEC_ZLIB,
+    'zstd': CODEC_ZSTD,
+}
+
+
+def _zstd():
+    try:
+        import zstandard
+    except ImportError:
+        raise RuntimeError('zstd圧縮には zstandard パッケージが必要です')
+    return zstandard
+
+
+def get_storage() -> str:
+    return getattr(settings, 'RAW_DATA_STORAGE', 'binary')
+
+
+def get_compression() -> str:
+    return getattr(settings, 'RAW_DATA_COMPRESSION', 'none')
+
+
+def encode_payload(data, compression=None) -> bytes:
+    """平文（HEX文字列またはbytes）を raw_payload 形式に変換"""
+    if isinstance(data, str):
+        data = bytes.fromhex(data)
+    compression = compression or get_compression()
+    codec = CODECS.get(compression)
+
+    if codec == CODEC_NONE:
+        body = bytes(data)
+    elif codec == CODEC_ZLIB:
+        body = zlib.compress(data)
+    elif codec == CODEC_ZSTD:
+        body = _zstd().ZstdCompressor().compress(data)
+    else:
+        raise ValueError(f'Unknown raw data compression: {compression}')
+
+    return bytes([codec]) + body
+
+
+def decode_payload(value) -> bytes:
+    """raw_payload から平文bytesを取り出す"""
+    if not value:
+        return b''
+    value = bytes(value)
+    codec, body = value[0], value[1:]
+
+    if codec == CODEC_NONE:
+        return body
+    if codec == CODEC_ZLIB:
+        return zlib.decompress(body)
+    if codec == CODEC_ZSTD:
+        return _zstd().ZstdDecompressor().decompress(body)
+    raise ValueError(f'Unknown raw data codec: {codec}')
+
+
+def raw_fields(decrypted_hex: str) -> dict:
+    """モデル保存用のフィールド値（raw_data / raw_payload）"""
+    if get_storage() == 'hex':
+        return {'raw_data': decrypted_hex, 'raw_payload': None}
+    return {'raw_data': '', 'raw_payload': encode_payload(decrypted_hex)}
+
+
+def to_hex(raw_payload, raw_data='') -> str:
+    """表示用の大文字HEX（raw_payload がなければ raw_data）"""
+    if raw_payload:
+        return decode_payload(raw_payload).hex().upper()
+    return raw_data or ''
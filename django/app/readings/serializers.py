@@ -15,6 +15,13 @@ class MeterReadingSerializer(serializers.ModelSerializer):
         ]
 
 
+class MeterReadingDetailSerializer(MeterReadingSerializer):
+    raw_hex = serializers.CharField(read_only=True)
+
+    class Meta(MeterReadingSerializer.Meta):
+        fields = MeterReadingSerializer.Meta.fields + ['raw_hex']
+
+
 class MeterEventSerializer(serializers.ModelSerializer):
     meter_id = serializers.CharField(source='meter.meter_id', read_only=True)
 
@@ -27,6 +34,13 @@ class MeterEventSerializer(serializers.ModelSerializer):
         ]
 
 
+class MeterEventDetailSerializer(MeterEventSerializer):
+    raw_hex = serializers.CharField(read_only=True)
+
+    class Meta(MeterEventSerializer.Meta):
+        fields = MeterEventSerializer.Meta.fields + ['raw_hex']
+
+
 class DailySummarySerializer(serializers.ModelSerializer):
     meter_id = serializers.CharField(source='meter.meter_id', read_only=True)
 
@@ -36,7 +50,7 @@ class DailySummarySerializer(serializers.ModelSerializer):
             'id', 'meter', 'meter_id', 'date',
             'generation_kwh', 'export_kwh', 'self_consumption_kwh',
             'grid_import_kwh',
-            'record_count', 'calculated_at'
+            'record_count', 'is_dirty', 'calculated_at'
         ]
 
 
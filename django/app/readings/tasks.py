@@ -1,104 +1,86 @@
 # django/app/readings/tasks.py
-from celery import shared_task
-from django.db.models import Sum
+from celery import chord, group, shared_task
+from django.conf import settings
+from django.db import DatabaseError
 from django.utils import timezone
 from datetime import timedelta, date
-from decimal import Decimal
 import logging
 
-from .models import MeterReading, DailySummary, MonthlySummary
-from app.meters.models import Meter
+from .aggregation import (
+    aggregate_daily_summaries,
+    aggregate_dirty_summaries,
+    aggregate_monthly_summaries,
+    monthly_meter_ids,
+)
+from app.meters.chunks import id_ranges, meter_id_ranges
 
 logger = logging.getLogger(__name__)
 
 
+# チャンクのリトライ（DB接続断・ロック待ちタイムアウトなど一時的なエラーを想定）
+CHUNK_RETRY_OPTIONS = {
+    'autoretry_for': (DatabaseError,),
+    'retry_backoff': True,
+    'max_retries': 3,
+}
+
+
+def get_chunk_size():
+    return getattr(settings, 'AGGREGATION_CHUNK_SIZE', 1000)
+
+
 @shared_task
 def aggregate_daily(target_date=None):
     """
-    日次集計（毎日AM1:00実行）
-    MeterReadingは累積値なので、差分で当日の増分を計算
+    日次集計（対象日の全メーターを再集計、毎日AM1:00に前日分を実行）
+    受信時の逐次更新（update_running_summaries）の結果を確定させる
+    MeterReadingは累積値なので、差分で当日の増分を計算（app/readings/aggregation.py）
+
+    メーターをIDの範囲で AGGREGATION_CHUNK_SIZE 台ずつに分け、chord で並列実行する。
+    結果は merge_aggregation_counts が {'count', 'date'} にまとめる。
     """
     if target_date is None:
-        target_date = (timezone.now() - timedelta(days=1)).date()
+        target_date = timezone.localdate() - timedelta(days=1)
     elif isinstance(target_date, str):
         target_date = date.fromisoformat(target_date)
 
-    logger.info(f'Daily aggregation started for {target_date}')
-
-    # 対象日にデータがあるメーターのみ処理
-    meter_ids = MeterReading.objects.filter(
-        timestamp__date=target_date
-    ).values_list('meter_id', flat=True).distinct()
-
-    meters = Meter.objects.filter(id__in=meter_ids, is_deleted=False)
-    count = 0
-
-    for meter in meters:
-        if _aggregate_daily_for_meter(meter, target_date):
-            count += 1
-
-    logger.info(f'Daily aggregation completed: {count} meters')
-    return {'count': count, 'date': str(target_date)}
-
-
-def _aggregate_daily_for_meter(meter, target_date):
-    """メーター単位の日次集計"""
-    # 当日の最後のレコード
-    last_reading = MeterReading.objects.filter(
-        meter=meter,
-        timestamp__date=target_date
-    ).order_by('-timestamp').first()
-
-    if not last_reading:
-        return False
-
-    # 前日の最後のレコード（差分計算用）
-    prev_reading = MeterReading.objects.filter(
-        meter=meter,
-        timestamp__date__lt=target_date
-    ).order_by('-timestamp').first()
-
-    # 当日のレコード数
-    record_count = MeterReading.objects.filter(
-        meter=meter,
-        timestamp__date=target_date
-    ).count()
-
-    # 差分計算（累積値から増分を算出）
-    def delta(curr, prev, field):
-        curr_val = getattr(curr, field) if curr else None
-        prev_val = getattr(prev, field) if prev else None
-        if curr_val is None:
-            return None
-        if prev_val is None:
-            return curr_val  # 初回は累積値そのまま
-        d = curr_val - prev_val
-        return max(d, Decimal('0'))
-
-    generation_kwh = delta(last_reading, prev_reading, 'import_kwh')
-    export_kwh = delta(last_reading, prev_reading, 'route_b_export_kwh')
-    grid_import_kwh = delta(last_reading, prev_reading, 'route_b_import_kwh')
-
-    # 自家消費量 = 発電量 - 売電量
-    self_consumption_kwh = None
-    if generation_kwh is not None:
-        if export_kwh is not None:
-            self_consumption_kwh = max(generation_kwh - export_kwh, Decimal('0'))
-        else:
-            self_consumption_kwh = generation_kwh
-
-    DailySummary.objects.update_or_create(
-        meter=meter,
-        date=target_date,
-        defaults={
-            'generation_kwh': generation_kwh,
-            'export_kwh': export_kwh,
-            'self_consumption_kwh': self_consumption_kwh,
-            'grid_import_kwh': grid_import_kwh,
-            'record_count': record_count,
-        }
-    )
-    return True
+    ranges = meter_id_ranges(get_chunk_size())
+    logger.info(f'Daily aggregation started for {target_date}: {len(ranges)} chunks')
+    if not ranges:
+        return {'count': 0, 'date': str(target_date)}
+
+    header = group(aggregate_daily_chunk.s(str(target_date), start_id, end_id) for start_id, end_id in ranges)
+    result = chord(header)(merge_aggregation_counts.s(key='date', value=str(target_date)))
+    return {'date': str(target_date), 'chunks': len(ranges), 'callback_id': result.id}
+
+
+@shared_task(**CHUNK_RETRY_OPTIONS)
+def aggregate_daily_chunk(target_date, start_id, end_id):
+    """
+    日次集計のチャンク（メーターID start_id〜end_id）。失敗時はこのチャンクのみリトライ
+    受信処理の逐次更新と競合しないよう、チャンクのメーターをロックして集計する
+    """
+    count = aggregate_daily_summaries(date.fromisoformat(target_date), id_range=(start_id, end_id), lock=True)
+    logger.info(f'Daily aggregation chunk {start_id}-{end_id} for {target_date}: {count} meters')
+    return count
+
+
+@shared_task
+def merge_aggregation_counts(counts, key, value):
+    """chord のコールバック（チャンクごとの件数を合算）"""
+    count = sum(counts)
+    logger.info(f'Aggregation completed for {value}: {count} meters ({len(counts)} chunks)')
+    return {'count': count, key: value}
+
+
+@shared_task
+def aggregate_dirty_daily():
+    """
+    再集計待ちの日次集計を処理（5分ごとに実行）
+    当日分は受信時に逐次更新されるため、前日の集計がない日や遅れて届いたデータのある日のみ再集計
+    """
+    count = aggregate_dirty_summaries(limit=getattr(settings, 'DAILY_SUMMARY_DIRTY_LIMIT', 5000))
+    return {'count': count}
 
 
 @shared_task
@@ -106,45 +88,47 @@ def aggregate_monthly(target_year_month=None):
     """
     月次集計（毎月1日AM2:00実行）
     DailySummaryを合算
+
+    日次集計と同様にメーターIDの範囲で chord に分割して並列実行する。
+    範囲は当月の日次集計・月次集計があるメーターから作る（削除済みメーターの月次集計も削除対象に含めるため）。
+    結果は merge_aggregation_counts が {'count', 'year_month'} にまとめる。
     """
     if target_year_month is None:
-        last_month = timezone.now().replace(day=1) - timedelta(days=1)
+        last_month = timezone.localdate().replace(day=1) - timedelta(days=1)
         target_year_month = last_month.strftime('%Y-%m')
 
-    year, month = map(int, target_year_month.split('-'))
-    logger.info(f'Monthly aggregation started for {target_year_month}')
-
-    meter_ids = DailySummary.objects.filter(
-        date__year=year,
-        date__month=month
-    ).values_list('meter_id', flat=True).distinct()
-
-    meters = Meter.objects.filter(id__in=meter_ids, is_deleted=False)
-    count = 0
-
-    for meter in meters:
-        result = DailySummary.objects.filter(
-            meter=meter,
-            date__year=year,
-            date__month=month
-        ).aggregate(
-            generation=Sum('generation_kwh'),
-            export=Sum('export_kwh'),
-            self_consumption=Sum('self_consumption_kwh'),
-            grid_import=Sum('grid_import_kwh'),
-        )
-
-        MonthlySummary.objects.update_or_create(
-            meter=meter,
-            year_month=target_year_month,
-            defaults={
-                'generation_kwh': result['generation'],
-                'export_kwh': result['export'],
-                'self_consumption_kwh': result['self_consumption'],
-                'grid_import_kwh': result['grid_import'],
-            }
-        )
-        count += 1
-
-    logger.info(f'Monthly aggregation completed: {count} meters')
-    return {'count': count, 'year_month': target_year_month}
\ No newline at end of file
+    ranges = id_ranges(monthly_meter_ids(target_year_month), get_chunk_size())
+    logger.info(f'Monthly aggregation started for {target_year_month}: {len(ranges)} chunks')
+    if not ranges:
+        return {'count': 0, 'year_month': target_year_month}
+
+    header = group(aggregate_monthly_chunk.s(target_year_month, start_id, end_id) for start_id, end_id in ranges)
+    result = chord(header)(merge_aggregation_counts.s(key='year_month', value=target_year_month))
+    return {'year_month': target_year_month, 'chunks': len(ranges), 'callback_id': result.id}
+
+
+@shared_task(**CHUNK_RETRY_OPTIONS)
+def aggregate_monthly_chunk(target_year_month, start_id, end_id):
+    """月次集計のチャンク（メーターID start_id〜end_id）。失敗時はこのチャンクのみリトライ"""
+    count = aggregate_monthly_summaries(target_year_month, id_range=(start_id, end_id))
+    logger.info(f'Monthly aggregation chunk {start_id}-{end_id} for {target_year_month}: {count} meters')
+    return count
+
+
+@shared_task
+def rotate_partitions():
+    """
+    月次パーティションのローテーション（毎月25日AM3:00実行、MySQLのみ）
+    将来分のパーティション作成と、保持期間を過ぎたパーティションの切り離し
+    """
+    from . import partitions
+
+    result = partitions.rotate(
+        months_ahead=getattr(settings, 'READINGS_PARTITION_MONTHS_AHEAD', 3),
+        retention_months=getattr(settings, 'READINGS_RETENTION_MONTHS', 0),
+        mode=getattr(settings, 'READINGS_RETENTION_MODE', 'archive'),
+    )
+    statements = sum(len(v) for v in result.values())
+    logger.info(f'Partition rotation completed: {statements} statements')
+    return {'statements': statements, 'tables': list(result)}
+
@@ -12,6 +12,7 @@ from .views import (
     MonthlySummaryDetailView,
     MonthlySummaryExportView,
     DailySummaryChartView,
+    HourlySummaryChartView,
     MonthlySummaryChartView,
 )
 
@@ -37,5 +38,6 @@ urlpatterns = [
 
     # グラフ用追加
     path('daily/chart/', DailySummaryChartView.as_view()),
+    path('hourly/chart/', HourlySummaryChartView.as_view()),
     path('monthly/chart/', MonthlySummaryChartView.as_view()),
 ]
\ No newline at end of file
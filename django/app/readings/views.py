@@ -3,17 +3,30 @@ from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework import status
 from rest_framework.permissions import IsAuthenticated
+from rest_framework.exceptions import ValidationError
+from django.db.models import Sum
 from django.http import HttpResponse
 from django.utils import timezone
-from datetime import timedelta
+from datetime import date, timedelta
 import csv
-from .models import MeterReading, MeterEvent, DailySummary, MonthlySummary
+from .models import MeterReading, MeterEvent, DailySummary, HourlySummary, MonthlySummary, local_date_range_q
 from .serializers import (
-    MeterReadingSerializer, MeterEventSerializer,
+    MeterReadingSerializer, MeterReadingDetailSerializer,
+    MeterEventSerializer, MeterEventDetailSerializer,
     DailySummarySerializer, MonthlySummarySerializer
 )
 
 
+def date_range_q(request):
+    """start_date / end_date（YYYY-MM-DD）の絞り込み条件"""
+    try:
+        start_date = date.fromisoformat(request.GET['start_date']) if request.GET.get('start_date') else None
+        end_date = date.fromisoformat(request.GET['end_date']) if request.GET.get('end_date') else None
+    except ValueError:
+        raise ValidationError({'error': 'start_date / end_date must be YYYY-MM-DD'})
+    return local_date_range_q(start_date, end_date)
+
+
 class PaginationMixin:
     def paginate(self, queryset, request):
         page = int(request.GET.get('page', 1))
@@ -37,14 +50,11 @@ class ReadingListView(APIView, PaginationMixin):
     permission_classes = [IsAuthenticated]
 
     def get(self, request):
-        readings = MeterReading.objects.select_related('meter').order_by('-timestamp')
+        readings = MeterReading.objects.select_related('meter').defer('raw_data', 'raw_payload').order_by('-timestamp')
         
         if request.GET.get('meter_id'):
             readings = readings.filter(meter_id=request.GET['meter_id'])
-        if request.GET.get('start_date'):
-            readings = readings.filter(timestamp__date__gte=request.GET['start_date'])
-        if request.GET.get('end_date'):
-            readings = readings.filter(timestamp__date__lte=request.GET['end_date'])
+        readings = readings.filter(date_range_q(request))
         if request.GET.get('reading_type'):
             readings = readings.filter(reading_type=request.GET['reading_type'])
         
@@ -63,21 +73,18 @@ class ReadingDetailView(APIView):
             reading = MeterReading.objects.get(pk=pk)
         except MeterReading.DoesNotExist:
             return Response({'error': 'not found'}, status=status.HTTP_404_NOT_FOUND)
-        return Response(MeterReadingSerializer(reading).data)
+        return Response(MeterReadingDetailSerializer(reading).data)
 
 
 class ReadingExportView(APIView):
     permission_classes = [IsAuthenticated]
 
     def get(self, request):
-        readings = MeterReading.objects.select_related('meter').order_by('-timestamp')
+        readings = MeterReading.objects.select_related('meter').defer('raw_data', 'raw_payload').order_by('-timestamp')
         
         if request.GET.get('meter_id'):
             readings = readings.filter(meter_id=request.GET['meter_id'])
-        if request.GET.get('start_date'):
-            readings = readings.filter(timestamp__date__gte=request.GET['start_date'])
-        if request.GET.get('end_date'):
-            readings = readings.filter(timestamp__date__lte=request.GET['end_date'])
+        readings = readings.filter(date_range_q(request))
         
         readings = readings[:10000]
         
@@ -106,16 +113,13 @@ class EventListView(APIView, PaginationMixin):
     permission_classes = [IsAuthenticated]
 
     def get(self, request):
-        events = MeterEvent.objects.select_related('meter').order_by('-timestamp')
+        events = MeterEvent.objects.select_related('meter').defer('raw_data', 'raw_payload').order_by('-timestamp')
         
         if request.GET.get('meter_id'):
             events = events.filter(meter_id=request.GET['meter_id'])
         if request.GET.get('event_code'):
             events = events.filter(event_code=request.GET['event_code'])
-        if request.GET.get('start_date'):
-            events = events.filter(timestamp__date__gte=request.GET['start_date'])
-        if request.GET.get('end_date'):
-            events = events.filter(timestamp__date__lte=request.GET['end_date'])
+        events = events.filter(date_range_q(request))
         
         result = self.paginate(events, request)
         return Response({
@@ -132,7 +136,7 @@ class EventDetailView(APIView):
             event = MeterEvent.objects.get(pk=pk)
         except MeterEvent.DoesNotExist:
             return Response({'error': 'not found'}, status=status.HTTP_404_NOT_FOUND)
-        return Response(MeterEventSerializer(event).data)
+        return Response(MeterEventDetailSerializer(event).data)
 
 
 class DailySummaryListView(APIView, PaginationMixin):
@@ -271,7 +275,6 @@ class DailySummaryChartView(APIView):
             queryset = queryset.filter(meter_id=meter_id)
         else:
             # メーター指定なしの場合は日別に集計
-            from django.db.models import Sum
             queryset = DailySummary.objects.filter(
                 date__gte=start_date,
                 date__lte=end_date
@@ -293,6 +296,38 @@ class DailySummaryChartView(APIView):
         return Response({'items': data})
 
 
+class HourlySummaryChartView(APIView):
+    """時間別集計グラフ用（指定日の24時間）"""
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request):
+        meter_id = request.GET.get('meter_id')
+        try:
+            target_date = date.fromisoformat(request.GET['date']) if request.GET.get('date') else timezone.localdate()
+        except ValueError:
+            return Response({'error': 'date must be YYYY-MM-DD'}, status=status.HTTP_400_BAD_REQUEST)
+
+        queryset = HourlySummary.objects.filter(date=target_date)
+
+        if meter_id:
+            queryset = queryset.filter(meter_id=meter_id).values(
+                'hour', 'generation_kwh', 'export_kwh',
+                'self_consumption_kwh', 'grid_import_kwh'
+            )
+        else:
+            # メーター指定なしの場合は時間帯別に集計
+            queryset = queryset.values('hour').annotate(
+                generation_kwh=Sum('generation_kwh'),
+                export_kwh=Sum('export_kwh'),
+                self_consumption_kwh=Sum('self_consumption_kwh'),
+                grid_import_kwh=Sum('grid_import_kwh')
+            )
+
+        data = list(queryset.order_by('hour'))
+
+        return Response({'items': data})
+
+
 class MonthlySummaryChartView(APIView):
     """月次集計グラフ用（直近N月）"""
     permission_classes = [IsAuthenticated]
@@ -312,7 +347,6 @@ class MonthlySummaryChartView(APIView):
             ))
         else:
             # メーター指定なしの場合は月別に集計
-            from django.db.models import Sum
             queryset = MonthlySummary.objects.values('year_month').annotate(
                 generation_kwh=Sum('generation_kwh'),
                 export_kwh=Sum('export_kwh'),